@@ -0,0 +1,248 @@
+"""
+読み取り専用のローカル JSON API（標準ライブラリのみ）
+─────────────────────────────────────
+他のツールが ratios.json やシャードを直接読む代わりに、1つの常駐プロセスを共有して引けるようにする。
+
+  python api_server.py [--host 127.0.0.1] [--port 8765]
+
+  GET /candidates?view=data|all_data        … 候補一覧（candidates.json があればその並び順。card_html は含めない）
+  GET /ticker/{code}/history                … 銘柄の OHLCV {dates, O, H, L, C, V}（?days=N で直近 N 本）
+  GET /ticker/{code}/features               … 候補レコード・info と、履歴から計算した出来高倍率・年初来位置など
+  GET /healthz                              … 公開中の世代
+
+・ETag は公開中の世代ID。If-None-Match が一致すれば 304（新しい世代が公開されるまで本文を送り直さない）
+・Accept-Encoding: gzip なら gzip で返す
+・シャードは history_store.ShardCache、組み立てた応答本文は LRU（API_CACHE_ENTRIES 件）で使い回す
+"""
+
+from __future__ import annotations
+import argparse
+import gzip
+import os
+import re
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import candidate_view as cv
+import history_store as hs
+import jsonio
+import ratios_store as rs
+import snapshot_store as ss
+
+API_HOST = os.environ.get("API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("API_PORT", "8765"))
+API_CACHE_ENTRIES = int(os.environ.get("API_CACHE_ENTRIES", "512"))
+GZIP_MIN_BYTES = 1024
+
+_TICKER_ROUTE = re.compile(r"^/ticker/([0-9A-Za-z]{4})(?:\.T)?/(history|features)/?$")
+
+_shards = hs.ShardCache(max_shards=128)
+_ratios_lock = threading.Lock()
+_ratios: dict = {}  # {generation: ratios（v1）}。公開中の世代の1件だけ持つ
+
+
+class NotFound(Exception):
+    pass
+
+
+def _load_ratios(generation: str | None) -> dict:
+    with _ratios_lock:
+        if generation not in _ratios:
+            _ratios.clear()
+            _ratios[generation] = rs.load_ratios(rs.ratios_path(generation))
+        return _ratios[generation]
+
+
+# ==========================================
+# 応答本文の組み立て
+# ==========================================
+def candidates_payload(generation: str | None, view: str) -> dict:
+    if view not in cv.BUNDLE_VIEWS:
+        raise NotFound(f"unknown view: {view}")
+    bundle = cv.load_bundle(ss.path(cv.BUNDLE_JSON, generation)) if generation else {}
+    if bundle:
+        v = (bundle.get("views") or {}).get(view) or {"counts": cv.level_counts({}), "entries": []}
+        items = [{"ticker": e["ticker"], "watch": e["watch"], **e["item"]} for e in v["entries"]]
+        return {"generation": generation, "updated_at": bundle.get("updated_at"), "view": view,
+                "counts": v["counts"], "candidates": items}
+    # candidates.json がない古い世代は ratios.json から並べ替える
+    ratios = _load_ratios(generation)
+    normalized = {tk: cv.normalize_item(it) for tk, it in (ratios.get(view) or {}).items()}
+    items = [{"ticker": tk, "watch": cv.is_watch(d), **d} for tk, d in sorted(normalized.items(), key=cv.sort_key)]
+    return {"generation": generation, "updated_at": ratios.get("updated_at"), "view": view,
+            "counts": cv.level_counts(normalized), "candidates": items}
+
+
+def history_payload(generation: str | None, ticker: str, days: int | None = None) -> dict:
+    row = _shards.row(ticker, generation)
+    if row is None:
+        raise NotFound(f"no history: {ticker}")
+    out = {"ticker": ticker, "generation": generation}
+    for key in ("dates", "O", "H", "L", "C", "V"):
+        values = row.get(key) or []
+        out[key] = values[-days:] if days else values
+    return out
+
+
+def _history_features(hist) -> dict:
+    """app.py の診断と同じ定義の、乱数を含まない指標だけ"""
+    close, volume = hist["Close"], hist["Volume"]
+    current_price = float(close.iloc[-1])
+    current_vol = float(volume.iloc[-1])
+    avg_vol_100 = float(volume[-100:].mean() if len(hist) >= 100 else volume.mean())
+    past_1y = hist[-250:]
+    year_high, year_low = float(past_1y["High"].max()), float(past_1y["Low"].min())
+    position_score = (current_price - year_low) / (year_high - year_low) if year_high != year_low else 0.5
+    max_spike = close.pct_change(periods=60).max() if len(hist) >= 60 else None
+    return {
+        "last_date": hist.index[-1].strftime("%Y-%m-%d"),
+        "bars": len(hist),
+        "close": current_price,
+        "volume": current_vol,
+        "avg_vol_100": avg_vol_100,
+        "vol_ratio": current_vol / avg_vol_100 if avg_vol_100 > 0 else 0,
+        "year_high": year_high,
+        "year_low": year_low,
+        "position_score": position_score,
+        "recent_20_low": float(hist["Low"][-20:].min()),
+        "has_dna": bool(max_spike is not None and max_spike >= 0.8),
+    }
+
+
+def features_payload(generation: str | None, ticker: str) -> dict:
+    ratios = _load_ratios(generation)
+    candidate = (ratios.get("all_data") or {}).get(ticker) or (ratios.get("data") or {}).get(ticker)
+    row = _shards.row(ticker, generation)
+    hist = hs.frame_from_row(row)
+    if candidate is None and hist is None:
+        raise NotFound(f"unknown ticker: {ticker}")
+    return {
+        "ticker": ticker,
+        "generation": generation,
+        "in_candidates": ticker in (ratios.get("data") or {}),
+        "candidate": cv.normalize_item(candidate) if candidate else None,
+        "info": (row or {}).get("info") or {},
+        "history": _history_features(hist) if hist is not None and len(hist) else None,
+    }
+
+
+# ==========================================
+# 応答のキャッシュ（本文と gzip 済み本文）
+# ==========================================
+class ResponseCache:
+    def __init__(self, max_entries: int = API_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, build) -> dict:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        body = jsonio.dumps(build())
+        entry = {"body": body, "gzip": gzip.compress(body, 6) if len(body) >= GZIP_MIN_BYTES else None}
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+
+_responses = ResponseCache()
+
+
+def route(path: str, query: dict, generation: str | None):
+    """(キャッシュキー, 本文を作る関数) を返す"""
+    if path in ("/candidates", "/candidates/"):
+        view = (query.get("view") or ["data"])[0]
+        return ("candidates", view), lambda: candidates_payload(generation, view)
+    m = _TICKER_ROUTE.match(path)
+    if m:
+        ticker = f"{m.group(1).upper()}.T"
+        if m.group(2) == "history":
+            days_s = (query.get("days") or [""])[0]
+            days = int(days_s) if days_s.isdigit() and int(days_s) > 0 else None
+            return ("history", ticker, days), lambda: history_payload(generation, ticker, days)
+        return ("features", ticker), lambda: features_payload(generation, ticker)
+    raise NotFound(path)
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "HagetakaScopeAPI/1.0"
+
+    def _send(self, status: int, body: bytes = b"", etag: str | None = None, gzipped: bool = False) -> None:
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if status != 304:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            if gzipped:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304 and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _error(self, status: int, message: str) -> None:
+        self._send(status, jsonio.dumps({"error": message}))
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        generation = ss.current_generation()
+        etag = f'W/"{generation or "flat"}"'
+
+        if url.path == "/healthz":
+            self._send(200, jsonio.dumps({"generation": generation, "updated_at": ss.read_meta(generation).get("updated_at")}))
+            return
+        try:
+            key, build = route(url.path, parse_qs(url.query), generation)
+        except NotFound:
+            self._error(404, "not found")
+            return
+
+        inm = self.headers.get("If-None-Match", "")
+        if etag in [t.strip() for t in inm.split(",")] or inm.strip() == "*":
+            self._send(304, etag=etag)
+            return
+        try:
+            entry = _responses.get((generation,) + key, build)
+        except NotFound as e:
+            self._error(404, str(e))
+            return
+        except Exception as e:
+            self._error(500, f"{type(e).__name__}: {e}")
+            return
+
+        wants_gzip = "gzip" in (self.headers.get("Accept-Encoding") or "")
+        if wants_gzip and entry["gzip"] is not None:
+            self._send(200, entry["gzip"], etag=etag, gzipped=True)
+        else:
+            self._send(200, entry["body"], etag=etag)
+
+    do_HEAD = do_GET
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="読み取り専用のローカル JSON API")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"🌐 http://{args.host}:{args.port}/ （世代: {ss.current_generation() or '-'}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -18,44 +18,67 @@ HAGETAKA SCOPE - M&A候補検知ツール
 - 【追加修正】エラー（データ取得失敗）時にキャッシュさせない仕様に変更
 - 【追加修正】データ取得エラー時のメッセージに「アクセス集中」の旨を追記
 - 【究極防壁】ブラウザ偽装のランダム化と人間らしいヘッダー付与で長期間ブロックを極限回避
+- 【高速化】重いライブラリ・通信は使うタブで初めて読み込み、ログイン画面をすぐ表示
 """
 
-import hashlib
-import json
+from __future__ import annotations
+import time
+
+# 起動時間の計測（lazy_import.report）。Streamlit の再実行ごとにここから測る
+_RUN_STARTED = time.perf_counter()
+
 import re
-import ast
 import smtplib
 import io
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import random
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
 import unicodedata
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from typing import Dict, List, Optional
-from pathlib import Path
 import streamlit as st
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # 古い Streamlit
+    from streamlit.runtime.scriptrunner.script_run_context import add_script_run_ctx, get_script_run_ctx
 from datetime import datetime
 import pytz
 import base64
-import pandas as pd
-import numpy as np
-import yfinance as yf
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 
-# Google Sheets連携
-from streamlit_gsheets import GSheetsConnection
-import gspread
-from google.oauth2.service_account import Credentials
+# 重いライブラリは最初に使うときに import する（ログイン画面はどれも使わない）
+from lazy_import import LazyModule
+import lazy_import as lz
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
+yf = LazyModule("yfinance")
+go = LazyModule("plotly.graph_objects")
+plotly_subplots = LazyModule("plotly.subplots")
 
-# 暗号化
-from cryptography.fernet import Fernet
+# Google Sheets連携（通知設定を呼び出す・保存するときだけ）
+gsheets = LazyModule("streamlit_gsheets")
+gspread = LazyModule("gspread")
+service_account = LazyModule("google.oauth2.service_account")
 
-# KABU+ データ取得
-import kabuplus_client as kp
+# 暗号化
+fernet = LazyModule("cryptography.fernet")
+
+# KABU+ データ取得（pandas を読み込むものは診断で使うときに）
+ist = LazyModule("indicator_store")
+isn = LazyModule("info_snapshot")
+hs = LazyModule("history_store")
+kp = LazyModule("kabuplus_client")
+import candidate_view as cv
+import diagnosis_cache as dc
+import name_resolver as nr
+import provider_chain as pc
+import ratios_store as rs
+import snapshot_store as ss
+
+lz.mark("先頭の import", _RUN_STARTED)
 
 # ==========================================
 # 定数
@@ -64,12 +87,23 @@ JST = pytz.timezone("Asia/Tokyo")
 MARKET_CAP_MIN = 300
 MARKET_CAP_MAX = 2000
 
-FLOW_SCORE_HIGH = 70
-FLOW_SCORE_MEDIUM = 40
-
-LEVEL_COLORS = {4: "#C41E3A", 3: "#FF9800", 2: "#FFC107", 1: "#5C6BC0", 0: "#9E9E9E"}
+# 需給スコアの閾値・LEVEL の色はカード部品（candidate_view）と共通
+FLOW_SCORE_HIGH = cv.FLOW_SCORE_HIGH
+FLOW_SCORE_MEDIUM = cv.FLOW_SCORE_MEDIUM
+LEVEL_COLORS = cv.LEVEL_COLORS
 
 MASTER_PASSWORD = "88888"
+# ハゲタカ診断: 同時に診断する銘柄数と、全体の待ち時間の上限（秒）
+DIAGNOSIS_WORKERS = 5
+DIAGNOSIS_DEADLINE_SEC = 60.0
+# キャッシュにない銘柄の OHLCV: 次の提供元を並走させるまでの秒数と、1銘柄あたりの上限（秒）
+OHLCV_HEDGE_AFTER_SEC = 4.0
+OHLCV_TOTAL_TIMEOUT_SEC = 40.0
+# 診断のディスクキャッシュ（diagnosis_cache.py）の有効期限（秒）。世代が変われば期限前でも使わない
+DISK_CACHE_DIAGNOSIS_TTL_SEC = 6 * 3600
+DISK_CACHE_OHLCV_TTL_SEC = 6 * 3600
+# どの提供元にもデータがなかった銘柄は、この秒数のあいだ取得し直さずに「取得できませんでした」と返す
+DIAGNOSIS_FAILURE_TTL_SEC = 600
 DISCLAIMER_TEXT = "本ツールは市場データの可視化を目的とした補助ツールです。<br>銘柄推奨・売買助言ではありません。最終判断は利用者ご自身で行ってください。"
 
 # ==========================================
@@ -101,14 +135,33 @@ def get_yf_session():
     })
     return session
 
-yf_session = get_yf_session()
+
+@st.cache_resource(show_spinner=False)
+def get_shared_yf_session():
+    """銘柄名の補完（Yahoo!ファイナンス）で使い回すセッション。最初に使うときに作る"""
+    return get_yf_session()
 
 # ==========================================
 # 【KABU+ 一括データ】診断用の銘柄情報キャッシュ
 # ==========================================
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _load_info_snapshot(generation: str | None):
+    """日次ジョブが世代ごとに書いた銘柄 info（info_snapshot.py）を mmap で開く。なければ None"""
+    return isn.load_snapshot(ss.path(isn.INFO_DIR, generation))
+
+
 @st.cache_data(ttl=900, show_spinner=False)
-def _load_kabuplus_info() -> dict:
-    """KABU+ から全銘柄の指標データを一括取得し info 辞書を構築"""
+def _load_kabuplus_info_fallback() -> dict:
+    """
+    世代に info スナップショットがないとき（古い世代・KABU+ が取れなかった日）の代わり。
+    保存済みの指標スナップショット（data/indicators/）があればそれを使い、なければ KABU+ から取得。
+    """
+    try:
+        latest = ist.read_slice()
+        if not latest.empty:
+            return kp.build_info_lookup(latest)
+    except Exception:
+        pass
     try:
         uid, pwd = kp.get_credentials()
         if not uid or not pwd:
@@ -122,8 +175,11 @@ def _load_kabuplus_info() -> dict:
 
 
 def _get_kabuplus_info(ticker: str) -> dict:
-    """特定銘柄の KABU+ info を取得（キャッシュ済みルックアップ）"""
-    return _load_kabuplus_info().get(ticker, {})
+    """特定銘柄の KABU+ info を取得（公開中の世代の info スナップショット → 指標スナップショット / KABU+ の順）"""
+    snap = _load_info_snapshot(ss.current_generation())
+    if snap is not None:
+        return snap.get(ticker)
+    return _load_kabuplus_info_fallback().get(ticker, {})
 
 # ==========================================
 # カート操作のコールバック関数（即時反映用）
@@ -210,67 +266,7 @@ h1{ text-align:center !important; font-size: 1.55rem !important; font-weight: 80
 }
 .stTabs [data-baseweb="tab"][aria-selected="true"] p { color: #FFFFFF !important; opacity: 1.0; }
 
-/* =======================================
-   Cards (スマホベース＆テーマ対応)
-   ======================================= */
-.spike-card{
-  position: relative; 
-  background-color: var(--secondary-background-color) !important; 
-  border-radius: 16px; padding: 1rem; margin-bottom: .75rem; 
-  border: 1px solid rgba(128,128,128,0.2) !important;
-  box-shadow: 0 10px 30px rgba(0,0,0,0.05);
-}
-.spike-card::before{
-  content:""; position:absolute; left:0; top:10px; bottom:10px; width:4px;
-  border-radius: 999px; background: rgba(128,128,128,0.3);
-}
-.spike-card.high{ border-color: rgba(196,30,58,0.4) !important; box-shadow: 0 10px 30px rgba(196,30,58,0.15); }
-.spike-card.high::before{ background: linear-gradient(180deg, #C41E3A 0%, #E63946 100%); }
-.spike-card.medium{ border-color: rgba(255,152,0,0.4) !important; box-shadow: 0 10px 30px rgba(255,152,0,0.15); }
-.spike-card.medium::before{ background: linear-gradient(180deg, #FF9800 0%, #FFC107 100%); }
-
-.card-header{ display:flex; justify-content:space-between; align-items:center; gap:.7rem; margin-bottom: .55rem; }
-.ticker-name a{ font-weight: 800; color: var(--text-color) !important; text-decoration:none; font-size: 1.1rem; }
-.ticker-name a:hover{ text-decoration: underline; }
-.ticker-jp-name { font-size: 0.75rem; color: var(--text-color); opacity: 0.6; margin-left: 6px; }
-
-.ratio-badge{
-  min-width: 70px; text-align:center; padding: .2rem .6rem; border-radius: 8px; font-weight: 800;
-  border: 1px solid rgba(128,128,128,0.2); background-color: var(--background-color); cursor: help;
-}
-.ratio-badge.high{ color:#FFFFFF !important; border-color: rgba(196,30,58,0.4); background: linear-gradient(135deg, #C41E3A 0%, #E63946 100%); }
-.ratio-badge.medium{ color: var(--text-color) !important; border-color: rgba(255,152,0,0.4); background: rgba(255,152,0,0.15); }
-.score-val{ font-size: 1.0rem; line-height: 1.0; }
-.score-label{ font-size: 0.55rem; line-height: 1.0; display: block; margin-bottom: 2px; opacity: 0.8;}
-
-.level-badge { padding: 3px 10px; border-radius: 12px; font-size: 0.75rem; font-weight: 700; color: white !important; }
-
-.card-body{ display:grid; grid-template-columns: repeat(4, 1fr); gap: .8rem; margin-top: .2rem; }
-.info-label{ font-size: .72rem; color: var(--text-color); opacity: 0.7; font-weight: 700; letter-spacing: .02em; }
-.info-value{ font-size: .93rem; color: var(--text-color); font-weight: 700; }
-.price-val { color: #ff4b4b !important; font-weight: 800; }
-
-.tag-container { padding: 0 0.8rem 0.5rem; font-size: 0.7rem; }
-.tag-watch { background: rgba(92,107,192,0.15); color: #5C6BC0 !important; padding: 2px 8px; border-radius: 999px; margin-right: 6px; font-weight: 700; display: inline-block; margin-bottom: 4px; }
-.tag-normal { background: var(--background-color); color: var(--text-color); border: 1px solid rgba(128,128,128,0.3); padding: 2px 8px; border-radius: 999px; margin-right: 6px; display: inline-block; margin-bottom: 4px; }
-
-/* 💻 PC版の銘柄カード最適化 */
-@media (min-width: 768px) {
-    .spike-card { padding: 1.5rem 2.0rem 0.5rem !important; margin-bottom: 1.0rem !important; }
-    .ticker-name a { font-size: 1.6rem !important; }
-    .ticker-jp-name { font-size: 1.1rem !important; margin-left: 12px !important; }
-    .card-body { display: flex !important; gap: 5rem !important; margin-top: 1.0rem !important; }
-    .info-label { font-size: 0.9rem !important; }
-    .info-value { font-size: 1.3rem !important; }
-    .price-val { font-size: 1.4rem !important; }
-    .level-badge { font-size: 1.0rem !important; padding: 5px 14px !important; }
-    .score-label { font-size: 0.75rem !important; }
-    .score-val { font-size: 1.4rem !important; }
-    .ratio-badge { padding: 0.4rem 1.0rem !important; }
-    .tag-container { padding: 1.0rem 0 0.5rem !important; }
-    .tag-watch, .tag-normal { font-size: 0.85rem !important; padding: 4px 12px !important; margin-right: 8px !important; }
-}
-
+""" + cv.CARD_CSS + """
 /* =======================================
    🌟 ハゲタカ診断 個別カード化スタイル (多重枠線バグ修正版)
    ======================================= */
@@ -346,57 +342,13 @@ div.stButton > button[data-testid="baseButton-primary"] {
 # ==========================================
 # 表記ゆれ吸収・共通ヘルパー
 # ==========================================
-STATE_HELP = {
-    "要監視": "変化が強めです。優先して確認します。",
-    "観測中": "変化の兆しがあります。数日単位で見守ります。",
-    "沈静": "今は大きな変化が見えません。記録だけ残します。",
-}
-
-def _norm_label(s) -> str:
-    if s is None: return ""
-    t = str(s).strip()
-    return re.sub(r'^[\s○●◎◯・\-–—★☆▶▷→⇒✓✔✅☑︎【\[\(（]+', '', t).strip()
-
-def _norm_tag(t) -> str:
-    t = _norm_label(t)
-    if not t: return ""
-    if "要監視" in t: return "要監視"
-    return t
-
-def _tags_list(x) -> List[str]:
-    if x is None: return []
-    if isinstance(x, list): return [str(v) for v in x]
-    return [str(x)]
-
-def _normalize_item(it: Dict) -> Dict:
-    d = dict(it) if isinstance(it, dict) else {}
-    raw_state = d.get("display_state", d.get("state", ""))
-    tags_raw = _tags_list(d.get("tags"))
-    tags_norm = []
-    has_watch = ("要監視" in _norm_label(raw_state))
-    for tg in tags_raw:
-        nt = _norm_tag(tg)
-        if not nt: continue
-        if nt == "要監視": has_watch = True; continue
-        if nt in ["下側ゾーン", "上側ゾーン"]: continue
-        tags_norm.append(nt)
-    state = "要監視" if has_watch else (_norm_label(raw_state) or "観測中")
-    d["display_state"] = state
-    uniq = []
-    seen = set()
-    for t in tags_norm:
-        if t not in seen:
-            seen.add(t)
-            uniq.append(t)
-    d["tags"] = uniq
-    return d
-
-def _is_watch(item: dict) -> bool:
-    state = _norm_label(item.get("display_state", item.get("state", "")))
-    if "要監視" in state: return True
-    for tg in _tags_list(item.get("tags")):
-        if "要監視" in _norm_label(tg): return True
-    return False
+# 表記ゆれ吸収はカード部品（candidate_view）と共通（日次ジョブの静的バンドルと同じ結果にするため）
+STATE_HELP = cv.STATE_HELP
+_norm_label = cv.norm_label
+_norm_tag = cv.norm_tag
+_tags_list = cv.tags_list
+_normalize_item = cv.normalize_item
+_is_watch = cv.is_watch
 
 def get_logo_base64():
     try:
@@ -404,34 +356,49 @@ def get_logo_base64():
             return base64.b64encode(f.read()).decode()
     except: return None
 
-@st.cache_data(ttl=900)
 def load_data() -> Dict:
+    """公開中の世代の ratios.json を読む（新しい世代が公開されたら TTL を待たずに読み直す）"""
+    return _load_data(ss.current_generation())
+
+@st.cache_data(ttl=900)
+def _load_data(generation: str | None) -> Dict:
     """ratios.json を読む。名前はバッチ済みデータ＋辞書のみで解決し、Yahoo へは繋がない（全銘柄時の重さ対策）。"""
-    p = Path("data/ratios.json")
-    if not p.exists():
+    data = rs.load_ratios(rs.ratios_path(generation))
+    if not data:
         return {}
 
-    with open(p, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
+    # 日次ジョブが解決済みの display_name をそのまま使う。持っていないレコード（古い世代）だけ解決する
+    # v2 ではレコードが data / all_data で共有されているので、同じレコードを2回解決しない
+    seen = set()
     for bucket in ("data", "all_data"):
         bucket_data = data.get(bucket, {}) or {}
         if isinstance(bucket_data, dict):
             for ticker, item in bucket_data.items():
-                if isinstance(item, dict):
-                    item["name"] = get_display_japanese_name(
+                if isinstance(item, dict) and id(item) not in seen:
+                    seen.add(id(item))
+                    item["name"] = item.get("display_name") or get_display_japanese_name(
                         ticker, item.get("name"), allow_yahoo_fallback=False
                     )
 
     return data
 
-def get_fernet() -> Fernet: return Fernet(st.secrets["encryption"]["key"].encode())
+def load_candidate_bundle() -> Dict:
+    """公開中の世代の candidates.json（日次ジョブが正規化・並べ替え・カード HTML まで済ませたもの）"""
+    return _load_candidate_bundle(ss.current_generation())
+
+@st.cache_data(ttl=900, show_spinner=False)
+def _load_candidate_bundle(generation: str | None) -> Dict:
+    if not generation:
+        return {}
+    return cv.load_bundle(ss.path(cv.BUNDLE_JSON, generation))
+
+def get_fernet() -> fernet.Fernet: return fernet.Fernet(st.secrets["encryption"]["key"].encode())
 def encrypt_password(pw: str) -> str: return get_fernet().encrypt(pw.encode()).decode() if pw else ""
 def decrypt_password(pw: str) -> str: 
     try: return get_fernet().decrypt(pw.encode()).decode() if pw else ""
     except: return ""
 
-def get_gsheets_connection(): return st.connection("gsheets", type=GSheetsConnection)
+def get_gsheets_connection(): return st.connection("gsheets", type=gsheets.GSheetsConnection)
 
 def load_settings_by_email(email: str) -> Optional[Dict]:
     if not email: return None
@@ -450,7 +417,7 @@ def get_gspread_client():
     try:
         cd = dict(st.secrets["connections"]["gsheets"])
         cd.pop("spreadsheet", None); cd.pop("worksheet", None)
-        creds = Credentials.from_service_account_info(cd, scopes=["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"])
+        creds = service_account.Credentials.from_service_account_info(cd, scopes=["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"])
         return gspread.authorize(creds)
     except: return None
 
@@ -565,44 +532,16 @@ def get_jpx_data():
 
 @st.cache_data(ttl=86400)
 def load_local_ticker_name_master():
-    """fetch_data.py の固定辞書を安全に読み込んで表示側でも使う"""
+    """data/ticker_name_master.json（fetch_data.py と同じ名前マスター）を表示側でも使う"""
     try:
-        fetch_data_path = Path(__file__).resolve().parent / "fetch_data.py"
-        src = fetch_data_path.read_text(encoding="utf-8")
-        tree = ast.parse(src)
-
-        for node in tree.body:
-            if isinstance(node, ast.Assign):
-                for target in node.targets:
-                    if isinstance(target, ast.Name) and target.id == "TICKER_NAMES":
-                        value = ast.literal_eval(node.value)
-                        if isinstance(value, dict):
-                            return {str(k).strip(): str(v).strip() for k, v in value.items()}
-        return {}
+        return dict(nr.master_names())
     except Exception:
         return {}
 
 
-jpx_names, jpx_codes = get_jpx_data()
 LOCAL_TICKER_MASTER = load_local_ticker_name_master()
 
-TICKER_NAMES_JP = {
-    "3923.T": "ラクス", "4443.T": "Sansan", "4478.T": "フリー", "3994.T": "マネーフォワード",
-    "4165.T": "プレイド", "4169.T": "ENECHANGE", "4449.T": "ギフティ", "4475.T": "HENNGE",
-    "4431.T": "スマレジ", "4057.T": "インターファクトリー", "3697.T": "SHIFT", "4194.T": "ビジョナル",
-    "4180.T": "Appier", "3655.T": "ブレインパッド", "4751.T": "サイバーエージェント",
-    "3681.T": "ブイキューブ", "6035.T": "IRジャパン", "4384.T": "ラクスル", "9558.T": "ジャパニアス",
-    "4441.T": "トビラシステムズ", "6315.T": "TOWA", "6323.T": "ローツェ", "6890.T": "フェローテック",
-    "7735.T": "SCREENホールディングス", "6146.T": "ディスコ", "6266.T": "タツモ",
-    "3132.T": "マクニカホールディングス", "6920.T": "レーザーテック", "4565.T": "そーせいグループ",
-    "4587.T": "ペプチドリーム", "4582.T": "シンバイオ製薬", "4583.T": "カイオム・バイオ",
-    "4563.T": "アンジェス", "2370.T": "メディネット", "4593.T": "ヘリオス", "3064.T": "MonotaRO",
-    "3092.T": "ZOZO", "3769.T": "GMOペイメント", "4385.T": "メルカリ", "7342.T": "ウェルスナビ",
-    "4480.T": "メドレー", "6560.T": "LTS", "3182.T": "オイシックス", "9166.T": "GENDA",
-    "3765.T": "ガンホー", "3659.T": "ネクソン", "3656.T": "KLab", "3932.T": "アカツキ",
-    "4071.T": "プラスアルファ", "4485.T": "JTOWER", "7095.T": "Macbee Planet",
-    "4054.T": "日本情報クリエイト", "6095.T": "メドピア", "4436.T": "ミンカブ", "4477.T": "BASE",
-}
+TICKER_NAMES_JP = nr.supplemental_names()
 
 
 def get_display_japanese_name(
@@ -613,40 +552,18 @@ def get_display_japanese_name(
     allow_yahoo_fallback: bool = True,
 ) -> str:
     """allow_yahoo_fallback=False のとき Yahoo!ファイナンス日本へアクセスしない（一覧・load_data 用で軽量化）"""
-    code_only = str(ticker or "").replace(".T", "").strip().upper()
-    ticker_key = f"{code_only}.T" if code_only else str(ticker or "").strip().upper()
-    fallback_name = (fallback_name or "").strip()
-    info = info or {}
-
-    allowed_brand_names = {
-        "SHIFT", "TOWA", "ZOZO", "HENNGE", "GENDA", "MonotaRO", "Appier",
-        "BASE", "JTOWER", "Sansan", "Macbee Planet", "KLab", "LTS", "PR TIMES",
-        "THECOO", "WACUL", "CRI・ミドルウェア", "eBASE", "NOK", "NTN", "THK",
-        "TPR", "IHI", "SUBARU", "KYB"
-    }
-
-    candidates = [
-        jpx_names.get(code_only),
-        LOCAL_TICKER_MASTER.get(ticker_key),
-        TICKER_NAMES_JP.get(ticker_key),
-        fallback_name,
-        info.get("shortName"),
-        info.get("longName"),
-    ]
-
-    for cand in candidates:
-        cand = (cand or "").strip()
-        if not cand:
-            continue
-        if re.search(r"[ぁ-んァ-ヶ一-龠々ー]", cand):
-            return cand
-        if cand in allowed_brand_names:
-            return cand
+    code_only = nr.code_of(ticker)
+    candidates = nr.display_candidates(
+        ticker, jpx_names=get_jpx_data()[0], master=LOCAL_TICKER_MASTER, fallback_name=fallback_name, info=info
+    )
+    name = nr.first_ready(candidates)
+    if name:
+        return name
 
     if allow_yahoo_fallback:
         try:
             url_yfjp = f"https://finance.yahoo.co.jp/quote/{code_only}.T"
-            res_yfjp = yf_session.get(url_yfjp, timeout=3)
+            res_yfjp = get_shared_yf_session().get(url_yfjp, timeout=3)
             match = re.search(r"<title>(.+?)(?:\(株\))?【", res_yfjp.text)
             if match:
                 title_name = match.group(1).strip()
@@ -655,12 +572,10 @@ def get_display_japanese_name(
         except Exception:
             pass
 
-    for cand in candidates:
-        cand = (cand or "").strip()
-        if cand:
-            return cand
+    return nr.first_nonempty(candidates) or code_only or str(ticker or "")
 
-    return code_only or str(ticker or "")
+# 銘柄コードの形式（7203 / 151A など。先頭は数字、残り3文字は数字か英大文字）
+TICKER_CODE_RE = re.compile(r"^[0-9][0-9A-Z]{3}$")
 
 # 🌟 全角半角・スペース・改行・大文字小文字をすべて吸収してコードを抽出する関数
 def normalize_input(input_text):
@@ -694,73 +609,36 @@ def format_market_cap(oku_val):
 
 # ==========================================
 # 案5: バッチ保存済みOHLCVキャッシュ（64シャード + レガシー1ファイル）
-# fetch_data.HISTORY_SHARD_COUNT と同一であること
+# 読み出しは history_store（api_server.py と共用）。ここでは Streamlit のキャッシュを被せるだけ
 # ==========================================
-HISTORY_SHARD_COUNT = 64
-
-
-def _history_shard_id(ticker: str) -> int:
-    return int(hashlib.md5(ticker.encode("utf-8")).hexdigest(), 16) % HISTORY_SHARD_COUNT
-
 
 @st.cache_data(ttl=3600, max_entries=128, show_spinner=False)
-def _load_history_shard(shard_id: int) -> dict:
-    p = Path(f"data/history/shard_{shard_id:02d}.json")
-    if not p.exists():
-        return {}
-    try:
-        with open(p, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+def _load_history_shard(shard_id: int, generation: str | None = None) -> dict:
+    """世代ごとにキャッシュする（generation は公開中の世代ID。キャッシュのキーを兼ねる）"""
+    return hs.read_shard(shard_id, generation)
 
 
 @st.cache_data(ttl=3600, show_spinner=False)
 def _load_stock_history_legacy_flat() -> dict:
     """後方互換: 単一の stock_history.json（updated_at 等を除く）"""
-    p = Path("data/stock_history.json")
-    if not p.exists():
-        return {}
-    try:
-        with open(p, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if not isinstance(data, dict):
-            return {}
-        for k in ("updated_at", "format"):
-            data.pop(k, None)
-        return data
-    except Exception:
-        return {}
+    return hs.read_legacy_flat()
 
 
 def load_ticker_history_row(ticker: str) -> dict | None:
     """診断用: 銘柄1件分のキャッシュ（シャード優先、無ければレガシー）"""
-    row = _load_history_shard(_history_shard_id(ticker)).get(ticker)
-    if row and row.get("dates"):
-        return row
-    legacy = _load_stock_history_legacy_flat().get(ticker)
-    if legacy and legacy.get("dates"):
-        return legacy
-    return None
-
-
-def _build_hist_from_cache(ticker: str, history_data: dict):
-    """stock_history.jsonのデータからpandas DataFrameを復元"""
-    data = history_data.get(ticker)
-    if not data or not data.get("dates"):
-        return None
-    try:
-        hist = pd.DataFrame({
-            "Open":   data["O"],
-            "High":   data["H"],
-            "Low":    data["L"],
-            "Close":  data["C"],
-            "Volume": data["V"],
-        }, index=pd.to_datetime(data["dates"]))
-        hist.index.name = "Date"
-        return hist
-    except Exception:
-        return None
+    generation = ss.current_generation()
+    return hs.lookup_row(ticker, lambda sid: _load_history_shard(sid, generation), _load_stock_history_legacy_flat)
+
+
+# OHLCV 提供元の約束（provider_chain の否定判定のため）:
+#   「その銘柄のデータがない」と答えたとき（404・空の結果）だけ None を返す。
+#   通信エラー・429 などの 200 以外・想定外の応答は例外にする（一時的な失敗を「データなし」と数えない）
+def _ok_or_none(resp) -> bool:
+    """200 なら True、404（銘柄なし）なら False。それ以外の状態は HTTPError を送出"""
+    if resp.status_code == 404:
+        return False
+    resp.raise_for_status()
+    return True
 
 
 def _fetch_stooq_hist_jp(ticker: str) -> pd.DataFrame | None:
@@ -770,15 +648,14 @@ def _fetch_stooq_hist_jp(ticker: str) -> pd.DataFrame | None:
         return None
     sym = f"{code.lower()}.jp"
     url = f"https://stooq.com/q/d/l/?s={sym}&i=d"
-    try:
-        r = requests.get(url, timeout=25)
-        r.raise_for_status()
-        raw = r.text.strip()
-        if not raw or raw.lower().startswith("no data"):
-            return None
-        df = pd.read_csv(io.StringIO(raw))
-    except Exception:
+    r = requests.get(url, timeout=25)
+    if not _ok_or_none(r):
         return None
+    raw = r.text.strip()
+    if not raw or raw.lower().startswith("no data"):
+        return None
+    # 制限超過などの案内文は CSV として読めない・列がない → 例外（データなしとは数えない）
+    df = pd.read_csv(io.StringIO(raw))
     if df is None or df.empty:
         return None
     colmap = {str(c).strip(): str(c).strip() for c in df.columns}
@@ -790,7 +667,7 @@ def _fetch_stooq_hist_jp(ticker: str) -> pd.DataFrame | None:
         col("date"), col("open"), col("high"), col("low"), col("close"), col("volume")
     )
     if not all([dcol, ocol, hcol, lcol, ccol]):
-        return None
+        raise ValueError(f"Stooq: 想定外の応答（{raw[:60]!r}）")
     vol_series = (
         pd.to_numeric(df[vcol], errors="coerce").fillna(0)
         if vcol
@@ -826,36 +703,33 @@ def _fetch_yahoo_chart_api(ticker: str) -> pd.DataFrame | None:
     params = {"range": "1y", "interval": "1d", "includePrePost": "false"}
     headers = {"User-Agent": random.choice(USER_AGENTS)}
 
-    try:
-        resp = requests.get(url, params=params, headers=headers, timeout=15)
-        if resp.status_code != 200:
-            return None
-        data = resp.json()
-        result = data.get("chart", {}).get("result", [])
-        if not result:
-            return None
+    resp = requests.get(url, params=params, headers=headers, timeout=15)
+    if not _ok_or_none(resp):
+        return None
+    data = resp.json()
+    result = (data.get("chart") or {}).get("result") or []
+    if not result:
+        return None
 
-        timestamps = result[0].get("timestamp", [])
-        quote = result[0].get("indicators", {}).get("quote", [{}])[0]
-        if not timestamps or not quote:
-            return None
+    timestamps = result[0].get("timestamp", [])
+    quote = result[0].get("indicators", {}).get("quote", [{}])[0]
+    if not timestamps or not quote:
+        return None
 
-        df = pd.DataFrame({
-            "Open": quote.get("open", []),
-            "High": quote.get("high", []),
-            "Low": quote.get("low", []),
-            "Close": quote.get("close", []),
-            "Volume": quote.get("volume", []),
-        }, index=pd.to_datetime(timestamps, unit="s", utc=True))
-        df.index = df.index.tz_convert("Asia/Tokyo").tz_localize(None)
-        df.index.name = "Date"
-        df = df.dropna(subset=["Close"])
-        if len(df) < 5:
-            return None
-        df["Volume"] = df["Volume"].fillna(0)
-        return df
-    except Exception:
+    df = pd.DataFrame({
+        "Open": quote.get("open", []),
+        "High": quote.get("high", []),
+        "Low": quote.get("low", []),
+        "Close": quote.get("close", []),
+        "Volume": quote.get("volume", []),
+    }, index=pd.to_datetime(timestamps, unit="s", utc=True))
+    df.index = df.index.tz_convert("Asia/Tokyo").tz_localize(None)
+    df.index.name = "Date"
+    df = df.dropna(subset=["Close"])
+    if len(df) < 5:
         return None
+    df["Volume"] = df["Volume"].fillna(0)
+    return df
 
 
 def _fetch_kabuoji3(ticker: str) -> pd.DataFrame | None:
@@ -869,11 +743,10 @@ def _fetch_kabuoji3(ticker: str) -> pd.DataFrame | None:
         return None
     url = f"https://kabuoji3.com/stock/{code}/"
     headers = {"User-Agent": random.choice(USER_AGENTS)}
+    resp = requests.get(url, headers=headers, timeout=15)
+    if not _ok_or_none(resp):
+        return None
     try:
-        resp = requests.get(url, headers=headers, timeout=15)
-        if resp.status_code != 200:
-            return None
-
         # テーブル行を正規表現で抽出: <tr><td>日付</td><td>始値</td>...
         rows = re.findall(r"<tr[^>]*>(.*?)</tr>", resp.text, re.DOTALL)
         records = []
@@ -906,75 +779,113 @@ def _fetch_kabuoji3(ticker: str) -> pd.DataFrame | None:
         return None
 
 
-def _fetch_yf_data_with_retry(ticker: str, max_retries: int = 2, base_delay: float = 3.0):
+@st.cache_resource(show_spinner=False)
+def get_yf_download_lock() -> threading.Lock:
+    """yf.download() とそのエラー記録（yf.shared._ERRORS）の読み出しを直列にするロック（プロセスで1つ）"""
+    return threading.Lock()
+
+
+def _fetch_yf_download(ticker: str) -> pd.DataFrame | None:
+    """yf.download() で一括取得（stock.history()より高速）。再試行は提供元チェーン側で他の提供元に切り替える"""
+    session = get_yf_session()
+    # yf.shared._ERRORS はモジュール共通で、yf.download() のたびに空にされる。
+    # 診断は並列に走るので、取得からエラーの読み出しまでを1つずつにしないと、他の銘柄の取得で消された
+    # レート制限のエラーを「データなし」と読み違えて負のキャッシュに入れてしまう
+    with get_yf_download_lock():
+        hist = yf.download(
+            tickers=[ticker], period="2y", interval="1d",
+            auto_adjust=True, progress=False, threads=False,
+            session=session,
+        )
+        error = "" if hist is not None and not hist.empty else str(
+            (getattr(getattr(yf, "shared", None), "_ERRORS", None) or {}).get(ticker) or ""
+        )
+    if hist is None or hist.empty:
+        # yfinance は失敗しても空の表を返すので、記録されたエラーで「銘柄なし」と一時的な失敗を分ける
+        if error and not re.search(r"delisted|no data|not found|no timezone", error, re.IGNORECASE):
+            raise RuntimeError(f"yfinance: {error}")
+        return None
+    # MultiIndex対策
+    if isinstance(hist.columns, pd.MultiIndex):
+        hist.columns = hist.columns.get_level_values(0)
+    hist = hist[["Open", "High", "Low", "Close", "Volume"]].dropna()
+    return hist if len(hist) >= 5 else None
+
+
+@st.cache_resource(show_spinner=False)
+def get_ohlcv_provider_chain() -> pc.ProviderChain:
+    """
+    OHLCV 提供元のチェーン（プロセスで1つ。再実行をまたいで成功率・応答時間・ブレーカーの状態を持ち続ける）
+    初期の順序: yf.download() → Yahoo Chart API直接 → Stooq（英字コード 151A 等に有効） → kabuoji3（日本株専用）
+    """
+    providers = [
+        ("yfinance", _fetch_yf_download),
+        ("yahoo_chart", _fetch_yahoo_chart_api),
+        ("stooq", _fetch_stooq_hist_jp),
+        ("kabuoji3", _fetch_kabuoji3),
+    ]
+    return pc.ProviderChain(
+        "ohlcv",
+        providers,
+        validate=lambda hist: hist is not None and len(hist) >= 5,
+        hedge_after=OHLCV_HEDGE_AFTER_SEC,
+        total_timeout=OHLCV_TOTAL_TIMEOUT_SEC,
+        # 同時に診断する銘柄がそれぞれ全提供元へヘッジしても、ワーカーの空き待ちにならない数
+        max_workers=DIAGNOSIS_WORKERS * len(providers),
+    )
+
+
+def _fetch_yf_data_with_retry(ticker: str):
     """
     OHLCV履歴のみを取得（高速化版）。
     ★ info は KABU+ から取得するため、ここでは取らない。
-    ★ 4段階フォールバック: yf.download() → Yahoo Chart API直接 → Stooq → kabuoji3
+    ★ 4つの提供元を健全性（成功率・応答時間）の順に試す。遅い提供元には次の提供元を並走させ、
+      失敗が続く提供元はしばらく呼ばない（provider_chain.py）
     """
-    last_error = None
+    return get_ohlcv_provider_chain().fetch(ticker)
 
-    # 1) yf.download() で一括取得（stock.history()より高速）
-    for attempt in range(max_retries):
-        try:
-            session = get_yf_session()
-            hist = yf.download(
-                tickers=[ticker], period="2y", interval="1d",
-                auto_adjust=True, progress=False, threads=False,
-                session=session,
-            )
-            if hist is not None and not hist.empty and len(hist) >= 5:
-                # MultiIndex対策
-                if isinstance(hist.columns, pd.MultiIndex):
-                    hist.columns = hist.columns.get_level_values(0)
-                hist = hist[["Open", "High", "Low", "Close", "Volume"]].dropna()
-                if len(hist) >= 5:
-                    return hist
-            raise ValueError("データが空または不十分です")
-        except Exception as e:
-            last_error = e
-            if attempt < max_retries - 1:
-                time.sleep(base_delay * (2 ** attempt))
-
-    # 2) Yahoo Finance Chart API 直接呼び出し（yfinanceライブラリを迂回）
-    hist_yc = _fetch_yahoo_chart_api(ticker)
-    if hist_yc is not None and len(hist_yc) >= 5:
-        return hist_yc
-
-    # 3) Stooq フォールバック（英字コード 151A 等に有効）
-    hist_sq = _fetch_stooq_hist_jp(ticker)
-    if hist_sq is not None and len(hist_sq) >= 5:
-        return hist_sq
-
-    # 4) kabuoji3 フォールバック（日本株専用・最終手段）
-    hist_kj = _fetch_kabuoji3(ticker)
-    if hist_kj is not None and len(hist_kj) >= 5:
-        return hist_kj
-
-    raise last_error if last_error else ValueError("データ取得に失敗しました")
+
+@st.cache_resource(show_spinner=False)
+def get_diagnosis_cache() -> dc.DiagnosisCache:
+    """プロセス・ワーカー間で共有する診断のディスクキャッシュ（st.cache_data の下の層）"""
+    return dc.DiagnosisCache()
+
+
+class InsufficientHistory(Exception):
+    """日足が診断に足りない（上場直後など。否定キャッシュの対象）"""
 
 
 # 🚨 【エラー回避＆キャッシュ対策】の内部関数（データ取得失敗時は例外を投げてキャッシュさせない）
 @st.cache_data(ttl=900, show_spinner=False)
-def _evaluate_stock_cached(ticker):
+def _evaluate_stock_cached(ticker, generation: str | None = None):
+    # ★ Step 0: 他のプロセス・再起動前に計算済みならそれを使う
+    disk = get_diagnosis_cache()
+    cached = disk.get("diagnosis", ticker, generation)
+    if cached is not None:
+        return cached
+
     # ★ Step 1: info は KABU+ から一括取得済みデータを優先使用
     info = _get_kabuplus_info(ticker)
 
     # ★ Step 2: OHLCV はバッチキャッシュ → yf.download() → Stooq の順
     row = load_ticker_history_row(ticker)
-    hist = _build_hist_from_cache(ticker, {ticker: row}) if row else None
+    hist = hs.frame_from_row(row)
 
     if hist is not None and len(hist) >= 5:
         # キャッシュヒット: KABU+ info がなければキャッシュの info を使う
         if not info:
             info = (row.get("info") or {}) if row else {}
     else:
-        # キャッシュミス: OHLCV のみ取得（info は KABU+ で済んでいる）
-        hist = _fetch_yf_data_with_retry(ticker)
-
-    # 取得失敗時は例外を出してキャッシュ化を回避する
+        # キャッシュミス: OHLCV のみ取得（info は KABU+ で済んでいる）。取得済みの日足はディスクから
+        hist = disk.get("ohlcv", ticker, generation)
+        if hist is None:
+            hist = _fetch_yf_data_with_retry(ticker)
+            if hist is not None and len(hist) >= 5:
+                disk.put("ohlcv", ticker, generation, hist, DISK_CACHE_OHLCV_TTL_SEC)
+
+    # 取得失敗時は例外を出してキャッシュ化を回避する（否定キャッシュは evaluate_stock 側）
     if hist is None or hist.empty or len(hist) < 5:
-        raise ValueError("Insufficient data or fetch limit")
+        raise InsufficientHistory(f"日足データが不足しています（{0 if hist is None else len(hist)}本）")
 
     current_price = hist['Close'].iloc[-1]
     current_vol = hist['Volume'].iloc[-1]
@@ -1189,7 +1100,7 @@ def _evaluate_stock_cached(ticker):
     if is_magma: icons_list.append("🦅")
     icons_str = " ".join(icons_list)
 
-    return {
+    result = {
         "コード": code_only, "銘柄名": jp_name, "現在値": int(current_price),
         "時価総額": market_cap_oku, "時価総額_表示": formatted_mcap, "dividend_text": dividend_text,
         "turnover_str": turnover_str, "ランク": base_rank, "警告": warning_text,
@@ -1199,13 +1110,39 @@ def _evaluate_stock_cached(ticker):
         "intervention_score": intervention_score, "intervention_comment": intervention_comment,
         "safe_judgment": safe_judgment, "safe_explain": safe_explain, "icons_str": icons_str
     }
+    disk.put("diagnosis", ticker, generation, result, DISK_CACHE_DIAGNOSIS_TTL_SEC)
+    return result
+
+# 🚨 【呼び出し元関数】エラー時は st.cache_data にはキャッシュせず、理由を返す
+def evaluate_stock(ticker, force: bool = False):
+    """
+    戻り値: (診断結果, 失敗情報)。失敗情報は {"reason", "checked_at", "cached"}（成功時は None）
+    どの提供元にもデータがなかった銘柄は DIAGNOSIS_FAILURE_TTL_SEC 秒のあいだ否定キャッシュに残し、
+    その間は提供元を呼ばずに失敗を返す（force=True なら否定キャッシュを消して取得し直す）。
+    時間切れ・通信エラーなど一時的な失敗は残さない。
+    """
+    generation = ss.current_generation()
+    disk = get_diagnosis_cache()
+    if force:
+        disk.delete("failure", ticker)
+    else:
+        failure = disk.get("failure", ticker, generation)
+        if failure is not None:
+            return None, {**failure, "cached": True}
 
-# 🚨 【呼び出し元関数】エラー時はキャッシュせずに例外を受け流す
-def evaluate_stock(ticker):
     try:
-        return _evaluate_stock_cached(ticker)
-    except Exception:
-        return None
+        return _evaluate_stock_cached(ticker, generation), None
+    except pc.ProviderChainError as e:
+        reason, remember = str(e), e.exhausted
+    except InsufficientHistory as e:
+        reason, remember = str(e), True
+    except Exception as e:
+        reason, remember = f"{type(e).__name__}: {e}", False
+
+    failure = {"reason": reason, "checked_at": time.time()}
+    if remember:
+        disk.put("failure", ticker, generation, failure, DIAGNOSIS_FAILURE_TTL_SEC)
+    return None, {**failure, "cached": False}
 
 def draw_chart(row, chart_key: str | None = None):
     hist_data = row['hist'].tail(150)
@@ -1219,7 +1156,7 @@ def draw_chart(row, chart_key: str | None = None):
     bin_centers = [b.mid for b in vol_profile.index]
     bin_volumes = vol_profile.values
     
-    fig = make_subplots(rows=1, cols=2, shared_yaxes=True, column_widths=[0.85, 0.15], horizontal_spacing=0)
+    fig = plotly_subplots.make_subplots(rows=1, cols=2, shared_yaxes=True, column_widths=[0.85, 0.15], horizontal_spacing=0)
     fig.add_trace(go.Candlestick(x=hist_data.index, open=hist_data['Open'], high=hist_data['High'], low=hist_data['Low'], close=hist_data['Close'], name="株価", showlegend=False), row=1, col=1)
     fig.add_trace(go.Bar(x=bin_volumes, y=bin_centers, orientation='h', marker_color='rgba(255, 165, 0, 0.6)', name="出来高ボリューム", showlegend=False, hoverinfo='y'), row=1, col=2)
     
@@ -1249,60 +1186,12 @@ def draw_chart(row, chart_key: str | None = None):
     else:
         st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
 
-def render_card(ticker: str, d: Dict):
-    flow_score = d.get("flow_score", 0)
-    level = int(d.get("level", 0))
-    state = d.get("display_state", d.get("state", "観測中"))
-    
-    _state_clean = _norm_label(state) or str(state).strip()
-    _tip = STATE_HELP.get(_state_clean, "状態の目安です。").replace('"', "&quot;")
-    state_html = f'<span title="{_tip}" style="color:#5C6BC0;font-weight:800;">{_state_clean}</span>' if _state_clean == "要監視" else f'<span title="{_tip}">{_state_clean}</span>'
-
-    tags = d.get("tags", [])
-    if flow_score >= FLOW_SCORE_HIGH: card_class, score_class = "high", "high"
-    elif flow_score >= FLOW_SCORE_MEDIUM: card_class, score_class = "medium", "medium"
-    else: card_class, score_class = "", "normal"
-
-    level_color = LEVEL_COLORS.get(level, "#9E9E9E")
-    
-    code_only = ticker.replace(".T", "")
-    url = f"https://finance.yahoo.co.jp/quote/{code_only}.T"
-    name_jp = get_display_japanese_name(ticker, d.get("name"), allow_yahoo_fallback=False)
-
-    tags_html = ""
-    for tag in tags[:4]:
-        if tag == "要監視":
-            tags_html += f'<span class="tag-watch">要監視</span>'
-        else:
-            tags_html += f'<span class="tag-normal">{tag}</span>'
-
-    score_text = f"{flow_score}"
-    level_text = f"LEVEL {level}" if level > 0 else "LEVEL -"
-
-    st.markdown(f"""
-    <div class="spike-card {card_class}">
-        <div class="card-header">
-            <div class="ticker-name">
-                <a href="{url}" target="_blank">{code_only}</a>
-                <span class="ticker-jp-name">{str(name_jp)[:12]}</span>
-            </div>
-            <div style="display:flex;align-items:center;gap:8px;">
-                <span class="level-badge" style="background:{level_color};">{level_text}</span>
-                <div class="ratio-badge {score_class}" title="※直近の出来高変化等を示す独自スコア">
-                    <span class="score-label">需給スコア</span>
-                    <span class="score-val">{score_text}</span>
-                </div>
-            </div>
-        </div>
-        <div class="card-body">
-            <div><span class="info-label">現在値</span><br><span class="info-value price-val">¥{d.get('price',0):,.0f}</span></div>
-            <div><span class="info-label">状態</span><br><span class="info-value">{state_html}</span></div>
-            <div><span class="info-label">時価総額</span><br><span class="info-value">{d.get('market_cap_oku',0):,}億円</span></div>
-            <div><span class="info-label">出来高</span><br><span class="info-value">{d.get('vol_ratio', 0)}x</span></div>
-        </div>
-        <div class="tag-container">{tags_html}</div>
-    </div>
-    """, unsafe_allow_html=True)
+def render_card(ticker: str, d: Dict, card_html: str | None = None):
+    """カード＋カートボタン。card_html（静的バンドルで組み立て済み）があればそのまま使う"""
+    if card_html is None:
+        # load_data で表示名は確定済み（name に入っている）
+        card_html = cv.card_html(ticker, d, d.get("display_name") or d.get("name"))
+    st.markdown(card_html, unsafe_allow_html=True)
 
     cart_list = st.session_state.get("cart", [])
     cart_len = len(cart_list)
@@ -1315,6 +1204,171 @@ def render_card(ticker: str, d: Dict):
         btn_text = "🛒 カートの上限に達しました (5/5)" if is_full else f"🛒 診断カートに入れる ({cart_len}/5)"
         st.button(btn_text, key=f"cart_add_{ticker}", use_container_width=True, disabled=is_full, type="primary", on_click=add_to_cart, args=(ticker,))
 
+def render_diagnosis(code: str, diag_data: dict):
+    """診断結果1銘柄分のカード"""
+    # 💡 診断結果をカードで囲んで区切りを明確に
+    with st.container():
+        st.markdown('<div class="diagnosis-card-marker" style="display:none;"></div>', unsafe_allow_html=True)
+
+        c1, c2 = st.columns([1, 2])
+        with c1:
+            st.markdown(f"<h2 style='margin-bottom: 0px;'>{diag_data['icons_str']} {diag_data['コード']} {diag_data['銘柄名']}</h2>", unsafe_allow_html=True)
+
+            base_rank = diag_data['ランク']
+            warning = diag_data['警告']
+            rank_color = "red" if base_rank == "S" else "orange" if base_rank == "A" else "#3B82F6"
+
+            if warning:
+                rank_html = f"<h3 style='color:{rank_color}; margin-top: 5px;'>総合判定: {base_rank} <span style='color:#ff4b4b; font-size:0.8em;'>{warning}</span></h3>"
+            else:
+                rank_html = f"<h3 style='color:{rank_color}; margin-top: 5px;'>総合判定: {base_rank}</h3>"
+
+            st.markdown(rank_html, unsafe_allow_html=True)
+
+            with st.expander("💡 総合判定の基準を見る", key=f"diag_exp_rank_{code}"):
+                st.markdown("""
+                * **【Sランク】** 大口介入期待度80%以上 ＋ 上昇期待値(上値余地)30%以上
+                * **【Aランク】** 大口介入期待度70%以上（強い資金流入シグナル）
+                * **【Bランク】** 大口介入期待度50%以上、または プラチナサイズ(500〜2000億) ＋ 底値圏での煮詰まり
+                * **【Cランク】** 上記以外の標準的な状態
+                * **【注意】** 需給の壁から20%以上乖離している場合、過熱感のアラートが表示されます
+                """)
+
+            st.write(f"現在値: **{diag_data['現在値']}** 円")
+            st.write(f"時価総額: **{diag_data['時価総額_表示']}**")
+            st.write(f"配当情報: **{diag_data['dividend_text']}**")
+            st.write(f"商い熱量: **{diag_data['turnover_str']}**")
+
+            with st.expander("💡 商い熱量（株式回転率）とは？", key=f"diag_exp_turnover_{code}"):
+                st.markdown("""
+                **商い熱量 ＝ 出来高が総発行株数の何％にあたるか（株式回転率）**
+                この数値は、株価が動く「エネルギーの大きさ」を見極めるための重要なテクニカル指標です。
+
+                * **① 資金流入の規模感の把握**
+                  前日比で出来高が増えていても、発行済株数に対してごくわずかであれば限定的な動きです。しかし、1日で「5%」や「10%」が取引されていたら、明確な資金介入と株主構成の変化を伴う大きなトレンドの初動（または終焉）の可能性を示唆します。
+                * **② 流動性（浮動株）の消化具合**
+                  発行済株数の中には、市場に出回らない「固定株」があります。発行済株数の5%の出来高があったということは、実際に市場に出回っている株（浮動株）の10%〜20%が1日で入れ替わった計算になり、極めて活発な商いと言えます。
+                * **③ 需給の壁（戻り売り）の突破力**
+                  上値に過去の取引が密集する壁（戻り売り圧力）があったとしても、この商い熱量が異常に高ければ、その売り圧力を吸収して上昇するだけのエネルギーが市場に存在することの裏付けとなります。
+                """)
+
+            st.markdown("---")
+            st.markdown(f"### {diag_data['intervention_name']}: {diag_data['intervention_score']}%")
+            try:
+                st.progress(diag_data['intervention_score'] / 100.0, key=f"diag_prog_iv_{code}")
+            except TypeError:
+                st.progress(diag_data['intervention_score'] / 100.0)
+            st.markdown(f"**{diag_data['intervention_comment']}**")
+
+        with c2:
+            st.markdown("##### 📋 AI診断カルテ")
+            st.markdown(f"#### {diag_data['star_rating']} {diag_data['star_desc']}")
+
+            st.markdown(f"""
+            <div style="background-color: rgba(59, 130, 246, 0.1); padding: 15px; border-left: 5px solid #3B82F6; border-radius: 5px; margin-bottom: 15px; font-size: 0.95rem; line-height: 1.6;">
+            {diag_data['star_logic']}
+            </div>
+            """, unsafe_allow_html=True)
+
+            st.markdown("---")
+            st.markdown(f"<h3 style='font-size: 1.2rem; font-weight: bold;'>🛡️ 安全性（需給の壁からの乖離率）: {diag_data['乖離率']:.1f}%</h3>", unsafe_allow_html=True)
+            st.markdown(f"<div style='color: {'#ff4b4b' if diag_data['乖離率'] > 10 else '#3B82F6'}; background-color: rgba(128, 128, 128, 0.08); padding: 10px; border-radius: 5px;'><strong>💡 AI解説:</strong> {diag_data['safe_explain']}</div>", unsafe_allow_html=True)
+            st.markdown(f"**（判定: {diag_data['safe_judgment']}）**")
+
+            with st.expander("💡 安全性（壁からの乖離と撤退ライン）の見方を見る", key=f"diag_exp_safe_{code}"):
+                safe_explain_html = f"""
+                <div style='font-size: 0.95rem; line-height: 1.6;'>
+                当ツールでは、安全性を<strong>「最大の需給の壁（オレンジの点線）」からの乖離率（％）</strong>で判定します。<br>
+                マイナス圏（壁より下）は過去のしこり玉を恐れて一般投資家が手を出せない「割安圏」であり、大口資金が水面下で仕込むポイントになりやすいです。<br><br>
+                <span style='color: #3B82F6; font-weight: bold;'>【🛡️プロのリスク管理】マイナス圏で仕込む場合は、直近の底値（青の点線）を下回ったら「シナリオ崩れ」として撤退（損切り）を検討することで、リスク管理の目安としてお使いください。</span><br><br>
+                <strong>【AIの判定基準一覧】</strong><br>
+                ・<strong>-5.0%以下 【📉 割安】</strong> 底値仕込みが適切とされるゾーン（任意）<br>
+                ・<strong>0.0%以下 【⚔️ 激戦】</strong> ブレイク前夜期待<br>
+                ・<strong>+10.0%以内 【🚀 安全圏】</strong> トレンド初動かも！？<br>
+                ・<strong>+20.0%以内 【⚠️ 警戒】</strong> 短期過熱気味警戒レベル<br>
+                ・<strong>+20.1%以上 【💀 高度な警戒】</strong> 高値掴みリスク大
+                </div>
+                """
+                st.markdown(safe_explain_html, unsafe_allow_html=True)
+
+        draw_chart(diag_data, chart_key=f"hagetaka_chart_{code}")
+
+
+def render_diagnosis_error(code: str, timed_out: bool = False, failure: dict | None = None):
+    if timed_out:
+        st.error(f"⌛ 【 {code} 】 : 制限時間（{DIAGNOSIS_DEADLINE_SEC:.0f}秒）内にデータを取得できませんでした。\n\n※**アクセス集中による一時的な通信制限**の可能性があります。しばらく時間を空けてから再度お試しください。")
+    elif failure and failure.get("cached"):
+        # 否定キャッシュ: 直前に全提供元で取れなかった銘柄は取得し直さずに即答する
+        checked = datetime.fromtimestamp(failure["checked_at"], JST).strftime("%H:%M")
+        st.error(f"❌ 【 {code} 】 : 取得できませんでした（{checked} に確認済み）。\n\n※存在しない銘柄・上場廃止・コード違いの可能性があります。")
+        st.caption(f"理由: {failure.get('reason', '-')}")
+        st.button("🔄 今すぐ再取得する", key=f"diag_refresh_{code}", on_click=_request_diagnosis_refresh, args=(code,))
+    else:
+        # 🚨 ここが確実に表示されるように修正
+        st.error(f"❌ 【 {code} 】 : データが取得できませんでした。\n\n※存在しない銘柄、または**アクセス集中による一時的な通信制限**の可能性があります。しばらく時間を空けてから再度お試しください。")
+        if failure:
+            st.caption(f"理由: {failure.get('reason', '-')}")
+
+
+def render_invalid_code(code: str):
+    st.error(f"❌ 【 {code} 】 : 銘柄コードの形式ではありません（例: 7203 / 151A）。")
+
+
+def _request_diagnosis_refresh(code: str):
+    """再取得ボタン: 次の再実行で、直前に診断した銘柄をこの銘柄だけ否定キャッシュを無視して診断し直す"""
+    st.session_state["diagnosis_refresh"] = code
+
+
+def run_diagnoses(codes: List[str], force: frozenset = frozenset()):
+    """
+    複数銘柄を並列に診断し、終わった銘柄から表示する（表示位置は入力順のまま）。
+    全体の待ち時間は最も遅い1銘柄で決まる。DIAGNOSIS_DEADLINE_SEC を過ぎた銘柄は取得失敗として表示する。
+    コードの形式でない入力は取得せずにその場で弾く。force の銘柄は否定キャッシュを無視して取得し直す。
+    """
+    slots = {}
+    valid = []
+    for code in codes:
+        slots[code] = st.empty()
+        if TICKER_CODE_RE.match(code):
+            valid.append(code)
+            slots[code].info(f"🦅 【 {code} 】 を精密検査中...")
+        else:
+            with slots[code].container():
+                render_invalid_code(code)
+    if not valid:
+        return
+
+    # 診断はワーカースレッドで動くので、st.cache_data などが使えるよう実行中のスクリプトの文脈を引き継ぐ
+    ctx = get_script_run_ctx()
+
+    def _evaluate(code: str):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return evaluate_stock(f"{code}.T", force=code in force)
+
+    pool = ThreadPoolExecutor(max_workers=min(DIAGNOSIS_WORKERS, len(valid)), thread_name_prefix="diagnosis")
+    futures = {pool.submit(_evaluate, code): code for code in valid}
+    pending = set(valid)
+    try:
+        for fut in as_completed(futures, timeout=DIAGNOSIS_DEADLINE_SEC):
+            code = futures[fut]
+            pending.discard(code)
+            diag_data, failure = fut.result()
+            with slots[code].container():
+                if diag_data:
+                    render_diagnosis(code, diag_data)
+                else:
+                    render_diagnosis_error(code, failure=failure)
+    except FuturesTimeout:
+        for code in valid:
+            if code in pending:
+                with slots[code].container():
+                    render_diagnosis_error(code, timed_out=True)
+    finally:
+        # 締切を過ぎた取得は待たずに画面を返す（走り終えた結果はキャッシュに残る）
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
 # ==========================================
 # 画面遷移
 # ==========================================
@@ -1378,7 +1432,9 @@ def show_main_page():
         st.title("🦅 HAGETAKA SCOPE")
     st.markdown(f'<p class="subtitle">M&A候補の早期検知ツール（時価総額{MARKET_CAP_MIN}億〜{MARKET_CAP_MAX}億円）</p>', unsafe_allow_html=True)
     
-    data = load_data()
+    # 日次ジョブが書き出した候補バンドルがあれば、ratios.json の読み込み・正規化・カード組み立てを省く
+    bundle = load_candidate_bundle()
+    data = bundle if bundle else load_data()
     
     tab1, tab2, tab3 = st.tabs(["📊 M&A候補", "🦅 ハゲタカ診断", "🔔 通知設定"])
     
@@ -1405,32 +1461,18 @@ def show_main_page():
             st.caption(f"📡 最終更新: {updated_at}")
             
             show_all = st.checkbox("中型株以外も表示", value=False)
-            display_data = data.get("all_data", {}) if show_all else data.get("data", {})
-            display_data = {tk: _normalize_item(it) for tk, it in (display_data or {}).items()}
+            view = "all_data" if show_all else "data"
+            if bundle:
+                bundle_view = (bundle.get("views") or {}).get(view) or {"counts": cv.level_counts({}), "entries": []}
+                display_data = {e["ticker"]: e["item"] for e in bundle_view["entries"]}
+                card_htmls = {e["ticker"]: e["card_html"] for e in bundle_view["entries"]}
+                counts = bundle_view["counts"]
+            else:
+                display_data = {tk: _normalize_item(it) for tk, it in (data.get(view) or {}).items()}
+                card_htmls = {}
+                counts = cv.level_counts(display_data)
 
-            lvl4 = len([v for v in display_data.values() if int(v.get("level", 0)) == 4])
-            lvl3p = len([v for v in display_data.values() if int(v.get("level", 0)) >= 3])
-            
-            st.markdown(f"""
-            <div style="display: flex; justify-content: space-around; align-items: center; background-color: var(--secondary-background-color); 
-                        border: 1px solid rgba(128,128,128,0.2); border-radius: 12px; padding: 0.8rem; margin-bottom: 0.5rem; 
-                        box-shadow: 0 4px 15px rgba(0,0,0,0.05);">
-                <div style="text-align: center;">
-                    <div style="opacity: 0.7; font-size: 0.75rem; font-weight: 700;">LEVEL 4</div>
-                    <div style="color: #C41E3A; font-size: 1.4rem; font-weight: 900;">{lvl4}<span style="font-size: 0.8rem; opacity: 0.6; font-weight: 600; margin-left: 2px;">件</span></div>
-                </div>
-                <div style="width: 1px; height: 40px; background: rgba(128,128,128,0.2);"></div>
-                <div style="text-align: center;">
-                    <div style="opacity: 0.7; font-size: 0.75rem; font-weight: 700;">LEVEL 3+</div>
-                    <div style="color: #FF9800; font-size: 1.4rem; font-weight: 900;">{lvl3p}<span style="font-size: 0.8rem; opacity: 0.6; font-weight: 600; margin-left: 2px;">件</span></div>
-                </div>
-                <div style="width: 1px; height: 40px; background: rgba(128,128,128,0.2);"></div>
-                <div style="text-align: center;">
-                    <div style="opacity: 0.7; font-size: 0.75rem; font-weight: 700;">総検出数</div>
-                    <div style="font-size: 1.4rem; font-weight: 900;">{len(display_data)}<span style="font-size: 0.8rem; opacity: 0.6; font-weight: 600; margin-left: 2px;">件</span></div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(cv.summary_html(counts), unsafe_allow_html=True)
 
             _, center_col, _ = st.columns([1, 1.8, 1])
             with center_col:
@@ -1482,9 +1524,9 @@ def show_main_page():
 
             if filtered_data:
                 # LEVEL 1から昇順に並べる（同じLEVELなら需給スコア降順）
-                sorted_items = sorted(filtered_data.items(), key=lambda x: (int(x[1].get('level',0)), -float(x[1].get('flow_score',0))))
+                sorted_items = sorted(filtered_data.items(), key=cv.sort_key)
                 for ticker, d in sorted_items:
-                    render_card(ticker, d)
+                    render_card(ticker, d, card_htmls.get(ticker))
             else:
                 st.info("該当する銘柄がありません")
                 
@@ -1613,6 +1655,7 @@ def show_main_page():
             input_code = st.text_area("銘柄コード", value=default_input, placeholder="例: 7011 7203 151A\n改行やスペース区切りで複数入力できます", label_visibility="collapsed", height=68)
             search_btn = st.form_submit_button("🦅 ハゲタカAIで診断する")
             
+        refresh_code = st.session_state.pop("diagnosis_refresh", None)
         if search_btn and input_code:
             codes = normalize_input(input_code)
             if not codes: 
@@ -1620,99 +1663,11 @@ def show_main_page():
             elif len(codes) > 5:
                 st.error("⚠️ サーバー負荷軽減のため、一度に診断できるのは最大5銘柄までです。銘柄数を減らして再度お試しください。")
             else:
-                with st.spinner(f'🦅 {len(codes)}銘柄を精密検査中...'):
-                    for code in codes:
-                        diag_data = evaluate_stock(f"{code}.T")
-                        if diag_data:
-                            # 💡 診断結果をカードで囲んで区切りを明確に
-                            with st.container():
-                                st.markdown('<div class="diagnosis-card-marker" style="display:none;"></div>', unsafe_allow_html=True)
-                                
-                                c1, c2 = st.columns([1, 2])
-                                with c1:
-                                    st.markdown(f"<h2 style='margin-bottom: 0px;'>{diag_data['icons_str']} {diag_data['コード']} {diag_data['銘柄名']}</h2>", unsafe_allow_html=True)
-                                    
-                                    base_rank = diag_data['ランク']
-                                    warning = diag_data['警告']
-                                    rank_color = "red" if base_rank == "S" else "orange" if base_rank == "A" else "#3B82F6"
-                                    
-                                    if warning:
-                                        rank_html = f"<h3 style='color:{rank_color}; margin-top: 5px;'>総合判定: {base_rank} <span style='color:#ff4b4b; font-size:0.8em;'>{warning}</span></h3>"
-                                    else:
-                                        rank_html = f"<h3 style='color:{rank_color}; margin-top: 5px;'>総合判定: {base_rank}</h3>"
-                                    
-                                    st.markdown(rank_html, unsafe_allow_html=True)
-                                    
-                                    with st.expander("💡 総合判定の基準を見る", key=f"diag_exp_rank_{code}"):
-                                        st.markdown("""
-                                        * **【Sランク】** 大口介入期待度80%以上 ＋ 上昇期待値(上値余地)30%以上
-                                        * **【Aランク】** 大口介入期待度70%以上（強い資金流入シグナル）
-                                        * **【Bランク】** 大口介入期待度50%以上、または プラチナサイズ(500〜2000億) ＋ 底値圏での煮詰まり
-                                        * **【Cランク】** 上記以外の標準的な状態
-                                        * **【注意】** 需給の壁から20%以上乖離している場合、過熱感のアラートが表示されます
-                                        """)
-
-                                    st.write(f"現在値: **{diag_data['現在値']}** 円")
-                                    st.write(f"時価総額: **{diag_data['時価総額_表示']}**")
-                                    st.write(f"配当情報: **{diag_data['dividend_text']}**")
-                                    st.write(f"商い熱量: **{diag_data['turnover_str']}**")
-                                    
-                                    with st.expander("💡 商い熱量（株式回転率）とは？", key=f"diag_exp_turnover_{code}"):
-                                        st.markdown("""
-                                        **商い熱量 ＝ 出来高が総発行株数の何％にあたるか（株式回転率）**
-                                        この数値は、株価が動く「エネルギーの大きさ」を見極めるための重要なテクニカル指標です。
-                                        
-                                        * **① 資金流入の規模感の把握**
-                                          前日比で出来高が増えていても、発行済株数に対してごくわずかであれば限定的な動きです。しかし、1日で「5%」や「10%」が取引されていたら、明確な資金介入と株主構成の変化を伴う大きなトレンドの初動（または終焉）の可能性を示唆します。
-                                        * **② 流動性（浮動株）の消化具合**
-                                          発行済株数の中には、市場に出回らない「固定株」があります。発行済株数の5%の出来高があったということは、実際に市場に出回っている株（浮動株）の10%〜20%が1日で入れ替わった計算になり、極めて活発な商いと言えます。
-                                        * **③ 需給の壁（戻り売り）の突破力**
-                                          上値に過去の取引が密集する壁（戻り売り圧力）があったとしても、この商い熱量が異常に高ければ、その売り圧力を吸収して上昇するだけのエネルギーが市場に存在することの裏付けとなります。
-                                        """)
-                                    
-                                    st.markdown("---")
-                                    st.markdown(f"### {diag_data['intervention_name']}: {diag_data['intervention_score']}%")
-                                    try:
-                                        st.progress(diag_data['intervention_score'] / 100.0, key=f"diag_prog_iv_{code}")
-                                    except TypeError:
-                                        st.progress(diag_data['intervention_score'] / 100.0)
-                                    st.markdown(f"**{diag_data['intervention_comment']}**")
-                                    
-                                with c2:
-                                    st.markdown("##### 📋 AI診断カルテ")
-                                    st.markdown(f"#### {diag_data['star_rating']} {diag_data['star_desc']}")
-                                    
-                                    st.markdown(f"""
-                                    <div style="background-color: rgba(59, 130, 246, 0.1); padding: 15px; border-left: 5px solid #3B82F6; border-radius: 5px; margin-bottom: 15px; font-size: 0.95rem; line-height: 1.6;">
-                                    {diag_data['star_logic']}
-                                    </div>
-                                    """, unsafe_allow_html=True)
-                                    
-                                    st.markdown("---")
-                                    st.markdown(f"<h3 style='font-size: 1.2rem; font-weight: bold;'>🛡️ 安全性（需給の壁からの乖離率）: {diag_data['乖離率']:.1f}%</h3>", unsafe_allow_html=True)
-                                    st.markdown(f"<div style='color: {'#ff4b4b' if diag_data['乖離率'] > 10 else '#3B82F6'}; background-color: rgba(128, 128, 128, 0.08); padding: 10px; border-radius: 5px;'><strong>💡 AI解説:</strong> {diag_data['safe_explain']}</div>", unsafe_allow_html=True)
-                                    st.markdown(f"**（判定: {diag_data['safe_judgment']}）**")
-                                    
-                                    with st.expander("💡 安全性（壁からの乖離と撤退ライン）の見方を見る", key=f"diag_exp_safe_{code}"):
-                                        safe_explain_html = f"""
-                                        <div style='font-size: 0.95rem; line-height: 1.6;'>
-                                        当ツールでは、安全性を<strong>「最大の需給の壁（オレンジの点線）」からの乖離率（％）</strong>で判定します。<br>
-                                        マイナス圏（壁より下）は過去のしこり玉を恐れて一般投資家が手を出せない「割安圏」であり、大口資金が水面下で仕込むポイントになりやすいです。<br><br>
-                                        <span style='color: #3B82F6; font-weight: bold;'>【🛡️プロのリスク管理】マイナス圏で仕込む場合は、直近の底値（青の点線）を下回ったら「シナリオ崩れ」として撤退（損切り）を検討することで、リスク管理の目安としてお使いください。</span><br><br>
-                                        <strong>【AIの判定基準一覧】</strong><br>
-                                        ・<strong>-5.0%以下 【📉 割安】</strong> 底値仕込みが適切とされるゾーン（任意）<br>
-                                        ・<strong>0.0%以下 【⚔️ 激戦】</strong> ブレイク前夜期待<br>
-                                        ・<strong>+10.0%以内 【🚀 安全圏】</strong> トレンド初動かも！？<br>
-                                        ・<strong>+20.0%以内 【⚠️ 警戒】</strong> 短期過熱気味警戒レベル<br>
-                                        ・<strong>+20.1%以上 【💀 高度な警戒】</strong> 高値掴みリスク大
-                                        </div>
-                                        """
-                                        st.markdown(safe_explain_html, unsafe_allow_html=True)
-
-                                draw_chart(diag_data, chart_key=f"hagetaka_chart_{code}")
-                        else: 
-                            # 🚨 ここが確実に表示されるように修正
-                            st.error(f"❌ 【 {code} 】 : データが取得できませんでした。\n\n※存在しない銘柄、または**アクセス集中による一時的な通信制限**の可能性があります。しばらく時間を空けてから再度お試しください。")
+                st.session_state["diagnosis_codes"] = codes
+                run_diagnoses(codes)
+        elif refresh_code:
+            # 再取得ボタン: 直前の診断結果を出し直し、押された銘柄だけ否定キャッシュを無視する（成功済みの銘柄はキャッシュから）
+            run_diagnoses(st.session_state.get("diagnosis_codes") or [refresh_code], force=frozenset([refresh_code]))
 
     # ==========================================
     # タブ3: 通知設定
@@ -1766,5 +1721,10 @@ def show_main_page():
 # ==========================================
 if "logged_in" not in st.session_state: st.session_state["logged_in"] = False
 if "cart" not in st.session_state: st.session_state["cart"] = []
-if st.session_state.get("logged_in"): show_main_page()
-else: show_login_page()
+if st.session_state.get("logged_in"):
+    show_main_page()
+    lz.mark("メイン画面", _RUN_STARTED)
+else:
+    show_login_page()
+    lz.mark("ログイン画面", _RUN_STARTED)
+lz.report(_RUN_STARTED)
@@ -0,0 +1,370 @@
+"""
+日付別スナップショットのアーカイブ（data/archive/）
+─────────────────────────────────────
+公開した世代（snapshot_store）を取引日ごとに1件ずつ残し、git を遡らずに「D 日時点の状態」を読めるようにする。
+ファイルの中身は SHA-256 をキーに1回だけ保存する。
+日付別の計算結果はここが唯一の記録（backfill.py も ratios.json だけの目録としてここに書く）。
+
+data/archive/
+  objects/ab/abcdef....json   … 中身（同じ内容は1つだけ）
+  dates/YYYY-MM-DD.json       … その取引日の目録
+                                  {"date", "generation", "updated_at",
+                                   "files": {"ratios.json" など: sha256}, "history_months": {"YYYY-MM": sha256}}
+
+履歴（history/shard_XX.json）はシャードのままでは保存しない。毎営業日ほぼ全銘柄に1本足が増えるので、
+64 シャードが毎日すべて変わり、何も重複排除されないため。代わりに次の形に分けて保存する。
+  ・足の日ごとの塊 {"date", "tickers", "O", "H", "L", "C", "V"} … 過ぎた日の足は変わらないので、1日分は1回だけ保存される
+  ・月ごとの索引 {"month", "days": {日付: sha256}} … 目録からはこれを引く（目録は月の数だけで済む）
+  ・history/info.json（銘柄→info）・history/meta.json … 通常のファイルとして保存
+したがって1日に増えるのは、その日の足の塊・当月の索引・ratios など小さなものだけ。
+株式分割の調整などで過去の足が書き換わった日だけ、その日の塊が新しく保存される。
+公開中のスナップショット（data/snapshots/）とは中身の形が違うので、コミットに同じ履歴が二重に載ることはない
+（ratios.json などはスナップショットと同じバイト列なので、git の中では同じ blob 1つになる）。
+
+・日付は実行日ではなく取引日（ratios の "date" = 採用した KABU+ 日次ファイルの営業日）。
+  休日の実行や再取得フェーズは、同じ取引日の目録をその日の最後の状態で上書きする
+・load_state_as_of("2026-10-16") で、その日以前で最新の目録の状態を返す（ratios / 履歴 / 未取得一覧）
+・同じ取引日の目録を上書きしたときは、どの目録からも参照されなくなった中身を prune_objects で消す
+・以前の data/ratios_archive/ratios_YYYY-MM-DD.json は読み取りのみ（目録に ratios がない日の補い）。新たには書かない
+"""
+
+from __future__ import annotations
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import history_store as hs
+import jsonio
+import ratios_store as rs
+
+ARCHIVE_DIR = Path("data/archive")
+OBJECTS_DIR = ARCHIVE_DIR / "objects"
+DATES_DIR = ARCHIVE_DIR / "dates"
+# 以前の日付別 ratios（読み取りのみ）
+RATIOS_ARCHIVE_DIR = Path("data/ratios_archive")
+# 目録の "files" に入れるスナップショットのファイル（candidates.* は ratios から作り直せるので残さない）
+ARCHIVED_FILES = ("ratios.json", "missing_universe.json", "history/meta.json")
+HISTORY_FIELDS = ("O", "H", "L", "C", "V")
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def object_path(digest: str) -> Path:
+    return OBJECTS_DIR / digest[:2] / f"{digest}.json"
+
+
+def _store_object(src: Path) -> tuple[str, bool]:
+    """中身を objects/ に保存して (sha256, 新規か) を返す。既にあれば何もしない"""
+    digest = _sha256(src)
+    dst = object_path(digest)
+    if dst.exists():
+        return digest, False
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(dst.name + ".tmp")
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+    return digest, True
+
+
+def _store_bytes(data: bytes) -> tuple[str, bool]:
+    """bytes を objects/ に保存して (sha256, 新規か) を返す"""
+    digest = hashlib.sha256(data).hexdigest()
+    dst = object_path(digest)
+    if dst.exists():
+        return digest, False
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(dst.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, dst)
+    return digest, True
+
+
+def _write_manifest(
+    date: str,
+    generation: str | None,
+    updated_at: str | None,
+    files: dict,
+    history_months: dict | None = None,
+) -> bool:
+    """目録を書く。同じ日付の目録を置き換えたら True"""
+    manifest = {
+        "date": date,
+        "generation": generation,
+        "updated_at": updated_at,
+        "files": files,
+        "history_months": history_months or {},
+    }
+    DATES_DIR.mkdir(parents=True, exist_ok=True)
+    path = DATES_DIR / f"{date}.json"
+    replaced = path.exists()
+    jsonio.write_json(path, manifest, indent=True, atomic=True)
+    return replaced
+
+
+def _day_chunk(date: str, day: dict) -> dict:
+    """足の日ごとの塊。銘柄順に並べて、同じ中身なら同じバイト列（同じ sha256）になるようにする"""
+    order = sorted(range(len(day["tickers"])), key=day["tickers"].__getitem__)
+    chunk = {"date": date, "tickers": [day["tickers"][i] for i in order]}
+    for k in HISTORY_FIELDS:
+        chunk[k] = [day[k][i] for i in order]
+    return chunk
+
+
+def _archive_history(history_dir: Path, stats: dict) -> tuple[dict, dict]:
+    """
+    履歴シャードを足の日ごとの塊と月ごとの索引に分けて保存する。
+    戻り値: (目録の "files" に足す {"history/info.json": sha256}, 目録の "history_months")
+    """
+    days: dict[str, dict] = {}
+    info: dict[str, dict] = {}
+    for p in sorted(history_dir.glob("shard_*.json")):
+        for ticker, row in jsonio.read_shard(p).items():
+            if row.get("info"):
+                info[ticker] = row["info"]
+            for i, d in enumerate(row.get("dates") or []):
+                day = days.get(d)
+                if day is None:
+                    day = days[d] = {"tickers": [], **{k: [] for k in HISTORY_FIELDS}}
+                day["tickers"].append(ticker)
+                for k in HISTORY_FIELDS:
+                    day[k].append(row[k][i])
+
+    def store(obj) -> str:
+        data = jsonio.dumps(obj)
+        digest, created = _store_bytes(data)
+        stats["files"] += 1
+        if created:
+            stats["new_objects"] += 1
+            stats["new_bytes"] += len(data)
+        return digest
+
+    months: dict[str, dict[str, str]] = {}
+    for d in sorted(days):
+        months.setdefault(d[:7], {})[d] = store(_day_chunk(d, days.pop(d)))
+    history_months = {m: store({"month": m, "days": idx}) for m, idx in months.items()}
+    files = {"history/info.json": store(dict(sorted(info.items())))} if info else {}
+    return files, history_months
+
+
+def archive_snapshot(snapshot_dir: Path, date: str, generation: str | None = None, updated_at: str | None = None) -> dict:
+    """
+    公開済みの世代ディレクトリを取引日 date（YYYY-MM-DD）の状態として保存する。
+    戻り値: {"files": 件数, "new_objects": 新たに保存した件数, "new_bytes": そのバイト数, "pruned": 消した件数}
+    """
+    snapshot_dir = Path(snapshot_dir)
+    stats = {"files": 0, "new_objects": 0, "new_bytes": 0, "pruned": 0}
+    files: dict[str, str] = {}
+    for rel in ARCHIVED_FILES:
+        p = snapshot_dir / rel
+        if not p.exists():
+            continue
+        digest, created = _store_object(p)
+        files[rel] = digest
+        stats["files"] += 1
+        if created:
+            stats["new_objects"] += 1
+            stats["new_bytes"] += p.stat().st_size
+
+    history_months: dict = {}
+    if (snapshot_dir / "history").is_dir():
+        history_files, history_months = _archive_history(snapshot_dir / "history", stats)
+        files.update(history_files)
+
+    if _write_manifest(date, generation or snapshot_dir.name, updated_at, files, history_months):
+        # 同じ取引日の再実行（再取得フェーズなど）で、前の目録だけが参照していた中身を消す
+        stats["pruned"] = prune_objects()
+    return stats
+
+
+def archive_ratios(output: dict, updated_at: str | None = None) -> bool:
+    """
+    ratios の出力（fetch_data.build_ratios_output の形）を output["date"] の ratios.json として保存する（backfill.py 用）。
+    その日の目録が既にあれば ratios.json だけを差し替え、履歴シャードなどの記録は残す。戻り値: 新規オブジェクトか
+    """
+    date = output["date"]
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    # objects/ へハードリンクできるよう同じファイルシステムに一時ファイルを置く
+    with tempfile.TemporaryDirectory(dir=ARCHIVE_DIR, prefix=".tmp-") as tmp:
+        src = rs.write_ratios(output, Path(tmp) / "ratios.json")
+        digest, created = _store_object(src)
+    path = DATES_DIR / f"{date}.json"
+    manifest = jsonio.read_json(path) if path.exists() else {}
+    files = dict(manifest.get("files") or {})
+    files["ratios.json"] = digest
+    _write_manifest(
+        date,
+        manifest.get("generation"),
+        manifest.get("updated_at") or updated_at,
+        files,
+        manifest.get("history_months"),
+    )
+    return created
+
+
+def _referenced_objects() -> set[str]:
+    refs: set[str] = set()
+    for d in list_dates():
+        manifest = jsonio.read_json(DATES_DIR / f"{d}.json")
+        refs.update((manifest.get("files") or {}).values())
+        for digest in (manifest.get("history_months") or {}).values():
+            refs.add(digest)
+            p = object_path(digest)
+            if p.exists():
+                refs.update((jsonio.read_json(p).get("days") or {}).values())
+    return refs
+
+
+def prune_objects() -> int:
+    """どの目録からも参照されていない objects/ の中身を消す。消した件数"""
+    if not OBJECTS_DIR.exists():
+        return 0
+    refs = _referenced_objects()
+    removed = 0
+    for p in OBJECTS_DIR.glob("*/*.json"):
+        if p.stem not in refs:
+            p.unlink()
+            removed += 1
+    for d in OBJECTS_DIR.iterdir():
+        if d.is_dir() and not any(d.iterdir()):
+            d.rmdir()
+    return removed
+
+
+def list_dates() -> list[str]:
+    """目録のある日付（昇順）"""
+    if not DATES_DIR.exists():
+        return []
+    return sorted(p.stem for p in DATES_DIR.glob("*.json"))
+
+
+def ratios_dates() -> dict[str, Path]:
+    """
+    日付別の ratios の置き場所 {YYYY-MM-DD: パス}（昇順）。
+    目録の ratios.json を優先し、目録にない日だけ以前の data/ratios_archive/ から補う。
+    """
+    out: dict[str, Path] = {}
+    if RATIOS_ARCHIVE_DIR.exists():
+        for ap in RATIOS_ARCHIVE_DIR.glob("ratios_*.json"):
+            out[ap.stem.replace("ratios_", "")] = ap
+    for d in list_dates():
+        try:
+            digest = (jsonio.read_json(DATES_DIR / f"{d}.json").get("files") or {}).get("ratios.json")
+        except Exception:
+            continue
+        if digest and object_path(digest).exists():
+            out[d] = object_path(digest)
+    return dict(sorted(out.items()))
+
+
+def _manifest_as_of(date: str) -> dict:
+    candidates = [d for d in list_dates() if d <= date]
+    if not candidates:
+        return {}
+    return jsonio.read_json(DATES_DIR / f"{candidates[-1]}.json")
+
+
+class ArchivedState:
+    """ある日付時点の状態（load_state_as_of の戻り値）。ファイルは必要になったときに読む"""
+
+    def __init__(self, date: str, manifest: dict):
+        self.date = date
+        self.manifest = manifest
+        # 実際に状態を記録した日（date 以前で最新の目録の日付。目録がなければ None）
+        self.snapshot_date: str | None = manifest.get("date")
+        self.generation: str | None = manifest.get("generation")
+        self._files: dict = manifest.get("files") or {}
+        self._months: dict = manifest.get("history_months") or {}
+        self._shards: dict[int, dict] = {}
+        self._rows: dict | None = None
+
+    def path(self, name: str) -> Path | None:
+        digest = self._files.get(name)
+        return object_path(digest) if digest else None
+
+    def ratios(self) -> dict:
+        """v1 と同じ形の ratios（date 以前で最新の日のもの。ratios だけの目録・以前の ratios_archive も含む）"""
+        archived = [p for d, p in ratios_dates().items() if d <= self.date]
+        return rs.load_ratios(archived[-1]) if archived else {}
+
+    def missing_universe(self) -> list[str]:
+        p = self.path("missing_universe.json")
+        if p is None or not p.exists():
+            return []
+        return list(jsonio.read_json(p).get("tickers") or [])
+
+    def _history_rows(self) -> dict:
+        """足の日ごとの塊から全銘柄の行を組み立てる（初回に date 以前の塊をまとめて読む）"""
+        if self._rows is None:
+            rows: dict[str, dict] = {}
+            for month in sorted(m for m in self._months if m <= self.date[:7]):
+                days = jsonio.read_json(object_path(self._months[month])).get("days") or {}
+                for d in sorted(days):
+                    if d > self.date:
+                        continue
+                    chunk = jsonio.read_json(object_path(days[d]))
+                    for i, ticker in enumerate(chunk["tickers"]):
+                        row = rows.get(ticker)
+                        if row is None:
+                            row = rows[ticker] = {"dates": [], **{k: [] for k in HISTORY_FIELDS}}
+                        row["dates"].append(d)
+                        for k in HISTORY_FIELDS:
+                            row[k].append(chunk[k][i])
+            p = self.path("history/info.json")
+            info = jsonio.read_json(p) if p is not None and p.exists() else {}
+            for ticker, row in rows.items():
+                if ticker in info:
+                    row["info"] = info[ticker]
+            self._rows = rows
+        return self._rows
+
+    def history_shard(self, shard_id: int) -> dict:
+        if shard_id not in self._shards:
+            if self._months:
+                self._shards[shard_id] = {t: r for t, r in self._history_rows().items() if hs.shard_id(t) == shard_id}
+            else:
+                # 以前の目録（履歴をシャードのまま保存していた）
+                p = self.path(f"history/shard_{shard_id:02d}.json")
+                self._shards[shard_id] = jsonio.read_shard(p) if p is not None and p.exists() else {}
+        return self._shards[shard_id]
+
+    def history_row(self, ticker: str) -> dict | None:
+        """銘柄1件分の {dates, O, H, L, C, V, info}（date より後の足は含めない）"""
+        if self._months:
+            return self._history_rows().get(ticker)
+        row = self.history_shard(hs.shard_id(ticker)).get(ticker)
+        if not row or not row.get("dates"):
+            return None
+        dates = row["dates"]
+        if dates[-1] <= self.date:
+            return row
+        n = sum(1 for d in dates if d <= self.date)
+        cut = {k: (v[:n] if isinstance(v, list) else v) for k, v in row.items()}
+        return cut if n else None
+
+    def history(self) -> dict:
+        """全銘柄の履歴（全部の塊・シャードを読むので重い。バックテスト向け）"""
+        if self._months:
+            return dict(self._history_rows())
+        out: dict = {}
+        for sid in range(hs.HISTORY_SHARD_COUNT):
+            for ticker in self.history_shard(sid):
+                row = self.history_row(ticker)
+                if row:
+                    out[ticker] = row
+        return out
+
+
+def load_state_as_of(date: str) -> ArchivedState:
+    """date（YYYY-MM-DD）時点の状態。date 以前で最新の目録を使う（なければ空の状態）"""
+    return ArchivedState(date, _manifest_as_of(date))
@@ -0,0 +1,308 @@
+"""
+過去日の ratios.json 再構築（バックフィル）
+─────────────────────────────────────
+公開中のスナップショット世代の history/shard_XX.json に保存済みの OHLCV から、履歴に含まれる全営業日について
+fetch_data.py と同じ結果セット（FlowScore / 出来高倍率 / LEVEL / 連続日数 …）を作り直し、
+日付別アーカイブ（data/archive/dates/YYYY-MM-DD.json の ratios.json。archive_store.archive_ratios）に書き出す。
+
+・日付ごとにパイプラインを回すのではなく、全銘柄×全日付の縦持ちパネルに対して
+  累積和ベースの移動窓を1回だけ計算する（数百日分でも数秒）
+・flow_streak_high は前回ファイルからの持ち越しではなく、実際の履歴から数え直す
+・時価総額は保存済み info の時価総額を終値比で、PBR は最新 ratios.json の値を終値比で各日に換算する
+  （当日の KABU+ 指標そのものではないので、実際の日次実行で保存されたアーカイブは既定では上書きしない）
+
+使い方:
+  python backfill.py                      # 全日付（既存アーカイブはそのまま）
+  python backfill.py --since 2026-01-01   # 指定日以降のみ
+  python backfill.py --overwrite          # 既存アーカイブも作り直す
+"""
+
+from __future__ import annotations
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import archive_store as ast
+import fetch_data as fd
+import jsonio
+import ratios_store as rs
+import replay_bundle as rb
+import snapshot_store as ss
+
+# fetch_data.fetch_volume_data と同じく、60本未満の銘柄は評価しない
+MIN_BARS = 60
+
+
+def _py_round(values: np.ndarray, ndigits: int) -> list[float]:
+    """組み込み round と同じ丸め（np.round は .x5 境界で結果がずれることがある）"""
+    return [round(v, ndigits) for v in values.tolist()]
+
+
+def load_history_panel(history_dir: Path | None = None) -> tuple[pd.DataFrame, dict]:
+    """全シャードを (ticker, date) 順の縦持ちパネルと、銘柄ごとの info 辞書にする（省略時は公開中の世代）"""
+    frames = []
+    infos: dict = {}
+    history_dir = Path(history_dir) if history_dir else ss.path("history")
+    for fp in sorted(history_dir.glob("shard_*.json")):
+        try:
+            bucket = jsonio.read_shard(fp)
+        except Exception as e:
+            print(f"⚠️ shard 読み込み失敗 {fp.name}: {e}")
+            continue
+        for ticker, row in (bucket or {}).items():
+            dates = row.get("dates") or []
+            if not dates:
+                continue
+            frames.append(pd.DataFrame({
+                "ticker": ticker,
+                "date": pd.to_datetime(dates, errors="coerce"),
+                "O": pd.to_numeric(row.get("O", []), errors="coerce"),
+                "H": pd.to_numeric(row.get("H", []), errors="coerce"),
+                "L": pd.to_numeric(row.get("L", []), errors="coerce"),
+                "C": pd.to_numeric(row.get("C", []), errors="coerce"),
+                "V": pd.to_numeric(row.get("V", []), errors="coerce"),
+            }))
+            infos[ticker] = row.get("info") or {}
+    if not frames:
+        return pd.DataFrame(columns=["ticker", "date", "O", "H", "L", "C", "V"]), infos
+
+    panel = pd.concat(frames, ignore_index=True)
+    panel["V"] = panel["V"].fillna(0)
+    panel = panel.dropna(subset=["date", "O", "H", "L", "C"])
+    panel = panel.sort_values(["ticker", "date"], kind="mergesort").reset_index(drop=True)
+    return panel, infos
+
+
+def _window_mean(x: np.ndarray, start: np.ndarray, idx: np.ndarray, window: int) -> np.ndarray:
+    """各行で「同じ銘柄の直近 window 本（行数が足りなければある分だけ）」の平均（出来高のような整数値向け）"""
+    cs = np.concatenate(([0.0], np.cumsum(x, dtype=np.float64)))
+    lo = np.maximum(idx + 1 - window, start)
+    return (cs[idx + 1] - cs[lo]) / (idx + 1 - lo)
+
+
+def _tail_mean(x: np.ndarray, window: int) -> np.ndarray:
+    """
+    各行で「直前 window 本」の平均を、pandas の mean と同じ加算順（np.sum）で計算する。
+    価格系の小数は累積和の差だと末尾の誤差で丸め結果が変わるため、こちらを使う。
+    先頭 window-1 行は銘柄をまたぐが、評価対象（60本以上）の行では使われない。
+    """
+    padded = np.concatenate((np.zeros(window - 1), x))
+    return np.lib.stride_tricks.sliding_window_view(padded, window).sum(axis=1) / window
+
+
+def compute_panel_scores(panel: pd.DataFrame) -> pd.DataFrame:
+    """
+    calculate_flow_score と fetch_volume_data の指標を、パネル全行について一括計算する。
+    各行の値は「その日までの履歴だけで当日に実行した結果」と一致する。
+    """
+    tickers = panel["ticker"].to_numpy()
+    n = len(panel)
+    idx = np.arange(n)
+    is_start = np.ones(n, dtype=bool)
+    is_start[1:] = tickers[1:] != tickers[:-1]
+    start = np.maximum.accumulate(np.where(is_start, idx, 0))
+    bars = idx - start + 1
+
+    H = panel["H"].to_numpy(dtype=np.float64)
+    L = panel["L"].to_numpy(dtype=np.float64)
+    C = panel["C"].to_numpy(dtype=np.float64)
+    V = panel["V"].to_numpy(dtype=np.float64)
+
+    def lag(x: np.ndarray, k: int) -> np.ndarray:
+        out = np.full(n, np.nan)
+        out[k:] = x[:-k]
+        out[bars <= k] = np.nan
+        return out
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # 1) 出来高異常
+        avg_vol_60 = _window_mean(V, start, idx, 60)
+        avg_vol_5 = _window_mean(V, start, idx, 5)
+        vol_anomaly = np.where(avg_vol_60 > 0, np.clip((avg_vol_5 / avg_vol_60 - 1) * 50.0, 0.0, 100.0), 0.0)
+
+        # 2) 価格安定度（直近5本の先頭→末尾）
+        price_change_5 = np.abs(C / lag(C, 4) - 1.0) * 100.0
+        price_stability = np.maximum(0.0, 100.0 - price_change_5 * 20.0)
+
+        # 3) 吸収度
+        vol_ratio_60 = np.where(avg_vol_60 > 0, avg_vol_5 / avg_vol_60, 1.0)
+        absorption = np.minimum(100.0, (vol_ratio_60 / (price_change_5 + 0.1)) * 30.0)
+
+        # 4) 値幅縮小（銘柄の先頭行は前日終値がないので TR を0扱い。60本以上の行では窓に入らない）
+        prev_c = lag(C, 1)
+        tr = np.maximum(H - L, np.maximum(np.abs(H - prev_c), np.abs(L - prev_c)))
+        tr = np.where(np.isnan(tr), 0.0, tr)
+        atr_20 = _tail_mean(tr, 20)
+        atr_5 = _tail_mean(tr, 5)
+        range_compression = np.where(atr_20 > 0, np.clip((1.0 - atr_5 / atr_20) * 100.0, 0.0, 100.0), 50.0)
+
+        # 5) 下ヒゲ
+        body_range = H - L
+        shadow = np.where(body_range != 0, (C - L) / body_range, 0.5)
+        lower_shadow = _tail_mean(shadow, 5) * 100.0
+
+        flow = (
+            vol_anomaly * 0.30
+            + price_stability * 0.25
+            + absorption * 0.25
+            + range_compression * 0.10
+            + lower_shadow * 0.10
+        )
+        flow = np.clip(flow, 0.0, 100.0)
+
+        # 出来高倍率（当日出来高 ÷ 直近 LOOKBACK_DAYS 本平均。どちらも int に切り捨ててから割る）
+        avg_volume = np.trunc(_window_mean(V, start, idx, fd.LOOKBACK_DAYS))
+        latest_volume = np.trunc(V)
+        vol_ratio = np.where(avg_volume > 0, latest_volume / avg_volume, 0.0)
+        price_change_5d = (C / lag(C, 5) - 1) * 100
+
+    scores = pd.DataFrame({
+        "ticker": tickers,
+        "date": panel["date"].dt.strftime("%Y-%m-%d").to_numpy(),
+        "bars": bars,
+        "close": C,
+        "flow_score": _py_round(flow, 1),
+        "vol_anomaly": _py_round(vol_anomaly, 1),
+        "price_stability": _py_round(price_stability, 1),
+        "absorption": _py_round(absorption, 1),
+        "range_compression": _py_round(range_compression, 1),
+        "lower_shadow": _py_round(lower_shadow, 1),
+        "vol_ratio": [round(v, 2) if a > 0 else 0 for v, a in zip(vol_ratio.tolist(), avg_volume.tolist())],
+        "price_change_5d": _py_round(np.nan_to_num(price_change_5d), 2),
+    })
+
+    # 連続日数: 銘柄内で FlowScore70+ が途切れずに続いた日数（評価対象外の行は途切れ扱い）
+    eligible = bars >= MIN_BARS
+    hi = eligible & (scores["flow_score"].to_numpy() >= fd.FLOW_SCORE_HIGH)
+    c = np.cumsum(hi)
+    reset = np.where(~hi, c, np.where(is_start, c - 1, 0))
+    scores["flow_streak_high"] = c - np.maximum.accumulate(reset)
+    scores["eligible"] = eligible
+    return scores
+
+
+def _reference_from_ratios() -> dict:
+    """最新の ratios.json から銘柄名・PBR・その時点の株価を拾う（無ければ空）"""
+    try:
+        ref = rs.load_ratios()
+    except Exception:
+        return {}
+    return {**(ref.get("all_data", {}) or {}), **(ref.get("data", {}) or {})}
+
+
+def backfill(since: str | None = None, overwrite: bool = False) -> int:
+    started = time.perf_counter()
+    updated_at = rb.now(fd.JST).strftime("%Y-%m-%d %H:%M:%S")
+
+    panel, infos = load_history_panel()
+    if panel.empty:
+        print(f"⚠️ {ss.path('history')} に履歴がありません")
+        return 0
+    print(f"📚 履歴パネル: {panel['ticker'].nunique()} 銘柄 / {len(panel)} 行")
+
+    scores = compute_panel_scores(panel)
+    del panel
+    print(f"🧮 指標計算: {time.perf_counter() - started:.1f} 秒")
+
+    ref = _reference_from_ratios()
+    last_close = scores.groupby("ticker", sort=False)["close"].last().to_dict()
+
+    # 銘柄ごとに日付に依存しない値（名前・株数・基準時価総額・基準PBR）を先に決めておく
+    static: dict = {}
+    for ticker, info in infos.items():
+        r = ref.get(ticker, {})
+        api_name = info.get("shortName") or info.get("longName")
+        mc = float(info.get("marketCap") or 0)
+        so = info.get("sharesOutstanding")
+        shares = int(so) if so else None
+        estimated = False
+        if not shares and mc and last_close.get(ticker):
+            shares = int(mc / last_close[ticker])
+            estimated = True
+        pbr_per_price = None
+        if r.get("pbr") and r.get("price"):
+            pbr_per_price = float(r["pbr"]) / float(r["price"])
+        static[ticker] = {
+            "name": r.get("name") or fd.get_japanese_name(ticker, api_name, allow_yahoo=False),
+            "mc_per_price": (mc / last_close[ticker]) if mc and last_close.get(ticker) else 0.0,
+            "pbr_per_price": pbr_per_price,
+            "shares": shares,
+            "estimated": estimated,
+        }
+
+    all_tickers = sorted(infos)
+    existing = ast.ratios_dates()
+    written = 0
+    skipped = 0
+    for date, day in scores[scores["eligible"]].groupby("date", sort=True):
+        if since and date < since:
+            continue
+        if date in existing and not overwrite:
+            skipped += 1
+            continue
+
+        results: dict = {}
+        qualified: dict = {}
+        for row in day.itertuples(index=False):
+            st = static[row.ticker]
+            flow_details = {
+                "flow_score": row.flow_score,
+                "vol_anomaly": row.vol_anomaly,
+                "price_stability": row.price_stability,
+                "absorption": row.absorption,
+                "range_compression": row.range_compression,
+                "lower_shadow": row.lower_shadow,
+            }
+            market_cap_oku = round(st["mc_per_price"] * row.close / 1e8, 0)
+            pbr = st["pbr_per_price"] * row.close if st["pbr_per_price"] else None
+            result = fd.build_result_record(
+                row.ticker,
+                name=st["name"],
+                latest_price=row.close,
+                vol_ratio=row.vol_ratio,
+                price_change_5d=row.price_change_5d,
+                flow_details=flow_details,
+                flow_streak_high=int(row.flow_streak_high),
+                market_cap_oku=market_cap_oku,
+                pbr=pbr,
+                shares_outstanding=st["shares"],
+                shares_outstanding_is_estimated=st["estimated"],
+                updated_at=updated_at,
+            )
+            results[row.ticker] = result
+            if result["in_cap_range"] and row.flow_score >= fd.FLOW_SCORE_MEDIUM:
+                qualified[row.ticker] = result
+
+        output = fd.build_ratios_output(
+            results,
+            qualified,
+            updated_at=updated_at,
+            date=date,
+            target_universe_size=len(all_tickers),
+            missing_universe=sorted(set(all_tickers) - set(results)),
+            run_mode="backfill",
+        )
+        ast.archive_ratios(output, updated_at=updated_at)
+        written += 1
+
+    print(f"💾 data/archive/dates/ に {written} 日分の ratios を書き出し（既存のためスキップ {skipped} 日分）")
+    if overwrite and written:
+        # 差し替えた日の以前の ratios.json を消す
+        print(f"🧹 参照されなくなったアーカイブの中身 {ast.prune_objects()} 件を削除")
+    print(f"⏱️ 所要時間: {time.perf_counter() - started:.1f} 秒")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="保存済み履歴から過去日の ratios.json を再構築する")
+    parser.add_argument("--since", help="この日（YYYY-MM-DD）以降だけを書き出す")
+    parser.add_argument("--overwrite", action="store_true", help="既存のアーカイブも作り直す")
+    args = parser.parse_args()
+    backfill(since=args.since, overwrite=args.overwrite)
+
+
+if __name__ == "__main__":
+    main()
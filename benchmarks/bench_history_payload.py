@@ -0,0 +1,118 @@
+"""
+履歴ペイロード生成のベンチマーク（従来の要素ごとの内包表記 vs history_payload の一括変換）
+
+  python benchmarks/bench_history_payload.py [--tickers 1200] [--bars 250] [--repeat 3]
+
+既定は 1200 銘柄 × 250 本 = 30万本（1回の実行で扱う量の目安）。
+両方の結果が一致することを確かめてから時間を表示する。
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import history_payload as hp  # noqa: E402
+import kabuplus_client as kp  # noqa: E402
+
+
+def make_panel(tickers: int, bars: int, seed: int = 0) -> pd.DataFrame:
+    """KABU+ の縦持ち株価パネルと同じ列を持つ合成データ"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end="2026-10-16", periods=bars)
+    codes = np.repeat([str(1300 + i) for i in range(tickers)], bars)
+    base = np.repeat(rng.uniform(100, 20000, tickers), bars)
+    walk = np.exp(np.cumsum(rng.normal(0, 0.02, tickers * bars)).reshape(tickers, bars) * 0.1).ravel()
+    close = np.round(base * walk, 1)
+    return pd.DataFrame({
+        "code": codes,
+        "timestamp": np.tile(dates.strftime("%Y-%m-%d"), tickers),
+        "open": np.round(close * rng.uniform(0.98, 1.02, close.size), 1),
+        "high": np.round(close * 1.03, 2),
+        "low": np.round(close * 0.97, 2),
+        "price": close,
+        "volume": rng.integers(0, 5_000_000, close.size).astype(float),
+    })
+
+
+def legacy_lookup(df: pd.DataFrame, min_bars: int = 30) -> dict:
+    """変更前の build_history_lookup（要素ごとの round / int / strftime）"""
+    lookup: dict = {}
+    df = df.copy()
+    df["Date"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    for code, g in df.groupby("code", sort=False):
+        g = g.sort_values("Date").drop_duplicates(subset=["Date"], keep="last")
+        if len(g) < min_bars:
+            continue
+        lookup[f"{code}.T"] = {
+            "dates": [d.strftime("%Y-%m-%d") for d in g["Date"]],
+            "O": [round(float(v), 1) for v in g["open"]],
+            "H": [round(float(v), 1) for v in g["high"]],
+            "L": [round(float(v), 1) for v in g["low"]],
+            "C": [round(float(v), 1) for v in g["price"]],
+            "V": [int(float(v)) for v in g["volume"]],
+        }
+    return lookup
+
+
+def legacy_frame_payload(df: pd.DataFrame) -> dict:
+    """変更前の fetch_volume_data の hist_payload"""
+    return {
+        "dates": [d.strftime("%Y-%m-%d") for d in df.index],
+        "O": [round(float(v), 1) for v in df["Open"]],
+        "H": [round(float(v), 1) for v in df["High"]],
+        "L": [round(float(v), 1) for v in df["Low"]],
+        "C": [round(float(v), 1) for v in df["Close"]],
+        "V": [int(float(v)) for v in df["Volume"]],
+    }
+
+
+def to_frames(lookup: dict) -> list[pd.DataFrame]:
+    frames = []
+    for row in lookup.values():
+        frames.append(pd.DataFrame(
+            {"Open": row["O"], "High": row["H"], "Low": row["L"], "Close": row["C"], "Volume": row["V"]},
+            index=pd.to_datetime(row["dates"]),
+        ))
+    return frames
+
+
+def best_of(fn, repeat: int) -> tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="履歴ペイロード生成のベンチマーク")
+    parser.add_argument("--tickers", type=int, default=1200)
+    parser.add_argument("--bars", type=int, default=250)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    panel = make_panel(args.tickers, args.bars)
+    print(f"📦 {args.tickers} 銘柄 × {args.bars} 本 = {len(panel):,} 本")
+
+    t_old, old = best_of(lambda: legacy_lookup(panel), args.repeat)
+    t_new, new = best_of(lambda: kp.build_history_lookup(panel, min_bars=30), args.repeat)
+    assert old == new, "build_history_lookup の結果が一致しません"
+    print(f"build_history_lookup : 従来 {t_old:.3f} 秒 → 一括 {t_new:.3f} 秒（{t_old / t_new:.1f} 倍）")
+
+    frames = to_frames(new)
+    t_old, old = best_of(lambda: [legacy_frame_payload(f) for f in frames], args.repeat)
+    t_new, new = best_of(lambda: [hp.payload_from_frame(f) for f in frames], args.repeat)
+    assert old == new, "fetch_volume_data のペイロードが一致しません"
+    print(f"銘柄ごとのペイロード : 従来 {t_old:.3f} 秒 → 一括 {t_new:.3f} 秒（{t_old / t_new:.1f} 倍）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+下値ライン・高出来高ゾーンのベンチマーク（fetch_data の1銘柄用関数 vs support_zones の一括計算）
+
+  python benchmarks/bench_support_zones.py [--tickers 200] [--batch-tickers 1200]
+
+従来版は iterrows で遅いので --tickers 銘柄だけで比べ、結果が一致することを確かめる。
+一括版は --batch-tickers 銘柄（1回の実行で扱う量の目安）での所要時間も表示する。
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import fetch_data as fd  # noqa: E402
+import support_zones as sz  # noqa: E402
+
+
+def make_frames(tickers: int, seed: int = 0) -> dict[str, pd.DataFrame]:
+    """本数のばらつく合成日足（60〜260本）"""
+    rng = np.random.default_rng(seed)
+    frames = {}
+    for i in range(tickers):
+        n = int(rng.integers(60, 260))
+        close = np.round(1000 * np.exp(np.cumsum(rng.normal(0, 0.02, n))), 1)
+        frames[f"{1300 + i}.T"] = pd.DataFrame({
+            "Open": close,
+            "High": np.round(close * rng.uniform(1.0, 1.03, n), 1),
+            "Low": np.round(close * rng.uniform(0.97, 1.0, n), 1),
+            "Close": close,
+            "Volume": rng.integers(0, 1_000_000, n).astype(float),
+        }, index=pd.bdate_range(end="2026-10-16", periods=n))
+    return frames
+
+
+def legacy(frames: dict[str, pd.DataFrame]) -> dict:
+    out = {}
+    for ticker, df in frames.items():
+        d6 = df.tail(sz.SUPPORT_WINDOW)
+        support, _ = fd.compute_support_from_recent_growth(d6)
+        zone_support, zone_upper = fd.compute_support_zone_from_profile(fd.calculate_volume_profile(d6))
+        if support is None:
+            support = zone_support
+        tag, gap = fd.support_position_tag(float(d6["Close"].iloc[-1]), support)
+        out[ticker] = {
+            "support_price": None if support is None else round(support, 1),
+            "support_zone_upper": None if zone_upper is None else round(zone_upper, 1),
+            "support_position": tag,
+            "support_gap_pct": None if gap is None else round(gap, 2),
+        }
+    return out
+
+
+def batch(frames: dict[str, pd.DataFrame]) -> dict:
+    b = sz.SupportBatch()
+    for ticker, df in frames.items():
+        b.add(ticker, df)
+    return b.compute()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="下値ライン・高出来高ゾーンのベンチマーク")
+    parser.add_argument("--tickers", type=int, default=200)
+    parser.add_argument("--batch-tickers", type=int, default=1200)
+    args = parser.parse_args()
+
+    frames = make_frames(args.tickers)
+    t0 = time.perf_counter()
+    old = legacy(frames)
+    t_old = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    new = batch(frames)
+    t_new = time.perf_counter() - t0
+    assert old == new, "一括版の結果が一致しません"
+    print(f"{args.tickers} 銘柄: 従来 {t_old:.2f} 秒 → 一括 {t_new * 1000:.0f} ms（{t_old / t_new:.0f} 倍）")
+
+    frames = make_frames(args.batch_tickers, seed=1)
+    t0 = time.perf_counter()
+    batch(frames)
+    print(f"{args.batch_tickers} 銘柄: 一括 {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+M&A候補タブの表示部品（app.py と日次ジョブで共用）
+─────────────────────────────────────
+・候補レコードの表記ゆれ吸収（normalize_item / is_watch）、カードの HTML（card_html）、カード用 CSS（CARD_CSS）
+・日次ジョブは公開する世代に candidates.json / candidates.html を書き出す（write_bundle）
+  - candidates.json … ビュー（data / all_data）ごとに、正規化・並べ替え済みの候補とカード HTML、LEVEL 集計
+  - candidates.html … CSS 込みの単体ページ（検索・LEVEL・要監視の絞り込みはページ内の JS）。静的ホスティングでそのまま配信できる
+・app.py は candidates.json を読み、正規化・並べ替え・カード HTML の組み立てを毎回やり直さない
+"""
+
+from __future__ import annotations
+import html
+import re
+from pathlib import Path
+from typing import Dict, List
+
+import jsonio
+
+FLOW_SCORE_HIGH = 70
+FLOW_SCORE_MEDIUM = 40
+LEVEL_COLORS = {4: "#C41E3A", 3: "#FF9800", 2: "#FFC107", 1: "#5C6BC0", 0: "#9E9E9E"}
+
+STATE_HELP = {
+    "要監視": "変化が強めです。優先して確認します。",
+    "観測中": "変化の兆しがあります。数日単位で見守ります。",
+    "沈静": "今は大きな変化が見えません。記録だけ残します。",
+}
+
+BUNDLE_JSON = "candidates.json"
+BUNDLE_HTML = "candidates.html"
+BUNDLE_VIEWS = ("data", "all_data")
+
+
+# ==========================================
+# 表記ゆれ吸収
+# ==========================================
+def norm_label(s) -> str:
+    if s is None: return ""
+    t = str(s).strip()
+    return re.sub(r'^[\s○●◎◯・\-–—★☆▶▷→⇒✓✔✅☑︎【\[\(（]+', '', t).strip()
+
+def norm_tag(t) -> str:
+    t = norm_label(t)
+    if not t: return ""
+    if "要監視" in t: return "要監視"
+    return t
+
+def tags_list(x) -> List[str]:
+    if x is None: return []
+    if isinstance(x, list): return [str(v) for v in x]
+    return [str(x)]
+
+def normalize_item(it: Dict) -> Dict:
+    d = dict(it) if isinstance(it, dict) else {}
+    raw_state = d.get("display_state", d.get("state", ""))
+    tags_raw = tags_list(d.get("tags"))
+    tags_norm = []
+    has_watch = ("要監視" in norm_label(raw_state))
+    for tg in tags_raw:
+        nt = norm_tag(tg)
+        if not nt: continue
+        if nt == "要監視": has_watch = True; continue
+        if nt in ["下側ゾーン", "上側ゾーン"]: continue
+        tags_norm.append(nt)
+    state = "要監視" if has_watch else (norm_label(raw_state) or "観測中")
+    d["display_state"] = state
+    uniq = []
+    seen = set()
+    for t in tags_norm:
+        if t not in seen:
+            seen.add(t)
+            uniq.append(t)
+    d["tags"] = uniq
+    return d
+
+def is_watch(item: dict) -> bool:
+    state = norm_label(item.get("display_state", item.get("state", "")))
+    if "要監視" in state: return True
+    for tg in tags_list(item.get("tags")):
+        if "要監視" in norm_label(tg): return True
+    return False
+
+def sort_key(entry) -> tuple:
+    """LEVEL 1から昇順（同じLEVELなら需給スコア降順）。entry は (ticker, item)"""
+    return (int(entry[1].get('level', 0)), -float(entry[1].get('flow_score', 0)))
+
+def level_counts(items: Dict) -> Dict[str, int]:
+    """LEVEL 4 / LEVEL 3+ / 総検出数"""
+    levels = [int(v.get("level", 0)) for v in items.values()]
+    return {"level4": sum(1 for lv in levels if lv == 4), "level3p": sum(1 for lv in levels if lv >= 3), "total": len(levels)}
+
+
+# ==========================================
+# カード
+# ==========================================
+CARD_CSS = """
+/* =======================================
+   Cards (スマホベース＆テーマ対応)
+   ======================================= */
+.spike-card{
+  position: relative; 
+  background-color: var(--secondary-background-color) !important; 
+  border-radius: 16px; padding: 1rem; margin-bottom: .75rem; 
+  border: 1px solid rgba(128,128,128,0.2) !important;
+  box-shadow: 0 10px 30px rgba(0,0,0,0.05);
+}
+.spike-card::before{
+  content:""; position:absolute; left:0; top:10px; bottom:10px; width:4px;
+  border-radius: 999px; background: rgba(128,128,128,0.3);
+}
+.spike-card.high{ border-color: rgba(196,30,58,0.4) !important; box-shadow: 0 10px 30px rgba(196,30,58,0.15); }
+.spike-card.high::before{ background: linear-gradient(180deg, #C41E3A 0%, #E63946 100%); }
+.spike-card.medium{ border-color: rgba(255,152,0,0.4) !important; box-shadow: 0 10px 30px rgba(255,152,0,0.15); }
+.spike-card.medium::before{ background: linear-gradient(180deg, #FF9800 0%, #FFC107 100%); }
+
+.card-header{ display:flex; justify-content:space-between; align-items:center; gap:.7rem; margin-bottom: .55rem; }
+.ticker-name a{ font-weight: 800; color: var(--text-color) !important; text-decoration:none; font-size: 1.1rem; }
+.ticker-name a:hover{ text-decoration: underline; }
+.ticker-jp-name { font-size: 0.75rem; color: var(--text-color); opacity: 0.6; margin-left: 6px; }
+
+.ratio-badge{
+  min-width: 70px; text-align:center; padding: .2rem .6rem; border-radius: 8px; font-weight: 800;
+  border: 1px solid rgba(128,128,128,0.2); background-color: var(--background-color); cursor: help;
+}
+.ratio-badge.high{ color:#FFFFFF !important; border-color: rgba(196,30,58,0.4); background: linear-gradient(135deg, #C41E3A 0%, #E63946 100%); }
+.ratio-badge.medium{ color: var(--text-color) !important; border-color: rgba(255,152,0,0.4); background: rgba(255,152,0,0.15); }
+.score-val{ font-size: 1.0rem; line-height: 1.0; }
+.score-label{ font-size: 0.55rem; line-height: 1.0; display: block; margin-bottom: 2px; opacity: 0.8;}
+
+.level-badge { padding: 3px 10px; border-radius: 12px; font-size: 0.75rem; font-weight: 700; color: white !important; }
+
+.card-body{ display:grid; grid-template-columns: repeat(4, 1fr); gap: .8rem; margin-top: .2rem; }
+.info-label{ font-size: .72rem; color: var(--text-color); opacity: 0.7; font-weight: 700; letter-spacing: .02em; }
+.info-value{ font-size: .93rem; color: var(--text-color); font-weight: 700; }
+.price-val { color: #ff4b4b !important; font-weight: 800; }
+
+.tag-container { padding: 0 0.8rem 0.5rem; font-size: 0.7rem; }
+.tag-watch { background: rgba(92,107,192,0.15); color: #5C6BC0 !important; padding: 2px 8px; border-radius: 999px; margin-right: 6px; font-weight: 700; display: inline-block; margin-bottom: 4px; }
+.tag-normal { background: var(--background-color); color: var(--text-color); border: 1px solid rgba(128,128,128,0.3); padding: 2px 8px; border-radius: 999px; margin-right: 6px; display: inline-block; margin-bottom: 4px; }
+
+/* 💻 PC版の銘柄カード最適化 */
+@media (min-width: 768px) {
+    .spike-card { padding: 1.5rem 2.0rem 0.5rem !important; margin-bottom: 1.0rem !important; }
+    .ticker-name a { font-size: 1.6rem !important; }
+    .ticker-jp-name { font-size: 1.1rem !important; margin-left: 12px !important; }
+    .card-body { display: flex !important; gap: 5rem !important; margin-top: 1.0rem !important; }
+    .info-label { font-size: 0.9rem !important; }
+    .info-value { font-size: 1.3rem !important; }
+    .price-val { font-size: 1.4rem !important; }
+    .level-badge { font-size: 1.0rem !important; padding: 5px 14px !important; }
+    .score-label { font-size: 0.75rem !important; }
+    .score-val { font-size: 1.4rem !important; }
+    .ratio-badge { padding: 0.4rem 1.0rem !important; }
+    .tag-container { padding: 1.0rem 0 0.5rem !important; }
+    .tag-watch, .tag-normal { font-size: 0.85rem !important; padding: 4px 12px !important; margin-right: 8px !important; }
+}
+"""
+
+
+def card_html(ticker: str, d: Dict, name_jp: str | None = None) -> str:
+    """銘柄カード1枚分の HTML（d は normalize_item 済みのレコード）"""
+    flow_score = d.get("flow_score", 0)
+    level = int(d.get("level", 0))
+    state = d.get("display_state", d.get("state", "観測中"))
+
+    _state_clean = norm_label(state) or str(state).strip()
+    _tip = STATE_HELP.get(_state_clean, "状態の目安です。").replace('"', "&quot;")
+    state_html = f'<span title="{_tip}" style="color:#5C6BC0;font-weight:800;">{_state_clean}</span>' if _state_clean == "要監視" else f'<span title="{_tip}">{_state_clean}</span>'
+
+    tags = d.get("tags", [])
+    if flow_score >= FLOW_SCORE_HIGH: card_class, score_class = "high", "high"
+    elif flow_score >= FLOW_SCORE_MEDIUM: card_class, score_class = "medium", "medium"
+    else: card_class, score_class = "", "normal"
+
+    level_color = LEVEL_COLORS.get(level, "#9E9E9E")
+
+    code_only = ticker.replace(".T", "")
+    url = f"https://finance.yahoo.co.jp/quote/{code_only}.T"
+    if name_jp is None:
+        name_jp = d.get("name") or code_only
+
+    tags_html = ""
+    for tag in tags[:4]:
+        if tag == "要監視":
+            tags_html += f'<span class="tag-watch">要監視</span>'
+        else:
+            tags_html += f'<span class="tag-normal">{tag}</span>'
+
+    score_text = f"{flow_score}"
+    level_text = f"LEVEL {level}" if level > 0 else "LEVEL -"
+
+    return f"""
+    <div class="spike-card {card_class}">
+        <div class="card-header">
+            <div class="ticker-name">
+                <a href="{url}" target="_blank">{code_only}</a>
+                <span class="ticker-jp-name">{str(name_jp)[:12]}</span>
+            </div>
+            <div style="display:flex;align-items:center;gap:8px;">
+                <span class="level-badge" style="background:{level_color};">{level_text}</span>
+                <div class="ratio-badge {score_class}" title="※直近の出来高変化等を示す独自スコア">
+                    <span class="score-label">需給スコア</span>
+                    <span class="score-val">{score_text}</span>
+                </div>
+            </div>
+        </div>
+        <div class="card-body">
+            <div><span class="info-label">現在値</span><br><span class="info-value price-val">¥{d.get('price',0):,.0f}</span></div>
+            <div><span class="info-label">状態</span><br><span class="info-value">{state_html}</span></div>
+            <div><span class="info-label">時価総額</span><br><span class="info-value">{d.get('market_cap_oku',0):,}億円</span></div>
+            <div><span class="info-label">出来高</span><br><span class="info-value">{d.get('vol_ratio', 0)}x</span></div>
+        </div>
+        <div class="tag-container">{tags_html}</div>
+    </div>
+    """
+
+
+def summary_html(counts: Dict[str, int]) -> str:
+    """LEVEL 4 / LEVEL 3+ / 総検出数 の集計バー"""
+    return f"""
+            <div style="display: flex; justify-content: space-around; align-items: center; background-color: var(--secondary-background-color); 
+                        border: 1px solid rgba(128,128,128,0.2); border-radius: 12px; padding: 0.8rem; margin-bottom: 0.5rem; 
+                        box-shadow: 0 4px 15px rgba(0,0,0,0.05);">
+                <div style="text-align: center;">
+                    <div style="opacity: 0.7; font-size: 0.75rem; font-weight: 700;">LEVEL 4</div>
+                    <div style="color: #C41E3A; font-size: 1.4rem; font-weight: 900;">{counts['level4']}<span style="font-size: 0.8rem; opacity: 0.6; font-weight: 600; margin-left: 2px;">件</span></div>
+                </div>
+                <div style="width: 1px; height: 40px; background: rgba(128,128,128,0.2);"></div>
+                <div style="text-align: center;">
+                    <div style="opacity: 0.7; font-size: 0.75rem; font-weight: 700;">LEVEL 3+</div>
+                    <div style="color: #FF9800; font-size: 1.4rem; font-weight: 900;">{counts['level3p']}<span style="font-size: 0.8rem; opacity: 0.6; font-weight: 600; margin-left: 2px;">件</span></div>
+                </div>
+                <div style="width: 1px; height: 40px; background: rgba(128,128,128,0.2);"></div>
+                <div style="text-align: center;">
+                    <div style="opacity: 0.7; font-size: 0.75rem; font-weight: 700;">総検出数</div>
+                    <div style="font-size: 1.4rem; font-weight: 900;">{counts['total']}<span style="font-size: 0.8rem; opacity: 0.6; font-weight: 600; margin-left: 2px;">件</span></div>
+                </div>
+            </div>
+            """
+
+
+# ==========================================
+# 静的バンドル（日次ジョブが世代ごとに書き出す）
+# ==========================================
+def build_bundle(ratios: Dict, generation: str | None = None, name_resolver=None) -> Dict:
+    """
+    ratios（v1 形式）から候補バンドルを作る。
+    name_resolver(ticker, name) -> 表示名 を渡すと、カードの銘柄名をそれで解決する。
+    """
+    views = {}
+    for view in BUNDLE_VIEWS:
+        items = {tk: normalize_item(it) for tk, it in (ratios.get(view) or {}).items()}
+        entries = []
+        for ticker, d in sorted(items.items(), key=sort_key):
+            name = d.get("display_name") or (name_resolver(ticker, d.get("name")) if name_resolver else None) \
+                or d.get("name") or ticker.replace(".T", "")
+            d["name"] = name
+            entries.append({
+                "ticker": ticker,
+                "item": d,
+                "watch": is_watch(d),
+                "card_html": card_html(ticker, d, name),
+            })
+        views[view] = {"counts": level_counts(items), "entries": entries}
+    return {
+        "generation": generation,
+        "updated_at": ratios.get("updated_at"),
+        "date": ratios.get("date"),
+        "views": views,
+    }
+
+
+_PAGE_CSS = """
+:root { --background-color:#FFFFFF; --secondary-background-color:#F5F7FA; --text-color:#0F172A; }
+@media (prefers-color-scheme: dark) {
+  :root { --background-color:#0E1117; --secondary-background-color:#1A1D24; --text-color:#FAFAFA; }
+}
+body { margin:0; background:var(--background-color); color:var(--text-color);
+       font-family:'Inter', -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif; }
+main { max-width:1080px; margin:0 auto; padding:1.5rem 1.2rem 3rem; }
+h1 { text-align:center; font-size:1.55rem; font-weight:800; margin:0 0 .2rem; }
+.caption { text-align:center; opacity:.7; font-size:.85rem; margin-bottom:1rem; }
+.filters { display:flex; flex-wrap:wrap; gap:.6rem; justify-content:center; align-items:center; margin:.8rem 0 1rem; font-size:.85rem; }
+.filters input[type=search], .filters select { padding:.4rem .6rem; border-radius:8px; border:1px solid rgba(128,128,128,0.3);
+       background:var(--secondary-background-color); color:var(--text-color); }
+.view { display:none; } .view.active { display:block; }
+.empty { text-align:center; opacity:.7; padding:2rem 0; }
+"""
+
+_PAGE_JS = """
+(function () {
+  const $ = (s) => document.querySelector(s);
+  function apply() {
+    const view = $('#f-all').checked ? 'all_data' : 'data';
+    const q = $('#f-q').value.trim().toLowerCase();
+    const minLv = parseInt($('#f-level').value, 10);
+    const exact4 = $('#f-level').value === '4only';
+    const watch = $('#f-watch').checked;
+    document.querySelectorAll('.view').forEach((v) => v.classList.toggle('active', v.dataset.view === view));
+    let shown = 0;
+    document.querySelectorAll('.view.active .card').forEach((c) => {
+      const lv = parseInt(c.dataset.level, 10);
+      let ok = exact4 ? lv === 4 : lv >= (isNaN(minLv) ? 0 : minLv);
+      if (ok && watch && c.dataset.watch !== '1') ok = false;
+      if (ok && q && !c.dataset.search.includes(q)) ok = false;
+      c.style.display = ok ? '' : 'none';
+      if (ok) shown++;
+    });
+    document.querySelector('.view.active .empty').style.display = shown ? 'none' : '';
+  }
+  ['#f-all', '#f-q', '#f-level', '#f-watch'].forEach((s) => $(s).addEventListener('input', apply));
+  apply();
+})();
+"""
+
+
+def render_bundle_html(bundle: Dict) -> str:
+    """バンドルを CSS・JS 込みの単体 HTML ページにする"""
+    sections = []
+    for view in BUNDLE_VIEWS:
+        v = bundle["views"].get(view) or {"counts": level_counts({}), "entries": []}
+        cards = []
+        for e in v["entries"]:
+            search = html.escape(f"{e['ticker']} {e['item'].get('name') or ''}".lower(), quote=True)
+            cards.append(
+                f'<div class="card" data-level="{int(e["item"].get("level", 0))}" '
+                f'data-watch="{1 if e["watch"] else 0}" data-search="{search}">{e["card_html"]}</div>'
+            )
+        sections.append(
+            f'<section class="view" data-view="{view}">{summary_html(v["counts"])}'
+            f'{"".join(cards)}<div class="empty">該当する銘柄がありません</div></section>'
+        )
+    updated = html.escape(str(bundle.get("updated_at") or "不明"))
+    return f"""<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>ハゲタカSCOPE - M&amp;A候補</title>
+<style>{_PAGE_CSS}{CARD_CSS}</style>
+</head>
+<body>
+<main>
+<h1>🦅 HAGETAKA SCOPE</h1>
+<div class="caption">📡 最終更新: {updated}</div>
+<div class="filters">
+  <label><input type="checkbox" id="f-all"> 中型株以外も表示</label>
+  <input type="search" id="f-q" placeholder="検索">
+  <select id="f-level">
+    <option value="0">すべて</option><option value="4only">LEVEL 4 のみ</option>
+    <option value="3">LEVEL 3 以上</option><option value="2">LEVEL 2 以上</option><option value="1">LEVEL 1 以上</option>
+  </select>
+  <label><input type="checkbox" id="f-watch"> 要監視のみ</label>
+</div>
+{"".join(sections)}
+</main>
+<script>{_PAGE_JS}</script>
+</body>
+</html>
+"""
+
+
+def write_bundle(out_dir: Path, ratios: Dict, generation: str | None = None, name_resolver=None) -> Dict:
+    """out_dir（作成中の世代ディレクトリ）に candidates.json / candidates.html を書き出し、バンドルを返す"""
+    out_dir = Path(out_dir)
+    bundle = build_bundle(ratios, generation=generation, name_resolver=name_resolver)
+    jsonio.write_json(out_dir / BUNDLE_JSON, bundle)
+    (out_dir / BUNDLE_HTML).write_text(render_bundle_html(bundle), encoding="utf-8")
+    return bundle
+
+
+def load_bundle(path: Path) -> Dict:
+    """candidates.json を読む（なければ空 dict）"""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    try:
+        return jsonio.read_json(path)
+    except Exception:
+        return {}
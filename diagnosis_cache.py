@@ -0,0 +1,151 @@
+"""
+ハゲタカ診断のディスクキャッシュ（SQLite・WAL モード）
+─────────────────────────────────────
+st.cache_data はプロセスごとのメモリにしか残らないため、再起動・再デプロイ・複数ワーカーのたびに
+同じ銘柄のフォールバック取得（Yahoo / Stooq / kabuoji3）をやり直していた。その下にプロセス共有のキャッシュを置く。
+
+  data/cache/diagnosis.sqlite3（.gitignore 済み）
+  entries(kind, key, generation) → payload（pickle）, 期限, 最終アクセス, サイズ
+
+・kind … "ohlcv"（取得した日足）/ "diagnosis"（診断結果一式）など。generation は公開中のスナップショット世代
+  （新しい世代が公開されればキーが変わるので、古い世代の行は期限切れか容量超過で消える）
+・期限（ttl 秒）を過ぎた行は読まない。合計サイズが max_bytes を超えたら最終アクセスの古い順に削除
+・接続はスレッドごと。WAL なので読み手は書き手を待たず、書き込みどうしは busy_timeout の間待つ
+・キャッシュの失敗（壊れたファイル・ロック待ちの超過など）は診断を止めない。読めなければ「なし」、書けなければ何もしない
+"""
+
+from __future__ import annotations
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+CACHE_PATH = Path("data/cache/diagnosis.sqlite3")
+MAX_BYTES = 256 * 1024 * 1024
+# 容量超過時はこの割合まで減らす（毎回の書き込みで削除が走らないように）
+EVICT_TO_RATIO = 0.8
+# 何回書き込むごとに容量を確認するか
+EVICT_CHECK_EVERY = 32
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    generation TEXT NOT NULL,
+    created REAL NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL,
+    payload BLOB NOT NULL,
+    PRIMARY KEY (kind, key, generation)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires);
+"""
+
+
+class DiagnosisCache:
+    def __init__(self, path: Path = CACHE_PATH, max_bytes: int = MAX_BYTES, busy_timeout: float = 5.0):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _gen(generation: str | None) -> str:
+        return generation or ""
+
+    def get(self, kind: str, key: str, generation: str | None) -> Any | None:
+        """期限内の値（なければ None）。読んだ行は最終アクセスを更新する"""
+        try:
+            conn = self._conn()
+            now = time.time()
+            row = conn.execute(
+                "SELECT payload, expires FROM entries WHERE kind=? AND key=? AND generation=?",
+                (kind, key, self._gen(generation)),
+            ).fetchone()
+            if row is None or row[1] < now:
+                return None
+            conn.execute(
+                "UPDATE entries SET accessed=? WHERE kind=? AND key=? AND generation=?",
+                (now, kind, key, self._gen(generation)),
+            )
+            return pickle.loads(row[0])
+        except Exception:
+            return None
+
+    def put(self, kind: str, key: str, generation: str | None, value: Any, ttl: float) -> None:
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            now = time.time()
+            self._conn().execute(
+                "INSERT OR REPLACE INTO entries (kind, key, generation, created, expires, accessed, size, payload)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, key, self._gen(generation), now, now + ttl, now, len(payload), payload),
+            )
+        except Exception:
+            return
+        with self._lock:
+            self._writes += 1
+            check = self._writes % EVICT_CHECK_EVERY == 1
+        if check:
+            self.evict()
+
+    def delete(self, kind: str, key: str, generation: str | None = None) -> None:
+        """kind・key の行を削除（generation を省略すると全世代）"""
+        try:
+            if generation is None:
+                self._conn().execute("DELETE FROM entries WHERE kind=? AND key=?", (kind, key))
+            else:
+                self._conn().execute(
+                    "DELETE FROM entries WHERE kind=? AND key=? AND generation=?", (kind, key, self._gen(generation))
+                )
+        except Exception:
+            pass
+
+    def evict(self) -> int:
+        """期限切れの行を消し、まだ max_bytes を超えていれば最終アクセスの古い順に消す。消した行数を返す"""
+        try:
+            conn = self._conn()
+            removed = conn.execute("DELETE FROM entries WHERE expires < ?", (time.time(),)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return removed
+            target = total - int(self.max_bytes * EVICT_TO_RATIO)
+            freed = 0
+            victims = []
+            for kind, key, gen, size in conn.execute(
+                "SELECT kind, key, generation, size FROM entries ORDER BY accessed"
+            ):
+                victims.append((kind, key, gen))
+                freed += size
+                if freed >= target:
+                    break
+            conn.executemany("DELETE FROM entries WHERE kind=? AND key=? AND generation=?", victims)
+            return removed + len(victims)
+        except Exception:
+            return 0
+
+    def stats(self) -> dict:
+        try:
+            rows = self._conn().execute(
+                "SELECT kind, COUNT(*), COALESCE(SUM(size), 0) FROM entries GROUP BY kind"
+            ).fetchall()
+            return {kind: {"entries": n, "bytes": size} for kind, n, size in rows}
+        except Exception:
+            return {}
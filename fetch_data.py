@@ -5,8 +5,15 @@ HAGETAKA SCOPE - 日次候補抽出（GitHub Actions用）
 - 本ツールは補助ツールであり、銘柄推奨・売買助言ではありません
 
 出力：
-- data/ratios.json … 候補（data）・参考（all_data）
-- data/history/shard_XX.json（64分割）… 診断用OHLCV+info。FULL_UNIVERSE=1 でJPX上場（プライム・スタンダード・グロース）をスキャン
+- data/snapshots/<世代>/ … 1回の実行で作る1組（ratios.json・missing_universe.json・history/）。
+  作業用ディレクトリに書き終えてから data/CURRENT の置き換えで公開する（snapshot_store.py）
+- ratios.json … 候補（data）・参考（all_data）
+- candidates.json / candidates.html … M&A候補タブの静的バンドル（正規化・並べ替え・カード HTML 済み。HTML は単体で配信可）
+- data/archive/ … 公開した世代を取引日ごとに保存（日付別の唯一の記録。中身は SHA-256 で重複排除し、履歴は足の日ごとの塊で持つ。
+  archive_store.load_state_as_of で D 日時点を読める。過去分の ratios は backfill.py で再構築）
+- data/indicators/indicators_YYYY-MM-DD.json … 当日の指標（PBR・EPS・発行済株式数など）を銘柄×項目の列形式で保存
+- data/retry_queue.json … 当日の未取得銘柄と理由・再試行時刻（再取得フェーズはここから再試行できる銘柄だけを処理）
+- history/shard_XX.json（64分割）… 診断用OHLCV+info。FULL_UNIVERSE=1 でJPX上場（プライム・スタンダード・グロース）をスキャン
 
 注意（全銘柄スキャン時）:
 - 実行は 1〜数時間かかることがある / GitHub Actions の timeout-minutes を十分に取ること
@@ -14,11 +21,10 @@ HAGETAKA SCOPE - 日次候補抽出（GitHub Actions用）
 - ローカルで短時間テストするときは FULL_UNIVERSE=0（固定辞書のみ）
 """
 
-import hashlib
 import io
-import json
 import os
 import re
+import shutil
 from datetime import datetime
 from pathlib import Path
 import time
@@ -26,10 +32,22 @@ import time
 import numpy as np
 import pandas as pd
 import pytz
-import requests
 import yfinance as yf
 
+import archive_store as ast
+import candidate_view as cv
+import history_payload as hp
+import history_store as hs
 import kabuplus_client as kp
+import name_resolver as nr
+import indicator_store as ist
+import info_snapshot as isn
+import jsonio
+import ratios_store as rs
+import snapshot_store as ss
+import support_zones as sz
+import replay_bundle as rb
+import retry_queue as rq
 
 
 def calculate_volume_profile(df: pd.DataFrame, bins: int = 24) -> pd.DataFrame:
@@ -104,6 +122,7 @@ def calculate_volume_profile_with_bins(df: pd.DataFrame, price_bins: np.ndarray)
     return pd.DataFrame(volume_profile)
 
 
+# 以下3つは1銘柄用の基準実装。日次ジョブは support_zones.SupportBatch（同じ定義の一括版）で全銘柄まとめて計算する
 def compute_support_from_recent_growth(
     df: pd.DataFrame,
     bins: int = 24,
@@ -214,1031 +233,30 @@ FLOW_SCORE_MEDIUM = 40.0
 TARGET_UNIVERSE_SIZE = int(os.environ.get("TARGET_UNIVERSE_SIZE", "1200"))
 ALLOW_YFINANCE_FALLBACK = os.environ.get("ALLOW_YFINANCE_FALLBACK", "0").strip() in ("1", "true", "True")
 
+# 実行時間の予算（秒, 0=無制限）。予算から予備時間を引いた時点で銘柄処理を打ち切り、残りは未取得扱いで保存する
+FETCH_TIME_BUDGET_SEC = float(os.environ.get("FETCH_TIME_BUDGET_SEC", "0") or 0)
+FETCH_TIME_RESERVE_SEC = float(os.environ.get("FETCH_TIME_RESERVE_SEC", "120") or 0)
+
 
 # ==========================================
-# 日本語銘柄名辞書（固定リスト）
+# 日本語銘柄名辞書（固定リスト。data/ticker_name_master.json）
 # ==========================================
-TICKER_NAMES = {
-    # === 情報・通信・IT ===
-    "3655.T": "ブレインパッド",
-    "3681.T": "ブイキューブ",
-    "3697.T": "SHIFT",
-    "3765.T": "ガンホー・オンライン・エンターテイメント",
-    "3769.T": "GMOペイメントゲートウェイ",
-    "3788.T": "GMOグローバルサイン・ホールディングス",
-    "3900.T": "クラウドワークス",
-    "3914.T": "JIG-SAW",
-    "3915.T": "テラスカイ",
-    "3916.T": "デジタル・インフォメーション・テクノロジー",
-    "3917.T": "アイリッジ",
-    "3918.T": "PCIホールディングス",
-    "3919.T": "パイプドHD",
-    "3920.T": "アイビーシー",
-    "3921.T": "ネオジャパン",
-    "3922.T": "PR TIMES",
-    "3923.T": "ラクス",
-    "3925.T": "ダブルスタンダード",
-    "3926.T": "オープンドア",
-    "3927.T": "フーバーブレイン",
-    "3928.T": "マイネット",
-    "3930.T": "はてな",
-    "3932.T": "アカツキ",
-    "3933.T": "チエル",
-    "3934.T": "ベネフィットジャパン",
-    "3935.T": "エディア",
-    "3936.T": "グローバルウェイ",
-    "3937.T": "Ubicomホールディングス",
-    "3939.T": "カナミックネットワーク",
-    "3962.T": "チェンジホールディングス",
-    "3966.T": "ユーザベース",
-    "3967.T": "エルテス",
-    "3968.T": "セグエグループ",
-    "3969.T": "エイトレッド",
-    "3970.T": "イノベーション",
-    "3978.T": "マクロミル",
-    "3979.T": "うるる",
-    "3981.T": "ビーグリー",
-    "3983.T": "オロ",
-    "3984.T": "ユーザーローカル",
-    "3985.T": "テモナ",
-    "3986.T": "ビーブレイクシステムズ",
-    "3987.T": "エコモット",
-    "3988.T": "SYSホールディングス",
-    "3989.T": "シェアリングテクノロジー",
-    "3990.T": "UUUM",
-    "3991.T": "ウォンテッドリー",
-    "3992.T": "ニーズウェル",
-    "3993.T": "PKSHA Technology",
-    "3994.T": "マネーフォワード",
-    "3995.T": "SKIYAKI",
-    "3996.T": "サインポスト",
-    "3997.T": "トレードワークス",
-    "3998.T": "すららネット",
-    "3999.T": "ナレッジスイート",
-    "4011.T": "ヘッドウォータース",
-    "4054.T": "日本情報クリエイト",
-    "4057.T": "インターファクトリー",
-    "4165.T": "プレイド",
-    "4167.T": "ココペリ",
-    "4168.T": "ヤプリ",
-    "4169.T": "ENECHANGE",
-    "4170.T": "Kaizen Platform",
-    "4173.T": "WACUL",
-    "4174.T": "アピリッツ",
-    "4176.T": "ココナラ",
-    "4180.T": "Appier Group",
-    "4194.T": "ビジョナル",
-    "4255.T": "THECOO",
-    "4259.T": "エクサウィザーズ",
-    "4261.T": "アジアクエスト",
-    "4384.T": "ラクスル",
-    "4385.T": "メルカリ",
-    "4387.T": "ZUU",
-    "4388.T": "エーアイ",
-    "4392.T": "FIG",
-    "4393.T": "バンク・オブ・イノベーション",
-    "4431.T": "スマレジ",
-    "4434.T": "サーバーワークス",
-    "4435.T": "カオナビ",
-    "4436.T": "ミンカブ・ジ・インフォノイド",
-    "4441.T": "トビラシステムズ",
-    "4442.T": "バルテスホールディングス",
-    "4443.T": "Sansan",
-    "4444.T": "インフォネット",
-    "4446.T": "Link-U",
-    "4448.T": "Chatwork",
-    "4449.T": "ギフティ",
-    "4450.T": "パワーソリューションズ",
-    "4475.T": "HENNGE",
-    "4476.T": "AI CROSS",
-    "4477.T": "BASE",
-    "4478.T": "フリー",
-    "4480.T": "メドレー",
-    "4482.T": "ウィルズ",
-    "4483.T": "JMDC",
-    "4484.T": "ランサーズ",
-    "4485.T": "JTOWER",
-    "4486.T": "ユナイトアンドグロウ",
-    "4487.T": "スペースマーケット",
-    "4488.T": "AI inside",
-    "4490.T": "ビザスク",
-    "4491.T": "コンピューターマネージメント",
-    "4493.T": "サイバーセキュリティクラウド",
-    "4494.T": "バリオセキュア",
-    "4495.T": "アイキューブドシステムズ",
-    "4496.T": "コマースOneホールディングス",
-    "4497.T": "ロコガイド",
-    "4498.T": "サイバートラスト",
-    "4499.T": "Speee",
-    "4751.T": "サイバーエージェント",
-    "6035.T": "IRジャパンホールディングス",
-    "9479.T": "インプレスホールディングス",
-    "9558.T": "ジャパニアス",
-
-    # === 半導体・電子部品 ===
-    "3132.T": "マクニカホールディングス",
-    "6146.T": "ディスコ",
-    "6266.T": "タツモ",
-    "6315.T": "TOWA",
-    "6323.T": "ローツェ",
-    "6506.T": "安川電機",
-    "6594.T": "ニデック",
-    "6645.T": "オムロン",
-    "6677.T": "エスケーエレクトロニクス",
-    "6723.T": "ルネサスエレクトロニクス",
-    "6727.T": "ワコム",
-    "6728.T": "アルバック",
-    "6750.T": "エレコム",
-    "6754.T": "アンリツ",
-    "6755.T": "富士通ゼネラル",
-    "6758.T": "ソニーグループ",
-    "6762.T": "TDK",
-    "6769.T": "ザインエレクトロニクス",
-    "6770.T": "アルプスアルパイン",
-    "6779.T": "日本電波工業",
-    "6800.T": "ヨコオ",
-    "6804.T": "ホシデン",
-    "6806.T": "ヒロセ電機",
-    "6807.T": "日本航空電子工業",
-    "6814.T": "古野電気",
-    "6817.T": "スミダコーポレーション",
-    "6841.T": "横河電機",
-    "6844.T": "新電元工業",
-    "6845.T": "アズビル",
-    "6855.T": "日本電子材料",
-    "6856.T": "堀場製作所",
-    "6857.T": "アドバンテスト",
-    "6858.T": "小野測器",
-    "6861.T": "キーエンス",
-    "6864.T": "エヌエフホールディングス",
-    "6866.T": "日置電機",
-    "6869.T": "シスメックス",
-    "6871.T": "日本マイクロニクス",
-    "6877.T": "OBARA GROUP",
-    "6879.T": "IMAGICA GROUP",
-    "6881.T": "キョウデン",
-    "6882.T": "三社電機製作所",
-    "6890.T": "フェローテックホールディングス",
-    "6902.T": "デンソー",
-    "6905.T": "コーセル",
-    "6908.T": "イリソ電子工業",
-    "6914.T": "オプテックスグループ",
-    "6918.T": "アバールデータ",
-    "6920.T": "レーザーテック",
-    "6923.T": "スタンレー電気",
-    "6925.T": "ウシオ電機",
-    "6929.T": "日本セラミック",
-    "6932.T": "遠藤照明",
-    "6937.T": "古河電池",
-    "6941.T": "山一電機",
-    "6951.T": "日本電子",
-    "6952.T": "カシオ計算機",
-    "6954.T": "ファナック",
-    "6955.T": "FDK",
-    "6958.T": "日本シイエムケイ",
-    "6961.T": "エンプラス",
-    "6962.T": "大真空",
-    "6963.T": "ローム",
-    "6965.T": "浜松ホトニクス",
-    "6966.T": "三井ハイテック",
-    "6967.T": "新光電気工業",
-    "6971.T": "京セラ",
-    "6976.T": "太陽誘電",
-    "6981.T": "村田製作所",
-    "6986.T": "双葉電子工業",
-    "6988.T": "日東電工",
-    "6989.T": "北陸電気工業",
-    "6995.T": "東海理化電機製作所",
-    "6996.T": "ニチコン",
-    "6997.T": "日本ケミコン",
-    "7735.T": "SCREENホールディングス",
-    "7752.T": "リコー",
-
-    # === バイオ・ヘルスケア・医薬品 ===
-    "2183.T": "リニカル",
-    "2370.T": "メディネット",
-    "2372.T": "アイロムグループ",
-    "2395.T": "新日本科学",
-    "3386.T": "コスモ・バイオ",
-    "4540.T": "ツムラ",
-    "4543.T": "テルモ",
-    "4547.T": "キッセイ薬品工業",
-    "4548.T": "生化学工業",
-    "4549.T": "栄研化学",
-    "4550.T": "日水製薬",
-    "4551.T": "鳥居薬品",
-    "4552.T": "JCRファーマ",
-    "4553.T": "東和薬品",
-    "4554.T": "富士製薬工業",
-    "4555.T": "沢井製薬",
-    "4556.T": "カイノス",
-    "4557.T": "医学生物学研究所",
-    "4558.T": "中京医薬品",
-    "4559.T": "ゼリア新薬工業",
-    "4560.T": "日本ケミファ",
-    "4563.T": "アンジェス",
-    "4565.T": "そーせいグループ",
-    "4566.T": "LTTバイオファーマ",
-    "4568.T": "第一三共",
-    "4569.T": "キョーリン製薬ホールディングス",
-    "4570.T": "免疫生物研究所",
-    "4571.T": "ナノキャリア",
-    "4572.T": "カルナバイオサイエンス",
-    "4574.T": "大幸薬品",
-    "4575.T": "キャンバス",
-    "4577.T": "ダイト",
-    "4578.T": "大塚ホールディングス",
-    "4579.T": "ラクオリア創薬",
-    "4581.T": "大正製薬ホールディングス",
-    "4582.T": "シンバイオ製薬",
-    "4583.T": "カイオム・バイオサイエンス",
-    "4584.T": "キッズウェル・バイオ",
-    "4586.T": "メドレックス",
-    "4587.T": "ペプチドリーム",
-    "4588.T": "オンコリスバイオファーマ",
-    "4591.T": "リボミック",
-    "4592.T": "サンバイオ",
-    "4593.T": "ヘリオス",
-    "4595.T": "ミズホメディー",
-    "4596.T": "窪田製薬ホールディングス",
-    "4597.T": "ソレイジア・ファーマ",
-    "4598.T": "Delta-Fly Pharma",
-
-    # === EC・サービス・人材 ===
-    "2124.T": "JAC Recruitment",
-    "2127.T": "日本M&Aセンターホールディングス",
-    "2175.T": "エス・エム・エス",
-    "2181.T": "パーソルホールディングス",
-    "2193.T": "クックパッド",
-    "2371.T": "カカクコム",
-    "2379.T": "ディップ",
-    "2412.T": "ベネフィット・ワン",
-    "2413.T": "エムスリー",
-    "2427.T": "アウトソーシング",
-    "2432.T": "ディー・エヌ・エー",
-    "2440.T": "ぐるなび",
-    "2453.T": "ジャパンベストレスキューシステム",
-    "2454.T": "オールアバウト",
-    "2461.T": "ファンコミュニケーションズ",
-    "2462.T": "ライク",
-    "2477.T": "手間いらず",
-    "2491.T": "バリューコマース",
-    "2492.T": "インフォマート",
-    "2497.T": "ユナイテッド",
-    "3031.T": "ラクーンホールディングス",
-    "3046.T": "ジンズホールディングス",
-    "3048.T": "ビックカメラ",
-    "3050.T": "DCMホールディングス",
-    "3064.T": "MonotaRO",
-    "3076.T": "あいホールディングス",
-    "3088.T": "マツキヨココカラ＆カンパニー",
-    "3092.T": "ZOZO",
-    "3093.T": "トレジャー・ファクトリー",
-    "3134.T": "Hamee",
-    "3135.T": "マーケットエンタープライズ",
-    "3159.T": "丸善CHIホールディングス",
-    "3167.T": "TOKAIホールディングス",
-    "3176.T": "三洋貿易",
-    "3179.T": "シュッピン",
-    "3180.T": "ビューティガレージ",
-    "3182.T": "オイシックス・ラ・大地",
-    "3183.T": "ウイン・パートナーズ",
-    "3186.T": "ネクステージ",
-    "3193.T": "鳥貴族ホールディングス",
-    "3196.T": "ホットランド",
-    "3222.T": "ユナイテッド・スーパーマーケット・ホールディングス",
-    "3244.T": "サムティ",
-    "3254.T": "プレサンスコーポレーション",
-    "3277.T": "サンセイランディック",
-    "3284.T": "フージャースホールディングス",
-    "3288.T": "オープンハウスグループ",
-    "3289.T": "東急不動産ホールディングス",
-    "6560.T": "LTS",
-    "7342.T": "ウェルスナビ",
-
-    # === ゲーム・エンタメ ===
-    "3656.T": "KLab",
-    "3659.T": "ネクソン",
-    "3662.T": "エイチーム",
-    "3668.T": "コロプラ",
-    "3672.T": "オルトプラス",
-    "3678.T": "メディアドゥ",
-    "3679.T": "じげん",
-    "3687.T": "フィックスターズ",
-    "3689.T": "イグニス",
-    "3696.T": "セレス",
-    "3698.T": "CRI・ミドルウェア",
-    "3739.T": "コムシード",
-    "3760.T": "ケイブ",
-    "3782.T": "ディー・ディー・エス",
-    "3793.T": "ドリコム",
-    "3810.T": "サイバーステップ",
-    "3825.T": "リミックスポイント",
-    "3835.T": "eBASE",
-    "3836.T": "アバント",
-    "3839.T": "ODKソリューションズ",
-    "3841.T": "ジーダット",
-    "3843.T": "フリービット",
-    "3844.T": "コムチュア",
-    "3850.T": "NTTデータイントラマート",
-    "3851.T": "日本一ソフトウェア",
-    "3852.T": "サイバーコム",
-    "3853.T": "アステリア",
-    "3854.T": "アイル",
-    "3856.T": "Abalance",
-    "3857.T": "ラック",
-    "3858.T": "ユビキタスAI",
-    "9166.T": "GENDA",
-
-    # === 建設・不動産 ===
-    "1414.T": "ショーボンドホールディングス",
-    "1417.T": "ミライト・ワン",
-    "1419.T": "タマホーム",
-    "1429.T": "日本アクア",
-    "1430.T": "ファーストコーポレーション",
-    "1431.T": "Lib Work",
-    "1433.T": "ベステラ",
-    "1434.T": "JESCOホールディングス",
-    "1435.T": "Robot Home",
-    "1436.T": "フィット",
-    "1438.T": "岐阜造園",
-    "1443.T": "技研ホールディングス",
-    "1444.T": "ニッソウ",
-    "1446.T": "キャンディル",
-    "1711.T": "省電舎ホールディングス",
-    "1716.T": "第一カッター興業",
-    "1717.T": "明豊ファシリティワークス",
-    "1718.T": "美樹工業",
-    "1719.T": "安藤・間",
-    "1720.T": "東急建設",
-    "1721.T": "コムシスホールディングス",
-    "1722.T": "ミサワホーム",
-    "1723.T": "日本電技",
-    "1724.T": "シンクレイヤ",
-    "1726.T": "ビーアールホールディングス",
-    "1758.T": "太洋基礎工業",
-    "1766.T": "東建コーポレーション",
-    "1768.T": "ソネック",
-    "1776.T": "三井住建道路",
-    "1777.T": "川崎設備工業",
-    "1780.T": "ヤマウラ",
-    "1782.T": "常磐開発",
-    "1787.T": "ナカボーテック",
-    "1788.T": "三東工業社",
-    "1801.T": "大成建設",
-    "1802.T": "大林組",
-    "1803.T": "清水建設",
-    "1808.T": "長谷工コーポレーション",
-    "1812.T": "鹿島建設",
-    "1820.T": "西松建設",
-    "1821.T": "三井住友建設",
-    "1822.T": "大豊建設",
-    "1824.T": "前田建設工業",
-    "1827.T": "ナカノフドー建設",
-    "1833.T": "奥村組",
-    "1835.T": "東鉄工業",
-    "1847.T": "イチケン",
-    "1848.T": "富士ピー・エス",
-    "1850.T": "南海辰村建設",
-    "1852.T": "浅沼組",
-    "1853.T": "森組",
-    "1860.T": "戸田建設",
-    "1861.T": "熊谷組",
-    "1866.T": "北野建設",
-    "1867.T": "植木組",
-    "1869.T": "名工建設",
-    "1870.T": "矢作建設工業",
-    "1871.T": "ピーエス三菱",
-    "1878.T": "大東建託",
-    "1879.T": "新日本建設",
-    "1881.T": "NIPPO",
-    "1882.T": "東亜道路工業",
-    "1883.T": "前田道路",
-    "1884.T": "日本道路",
-    "1885.T": "東亜建設工業",
-    "1887.T": "日本国土開発",
-    "1888.T": "若築建設",
-    "1890.T": "東洋建設",
-    "1893.T": "五洋建設",
-    "1899.T": "福田組",
-    "1905.T": "テノックス",
-    "1911.T": "住友林業",
-    "1914.T": "日本基礎技術",
-    "1921.T": "巴コーポレーション",
-    "1925.T": "大和ハウス工業",
-    "1926.T": "ライト工業",
-    "1928.T": "積水ハウス",
-    "1929.T": "日特建設",
-    "1930.T": "北陸電気工事",
-    "1934.T": "ユアテック",
-    "1939.T": "四電工",
-    "1941.T": "中電工",
-    "1942.T": "関電工",
-    "1944.T": "きんでん",
-    "1945.T": "東京エネシス",
-    "1946.T": "トーエネック",
-    "1949.T": "住友電設",
-    "1950.T": "日本電設工業",
-    "1951.T": "エクシオグループ",
-    "1952.T": "新日本空調",
-    "1954.T": "日本工営",
-    "1959.T": "九電工",
-    "1961.T": "三機工業",
-    "1963.T": "日揮ホールディングス",
-    "1965.T": "テクノ菱和",
-    "1966.T": "高砂熱学工業",
-    "1967.T": "ヤマト",
-    "1968.T": "太平電業",
-    "1972.T": "三晃金属工業",
-    "1975.T": "朝日工業社",
-    "1976.T": "明星工業",
-    "1979.T": "大気社",
-    "1980.T": "ダイダン",
-    "1982.T": "日比谷総合設備",
-    "1983.T": "東芝プラントシステム",
-
-    # === 食品・飲料 ===
-    "2001.T": "ニップン",
-    "2002.T": "日清製粉グループ本社",
-    "2003.T": "日東富士製粉",
-    "2004.T": "昭和産業",
-    "2053.T": "中部飼料",
-    "2108.T": "日本甜菜製糖",
-    "2109.T": "DM三井製糖ホールディングス",
-    "2117.T": "ウェルネオシュガー",
-    "2201.T": "森永製菓",
-    "2206.T": "江崎グリコ",
-    "2207.T": "名糖産業",
-    "2208.T": "ブルボン",
-    "2209.T": "井村屋グループ",
-    "2211.T": "不二家",
-    "2212.T": "山崎製パン",
-    "2217.T": "モロゾフ",
-    "2220.T": "亀田製菓",
-    "2221.T": "岩塚製菓",
-    "2222.T": "寿スピリッツ",
-    "2229.T": "カルビー",
-    "2264.T": "森永乳業",
-    "2267.T": "ヤクルト本社",
-    "2270.T": "雪印メグミルク",
-    "2281.T": "プリマハム",
-    "2282.T": "日本ハム",
-    "2284.T": "伊藤ハム米久ホールディングス",
-    "2292.T": "S FOODS",
-    "2501.T": "サッポロホールディングス",
-    "2502.T": "アサヒグループホールディングス",
-    "2503.T": "キリンホールディングス",
-    "2531.T": "宝ホールディングス",
-    "2579.T": "コカ・コーラボトラーズジャパンホールディングス",
-    "2587.T": "サントリー食品インターナショナル",
-    "2593.T": "伊藤園",
-    "2594.T": "キーコーヒー",
-    "2599.T": "ジャパンフーズ",
-    "2602.T": "日清オイリオグループ",
-    "2607.T": "不二製油グループ本社",
-    "2612.T": "かどや製油",
-    "2613.T": "J-オイルミルズ",
-    "2651.T": "ローソン",
-    "2670.T": "エービーシー・マート",
-    "2695.T": "くら寿司",
-    "2702.T": "日本マクドナルドホールディングス",
-    "2726.T": "パルグループホールディングス",
-    "2730.T": "エディオン",
-    "2782.T": "セリア",
-    "2791.T": "大黒天物産",
-    "2801.T": "キッコーマン",
-    "2802.T": "味の素",
-    "2809.T": "キユーピー",
-    "2810.T": "ハウス食品グループ本社",
-    "2811.T": "カゴメ",
-    "2815.T": "アリアケジャパン",
-    "2819.T": "エバラ食品工業",
-    "2871.T": "ニチレイ",
-    "2875.T": "東洋水産",
-    "2876.T": "ヨコレイ",
-    "2897.T": "日清食品ホールディングス",
-    "2899.T": "永谷園ホールディングス",
-    "2903.T": "シノブフーズ",
-    "2904.T": "一正蒲鉾",
-    "2907.T": "あじかん",
-    "2908.T": "フジッコ",
-    "2910.T": "ロック・フィールド",
-    "2914.T": "日本たばこ産業",
-    "2915.T": "ケンコーマヨネーズ",
-    "2918.T": "わらべや日洋ホールディングス",
-    "2922.T": "なとり",
-    "2923.T": "サトウ食品",
-    "2924.T": "イフジ産業",
-    "2925.T": "ピックルスホールディングス",
-    "2929.T": "ファーマフーズ",
-    "2930.T": "北の達人コーポレーション",
-    "2931.T": "ユーグレナ",
-
-    # === 機械・輸送機器 ===
-    "6103.T": "オークマ",
-    "6104.T": "芝浦機械",
-    "6113.T": "アマダ",
-    "6118.T": "アイダエンジニアリング",
-    "6134.T": "FUJI",
-    "6135.T": "牧野フライス製作所",
-    "6136.T": "OSG",
-    "6141.T": "DMG森精機",
-    "6143.T": "ソディック",
-    "6145.T": "日特エンジニアリング",
-    "6201.T": "豊田自動織機",
-    "6222.T": "島精機製作所",
-    "6238.T": "フリュー",
-    "6255.T": "エヌ・ピー・シー",
-    "6258.T": "平田機工",
-    "6268.T": "ナブテスコ",
-    "6269.T": "三井海洋開発",
-    "6272.T": "レオン自動機",
-    "6273.T": "SMC",
-    "6278.T": "ユニオンツール",
-    "6282.T": "オイレス工業",
-    "6284.T": "日精エー・エス・ビー機械",
-    "6287.T": "サトーホールディングス",
-    "6289.T": "技研製作所",
-    "6291.T": "日本エアーテック",
-    "6292.T": "カワタ",
-    "6293.T": "日精樹脂工業",
-    "6294.T": "オカダアイヨン",
-    "6298.T": "ワイエイシイホールディングス",
-    "6301.T": "小松製作所",
-    "6302.T": "住友重機械工業",
-    "6305.T": "日立建機",
-    "6310.T": "井関農機",
-    "6316.T": "丸山製作所",
-    "6317.T": "北川鉄工所",
-    "6324.T": "ハーモニック・ドライブ・システムズ",
-    "6326.T": "クボタ",
-    "6328.T": "荏原実業",
-    "6330.T": "東洋エンジニアリング",
-    "6331.T": "三菱化工機",
-    "6332.T": "月島ホールディングス",
-    "6333.T": "帝国電機製作所",
-    "6335.T": "東京機械製作所",
-    "6339.T": "新東工業",
-    "6340.T": "澁谷工業",
-    "6345.T": "アイチコーポレーション",
-    "6349.T": "小森コーポレーション",
-    "6351.T": "鶴見製作所",
-    "6358.T": "酒井重工業",
-    "6361.T": "荏原製作所",
-    "6363.T": "酉島製作所",
-    "6364.T": "北越工業",
-    "6366.T": "千代田化工建設",
-    "6367.T": "ダイキン工業",
-    "6368.T": "オルガノ",
-    "6369.T": "トーヨーカネツ",
-    "6370.T": "栗田工業",
-    "6371.T": "椿本チエイン",
-    "6376.T": "日機装",
-    "6381.T": "アネスト岩田",
-    "6383.T": "ダイフク",
-    "6384.T": "昭和真空",
-    "6387.T": "サムコ",
-    "6390.T": "加藤製作所",
-    "6395.T": "タダノ",
-    "6407.T": "CKD",
-    "6408.T": "小倉クラッチ",
-    "6409.T": "キトー",
-    "6412.T": "平和",
-    "6417.T": "SANKYO",
-    "6418.T": "日本金銭機械",
-    "6420.T": "フクシマガリレイ",
-    "6432.T": "竹内製作所",
-    "6440.T": "JUKI",
-    "6448.T": "ブラザー工業",
-    "6457.T": "グローリー",
-    "6458.T": "新晃工業",
-    "6460.T": "セガサミーホールディングス",
-    "6463.T": "TPR",
-    "6464.T": "ツバキ・ナカシマ",
-    "6465.T": "ホシザキ",
-    "6471.T": "日本精工",
-    "6472.T": "NTN",
-    "6473.T": "ジェイテクト",
-    "6474.T": "不二越",
-    "6479.T": "ミネベアミツミ",
-    "6480.T": "日本トムソン",
-    "6481.T": "THK",
-    "6482.T": "ユーシン精機",
-    "6486.T": "イーグル工業",
-    "6489.T": "前澤工業",
-    "6490.T": "日本ピラー工業",
-    "6498.T": "キッツ",
-    "7003.T": "三井E&S",
-    "7004.T": "日立造船",
-    "7011.T": "三菱重工業",
-    "7012.T": "川崎重工業",
-    "7013.T": "IHI",
-    "7201.T": "日産自動車",
-    "7202.T": "いすゞ自動車",
-    "7203.T": "トヨタ自動車",
-    "7205.T": "日野自動車",
-    "7211.T": "三菱自動車",
-    "7224.T": "新明和工業",
-    "7231.T": "トピー工業",
-    "7240.T": "NOK",
-    "7241.T": "フタバ産業",
-    "7242.T": "KYB",
-    "7244.T": "市光工業",
-    "7245.T": "大同メタル工業",
-    "7246.T": "プレス工業",
-    "7247.T": "ミクニ",
-    "7250.T": "太平洋工業",
-    "7259.T": "アイシン",
-    "7261.T": "マツダ",
-    "7267.T": "ホンダ",
-    "7269.T": "スズキ",
-    "7270.T": "SUBARU",
-    "7272.T": "ヤマハ発動機",
-    "7276.T": "小糸製作所",
-    "7278.T": "エクセディ",
-    "7282.T": "豊田合成",
-    "7296.T": "エフ・シー・シー",
-    "7309.T": "シマノ",
-    "7313.T": "テイ・エス テック",
-
-    # === 銀行・金融・保険 ===
-    "7186.T": "コンコルディア・フィナンシャルグループ",
-    "7189.T": "西日本フィナンシャルホールディングス",
-    "7192.T": "日本モーゲージサービス",
-    "8303.T": "新生銀行",
-    "8304.T": "あおぞら銀行",
-    "8306.T": "三菱UFJフィナンシャル・グループ",
-    "8308.T": "りそなホールディングス",
-    "8309.T": "三井住友トラスト・ホールディングス",
-    "8316.T": "三井住友フィナンシャルグループ",
-    "8331.T": "千葉銀行",
-    "8334.T": "群馬銀行",
-    "8336.T": "武蔵野銀行",
-    "8337.T": "千葉興業銀行",
-    "8338.T": "筑波銀行",
-    "8341.T": "七十七銀行",
-    "8343.T": "秋田銀行",
-    "8344.T": "山形銀行",
-    "8345.T": "岩手銀行",
-    "8346.T": "東邦銀行",
-    "8349.T": "東北銀行",
-    "8350.T": "みちのく銀行",
-    "8354.T": "ふくおかフィナンシャルグループ",
-    "8355.T": "静岡銀行",
-    "8356.T": "十六フィナンシャルグループ",
-    "8358.T": "スルガ銀行",
-    "8359.T": "八十二銀行",
-    "8360.T": "山梨中央銀行",
-    "8361.T": "大垣共立銀行",
-    "8362.T": "福井銀行",
-    "8363.T": "北國フィナンシャルホールディングス",
-    "8364.T": "清水銀行",
-    "8366.T": "滋賀銀行",
-    "8367.T": "南都銀行",
-    "8368.T": "百五銀行",
-    "8369.T": "京都銀行",
-    "8370.T": "紀陽銀行",
-    "8377.T": "ほくほくフィナンシャルグループ",
-    "8379.T": "広島銀行",
-    "8381.T": "山陰合同銀行",
-    "8382.T": "中国銀行",
-    "8385.T": "伊予銀行",
-    "8386.T": "百十四銀行",
-    "8387.T": "四国銀行",
-    "8388.T": "阿波銀行",
-    "8393.T": "宮崎銀行",
-    "8395.T": "佐賀銀行",
-    "8397.T": "沖縄銀行",
-    "8399.T": "琉球銀行",
-    "8410.T": "セブン銀行",
-    "8411.T": "みずほフィナンシャルグループ",
-    "8418.T": "山口フィナンシャルグループ",
-    "8424.T": "芙蓉総合リース",
-    "8439.T": "東京センチュリー",
-    "8473.T": "SBIホールディングス",
-    "8508.T": "Jトラスト",
-    "8511.T": "日本証券金融",
-    "8515.T": "アイフル",
-    "8519.T": "ポケットカード",
-    "8521.T": "長野銀行",
-    "8522.T": "名古屋銀行",
-    "8524.T": "北洋銀行",
-    "8527.T": "愛知銀行",
-    "8541.T": "愛媛銀行",
-    "8542.T": "トマト銀行",
-    "8543.T": "みなと銀行",
-    "8544.T": "京葉銀行",
-    "8545.T": "関西みらいフィナンシャルグループ",
-    "8550.T": "栃木銀行",
-    "8551.T": "北日本銀行",
-    "8558.T": "東和銀行",
-    "8563.T": "大東銀行",
-    "8566.T": "リコーリース",
-    "8570.T": "イオンフィナンシャルサービス",
-    "8572.T": "アコム",
-    "8584.T": "ジャックス",
-    "8585.T": "オリエントコーポレーション",
-    "8591.T": "オリックス",
-    "8593.T": "三菱HCキャピタル",
-    "8595.T": "ジャフコ グループ",
-    "8596.T": "九州リースサービス",
-    "8601.T": "大和証券グループ本社",
-    "8604.T": "野村ホールディングス",
-    "8609.T": "岡三証券グループ",
-    "8613.T": "丸三証券",
-    "8614.T": "東洋証券",
-    "8616.T": "東海東京フィナンシャル・ホールディングス",
-    "8622.T": "水戸証券",
-    "8624.T": "いちよし証券",
-    "8628.T": "松井証券",
-    "8630.T": "SOMPOホールディングス",
-    "8697.T": "日本取引所グループ",
-    "8698.T": "マネックスグループ",
-    "8707.T": "岩井コスモホールディングス",
-    "8708.T": "藍澤證券",
-    "8713.T": "フィデアホールディングス",
-    "8714.T": "池田泉州ホールディングス",
-    "8725.T": "MS&ADインシュアランスグループホールディングス",
-    "8750.T": "第一生命ホールディングス",
-    "8766.T": "東京海上ホールディングス",
-    "8795.T": "T&Dホールディングス",
-
-    # === 小売・卸売 ===
-    "8012.T": "長瀬産業",
-    "8015.T": "豊田通商",
-    "8020.T": "兼松",
-    "8031.T": "三井物産",
-    "8035.T": "東京エレクトロン",
-    "8053.T": "住友商事",
-    "8058.T": "三菱商事",
-    "8059.T": "第一実業",
-    "8060.T": "キヤノンマーケティングジャパン",
-    "8068.T": "菱洋エレクトロ",
-    "8074.T": "ユアサ商事",
-    "8078.T": "阪和興業",
-    "8079.T": "正栄食品工業",
-    "8086.T": "ニプロ",
-    "8088.T": "岩谷産業",
-    "8091.T": "ニチモウ",
-    "8096.T": "兼松エレクトロニクス",
-    "8098.T": "稲畑産業",
-    "8103.T": "明和産業",
-    "8111.T": "ゴールドウイン",
-    "8113.T": "ユニ・チャーム",
-    "8117.T": "中央自動車工業",
-    "8125.T": "ワキタ",
-    "8129.T": "東邦ホールディングス",
-    "8130.T": "サンゲツ",
-    "8131.T": "ミツウロコグループホールディングス",
-    "8132.T": "シナネンホールディングス",
-    "8133.T": "伊藤忠エネクス",
-    "8136.T": "サンリオ",
-    "8137.T": "サンワテクノス",
-    "8141.T": "新光商事",
-    "8150.T": "三信電気",
-    "8151.T": "東陽テクニカ",
-    "8154.T": "加賀電子",
-    "8157.T": "都築電気",
-    "8158.T": "ソーダニッカ",
-    "8159.T": "立花エレテック",
-    "8160.T": "木曽路",
-    "8165.T": "千趣会",
-    "8167.T": "リテールパートナーズ",
-    "8168.T": "ケーヨー",
-    "8173.T": "上新電機",
-    "8174.T": "日本瓦斯",
-    "8179.T": "ロイヤルホールディングス",
-    "8182.T": "いなげや",
-    "8185.T": "チヨダ",
-    "8194.T": "ライフコーポレーション",
-    "8200.T": "リンガーハット",
-    "8203.T": "MrMaxホールディングス",
-    "8217.T": "オークワ",
-    "8218.T": "コメリ",
-    "8219.T": "青山商事",
-    "8227.T": "しまむら",
-    "8228.T": "マルイチ産商",
-    "8233.T": "高島屋",
-    "8237.T": "松屋",
-    "8242.T": "エイチ・ツー・オー リテイリング",
-    "8252.T": "丸井グループ",
-    "8253.T": "クレディセゾン",
-    "8255.T": "アクシアル リテイリング",
-    "8267.T": "イオン",
-    "8273.T": "イズミ",
-    "8276.T": "平和堂",
-    "8278.T": "フジ",
-    "8279.T": "ヤオコー",
-    "8282.T": "ケーズホールディングス",
-    "8283.T": "PALTAC",
-    "8285.T": "三谷産業",
-
-    # === 不動産・REIT ===
-    "8801.T": "三井不動産",
-    "8802.T": "三菱地所",
-    "8803.T": "平和不動産",
-    "8804.T": "東京建物",
-    "8806.T": "ダイビル",
-    "8830.T": "住友不動産",
-    "8841.T": "テーオーシー",
-    "8850.T": "スターツコーポレーション",
-    "8860.T": "フジ住宅",
-    "8864.T": "空港施設",
-    "8869.T": "明和地所",
-    "8876.T": "リログループ",
-    "8881.T": "日神グループホールディングス",
-    "8905.T": "イオンモール",
-    "8909.T": "シノケングループ",
-    "8914.T": "エリアリンク",
-    "8917.T": "ファースト住建",
-    "8919.T": "カチタス",
-    "8920.T": "東祥",
-    "8923.T": "トーセイ",
-    "8931.T": "和田興産",
-    "8934.T": "サンフロンティア不動産",
-    "8935.T": "FJネクストホールディングス",
-    "8940.T": "インテリックス",
-
-    # === 運輸・倉庫 ===
-    "9001.T": "東武鉄道",
-    "9003.T": "相鉄ホールディングス",
-    "9005.T": "東急",
-    "9006.T": "京浜急行電鉄",
-    "9007.T": "小田急電鉄",
-    "9008.T": "京王電鉄",
-    "9009.T": "京成電鉄",
-    "9010.T": "富士急行",
-    "9020.T": "東日本旅客鉄道",
-    "9021.T": "西日本旅客鉄道",
-    "9022.T": "東海旅客鉄道",
-    "9024.T": "西武ホールディングス",
-    "9031.T": "西日本鉄道",
-    "9033.T": "広島電鉄",
-    "9041.T": "近鉄グループホールディングス",
-    "9042.T": "阪急阪神ホールディングス",
-    "9044.T": "南海電気鉄道",
-    "9045.T": "京阪ホールディングス",
-    "9048.T": "名古屋鉄道",
-    "9052.T": "山陽電気鉄道",
-    "9057.T": "遠州トラック",
-    "9058.T": "トランコム",
-    "9059.T": "カンダホールディングス",
-    "9060.T": "日本ロジテム",
-    "9062.T": "日本通運",
-    "9064.T": "ヤマトホールディングス",
-    "9065.T": "山九",
-    "9068.T": "丸全昭和運輸",
-    "9069.T": "センコーグループホールディングス",
-    "9070.T": "トナミホールディングス",
-    "9071.T": "日本石油輸送",
-    "9072.T": "ニッコンホールディングス",
-    "9076.T": "セイノーホールディングス",
-    "9078.T": "エスライングループ本社",
-    "9081.T": "神奈川中央交通",
-    "9086.T": "日立物流",
-    "9101.T": "日本郵船",
-    "9104.T": "商船三井",
-    "9107.T": "川崎汽船",
-    "9110.T": "NSユナイテッド海運",
-    "9115.T": "明治海運",
-    "9119.T": "飯野海運",
-    "9142.T": "九州旅客鉄道",
-    "9143.T": "SGホールディングス",
-    "9147.T": "NIPPON EXPRESSホールディングス",
-    "9201.T": "日本航空",
-    "9202.T": "ANAホールディングス",
-    "9232.T": "パスコ",
-    "9301.T": "三菱倉庫",
-    "9302.T": "三井倉庫ホールディングス",
-    "9303.T": "住友倉庫",
-    "9304.T": "澁澤倉庫",
-    "9324.T": "安田倉庫",
-
-    # === 電気・ガス・エネルギー ===
-    "9432.T": "日本電信電話",
-    "9433.T": "KDDI",
-    "9434.T": "ソフトバンク",
-    "9435.T": "光通信",
-    "9436.T": "沖縄セルラー電話",
-    "9438.T": "エムティーアイ",
-    "9449.T": "GMOインターネットグループ",
-    "9466.T": "アイドママーケティングコミュニケーション",
-    "9467.T": "アルファポリス",
-    "9468.T": "KADOKAWA",
-    "9470.T": "学研ホールディングス",
-    "9474.T": "ゼンリン",
-    "9501.T": "東京電力ホールディングス",
-    "9502.T": "中部電力",
-    "9503.T": "関西電力",
-    "9504.T": "中国電力",
-    "9505.T": "北陸電力",
-    "9506.T": "東北電力",
-    "9507.T": "四国電力",
-    "9508.T": "九州電力",
-    "9509.T": "北海道電力",
-    "9510.T": "沖縄電力",
-    "9513.T": "電源開発",
-    "9517.T": "イーレックス",
-    "9519.T": "レノバ",
-    "9531.T": "東京ガス",
-    "9532.T": "大阪ガス",
-    "9533.T": "東邦ガス",
-    "9534.T": "北海道ガス",
-    "9535.T": "広島ガス",
-    "9536.T": "西部ガスホールディングス",
-
-    # === サービス・その他 ===
-    "9603.T": "エイチ・アイ・エス",
-    "9605.T": "東映",
-    "9607.T": "AOI TYO Holdings",
-    "9613.T": "NTTデータグループ",
-    "9616.T": "共立メンテナンス",
-    "9619.T": "イチネンホールディングス",
-    "9621.T": "建設技術研究所",
-    "9622.T": "スペース",
-    "9627.T": "アインホールディングス",
-    "9629.T": "ピー・シー・エー",
-    "9632.T": "スバル興業",
-    "9640.T": "セゾンテクノロジー",
-    "9644.T": "タナベコンサルティンググループ",
-    "9651.T": "日本プロセス",
-    "9658.T": "ビジネスブレイン太田昭和",
-    "9672.T": "東京都競馬",
-    "9678.T": "カナモト",
-    "9682.T": "DTS",
-    "9684.T": "スクウェア・エニックス・ホールディングス",
-    "9687.T": "KSK",
-    "9692.T": "シーイーシー",
-    "9697.T": "カプコン",
-    "9699.T": "西尾レントオール",
-    "9702.T": "アイ・エス・ビー",
-    "9706.T": "日本空港ビルデング",
-    "9715.T": "トランスコスモス",
-    "9717.T": "ジャステック",
-    "9719.T": "SCSK",
-    "9726.T": "KNT-CTホールディングス",
-    "9729.T": "トーカイ",
-    "9731.T": "白洋舎",
-    "9735.T": "セコム",
-    "9739.T": "NSW",
-    "9740.T": "セントラル警備保障",
-    "9742.T": "アイネス",
-    "9743.T": "丹青社",
-    "9744.T": "メイテックグループホールディングス",
-    "9746.T": "TKC",
-    "9749.T": "富士ソフト",
-    "9755.T": "応用地質",
-    "9757.T": "船井総研ホールディングス",
-    "9759.T": "NSD",
-    "9765.T": "オオバ",
-    "9766.T": "コナミグループ",
-    "9783.T": "ベネッセホールディングス",
-    "9787.T": "イオンディライト",
-    "9793.T": "ダイセキ",
-    "9795.T": "ステップ",
-    "9824.T": "泉州電業",
-    "9831.T": "ヤマダホールディングス",
-    "9832.T": "オートバックスセブン",
-    "9837.T": "モリト",
-    "9842.T": "アークランズ",
-    "9843.T": "ニトリホールディングス",
-    "9850.T": "グルメ杵屋",
-    "9856.T": "ケーユーホールディングス",
-    "9861.T": "吉野家ホールディングス",
-    "9869.T": "加藤産業",
-    "9873.T": "日本KFCホールディングス",
-    "9880.T": "イノテック",
-    "9882.T": "イエローハット",
-    "9889.T": "JBCCホールディングス",
-    "9902.T": "日伝",
-    "9906.T": "藤井産業",
-    "9908.T": "日本電計",
-    "9913.T": "日邦産業",
-    "9919.T": "関西フードマーケット",
-    "9928.T": "ミロク情報サービス",
-    "9932.T": "杉本商事",
-    "9934.T": "因幡電機産業",
-    "9936.T": "王将フードサービス",
-    "9945.T": "プレナス",
-    "9948.T": "アークス",
-    "9956.T": "バローホールディングス",
-    "9974.T": "ベルク",
-    "9983.T": "ファーストリテイリング",
-    "9984.T": "ソフトバンクグループ",
-    "9987.T": "スズケン",
-    "9989.T": "サンドラッグ",
-    "9997.T": "ベルーナ",
-}
+TICKER_NAMES = nr.master_names()
 
 MIDCAP_TICKERS = list(TICKER_NAMES.keys())
 
 # 診断用ローカルキャッシュを分割するシャード数（全銘柄時も1ファイルあたり数十〜百銘柄程度）
-HISTORY_SHARD_COUNT = 64
+HISTORY_SHARD_COUNT = hs.HISTORY_SHARD_COUNT
+# HistoryShardWriter が書き出し前に手元に溜める履歴の上限（超えたら最も大きいシャードを途中書き出し）
+HISTORY_PENDING_LIMIT = int(os.environ.get("HISTORY_PENDING_LIMIT", "200"))
+# スナップショット世代がない古い配置での置き場所（通常は ss.path("history") を使う）
 HISTORY_DIR = Path("data/history")
+# KABU+ 生株価の分割・併合調整係数（検出済みイベントと検査済みの最終日）
+SPLIT_FACTORS_PATH = Path("data/split_factors.json")
 
 
 def hash_ticker_shard_id(ticker: str) -> int:
-    return int(hashlib.md5(ticker.encode("utf-8")).hexdigest(), 16) % HISTORY_SHARD_COUNT
+    return hs.shard_id(ticker)
 
 
 def get_all_listed_tickers_jpx() -> list[str]:
@@ -1320,11 +338,10 @@ def build_target_universe_from_merged(merged_df: pd.DataFrame, target_size: int
 
 def load_existing_ratios_results() -> tuple[dict, dict]:
     """既存の ratios.json から results / qualified を読み込む。再取得フェーズ用。"""
-    p = Path("data/ratios.json")
-    if not p.exists():
+    if not rs.ratios_path().exists():
         return {}, {}
     try:
-        obj = json.loads(p.read_text(encoding="utf-8"))
+        obj = rs.load_ratios()
         all_data = obj.get("all_data", {}) or {}
         data = obj.get("data", {}) or {}
         return all_data, data
@@ -1333,62 +350,295 @@ def load_existing_ratios_results() -> tuple[dict, dict]:
         return {}, {}
 
 
-def load_existing_history_shards() -> tuple[dict, list[dict]]:
-    """既存の data/history を読み込み、stock_history / shards を再構築する。再取得フェーズ用。"""
-    stock_history = {}
-    shards = [{} for _ in range(HISTORY_SHARD_COUNT)]
-    if not HISTORY_DIR.exists():
-        return stock_history, shards
+def load_split_factors() -> tuple[dict, str | None]:
+    """保存済みの分割・併合イベントと、検査済みの最終日を読み込む"""
+    if not SPLIT_FACTORS_PATH.exists():
+        return {}, None
+    try:
+        obj = jsonio.read_json(SPLIT_FACTORS_PATH)
+        return obj.get("events", {}) or {}, obj.get("checked_through")
+    except Exception as e:
+        print(f"⚠️ split_factors.json 読み込み失敗: {e}")
+        return {}, None
+
+
+def save_split_factors(events: dict, checked_through: str | None, updated_at: str) -> None:
+    SPLIT_FACTORS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    obj = {
+        "updated_at": updated_at,
+        "checked_through": checked_through,
+        "events": dict(sorted(events.items())),
+    }
+    jsonio.write_json(SPLIT_FACTORS_PATH, obj, indent=True)
+
 
-    for i in range(HISTORY_SHARD_COUNT):
-        fp = HISTORY_DIR / f"shard_{i:02d}.json"
+def fetch_kabuplus_history_range(kp_id: str, kp_pw: str, updated_at: str) -> dict:
+    """KABU+ の約400日分の株価CSVから、分割・併合を調整した {ticker: OHLCV履歴} を作る"""
+    closed_dates: set = set()
+    price_history_df = kp.fetch_stock_prices_range(kp_id, kp_pw, days_back=400, min_rows=30, closed_dates=closed_dates)
+    if price_history_df.empty:
+        print("  ⚠️ KABU+ 履歴データ取得失敗")
+        return {}
+    # 取得に失敗した日次ファイルがあれば、その日だけを並行で取り直して埋める
+    price_history_df, gap_report = kp.fill_price_gaps(price_history_df, kp_id, kp_pw, closed_dates=closed_dates)
+    if gap_report["gap_dates"]:
+        print(
+            f"  → 履歴の欠け {len(gap_report['gap_dates'])} 日を検出: {gap_report['filled_rows']} 行を補完"
+            f"（休場 {len(gap_report['closed'])} 日 / 取得失敗 {len(gap_report['failed'])} 日）"
+        )
+    # 分割・併合の調整（検出は前回検査済みの日より新しい分だけ）
+    known_events, checked_through = load_split_factors()
+    price_history_df, split_events = kp.adjust_for_splits(
+        price_history_df, known_events=known_events, checked_through=checked_through
+    )
+    latest_day = pd.to_datetime(price_history_df["timestamp"], errors="coerce").max()
+    if pd.notna(latest_day):
+        checked_through = latest_day.strftime("%Y-%m-%d")
+    save_split_factors(split_events, checked_through, updated_at)
+    new_events = sum(len(v) for v in split_events.values()) - sum(len(v) for v in known_events.values())
+    if new_events > 0:
+        print(f"  → 分割・併合を新たに {new_events} 件検出し、過去分を調整")
+    # 縦持ち DataFrame は辞書化した時点で不要（全銘柄時のピークメモリ対策）
+    return kp.build_history_lookup(price_history_df, min_bars=30)
+
+
+def load_stored_history_rows(tickers=None) -> dict:
+    """
+    公開中の世代のシャードから {ticker: {dates, O, H, L, C, V, info}} を読む。
+    tickers を渡すとその銘柄のシャードだけを読む（None なら全シャード）。
+    """
+    history_dir = ss.path("history")
+    if tickers is None:
+        paths = sorted(history_dir.glob("shard_*.json"))
+        wanted = None
+    else:
+        wanted = set(tickers)
+        paths = sorted({history_dir / f"shard_{hash_ticker_shard_id(t):02d}.json" for t in wanted})
+    rows: dict = {}
+    for fp in paths:
         if not fp.exists():
             continue
         try:
-            bucket = json.loads(fp.read_text(encoding="utf-8"))
-            if isinstance(bucket, dict):
-                shards[i] = bucket
-                stock_history.update(bucket)
+            shard = jsonio.read_shard(fp)
         except Exception as e:
             print(f"⚠️ 既存 shard 読み込み失敗 {fp.name}: {e}")
-    return stock_history, shards
+            continue
+        for t, row in shard.items():
+            if wanted is None or t in wanted:
+                rows[t] = row
+    return rows
+
+
+def load_stored_history_tickers() -> set:
+    """
+    公開中の世代に履歴がある銘柄の集合。history/meta.json の tickers を読む（シャード本体は読まない）。
+    tickers を持たない古い世代だけ全シャードから数える。
+    """
+    try:
+        meta = jsonio.read_json(ss.path("history") / "meta.json")
+    except Exception:
+        meta = {}
+    if isinstance(meta.get("tickers"), list):
+        return set(meta["tickers"])
+    return set(load_stored_history_rows())
 
 
 def merge_results_preserving_new(existing: dict, new: dict) -> dict:
     merged = dict(existing or {})
     merged.update(new or {})
     return merged
-def write_history_shards(shards: list[dict], updated_at: str) -> None:
-    """data/history/shard_XX.json と meta.json を書き出す"""
-    HISTORY_DIR.mkdir(parents=True, exist_ok=True)
-    total = 0
-    for i, bucket in enumerate(shards):
-        total += len(bucket)
-        (HISTORY_DIR / f"shard_{i:02d}.json").write_text(
-            json.dumps(bucket, ensure_ascii=False), encoding="utf-8"
-        )
-    meta = {
-        "updated_at": updated_at,
-        "shard_count": HISTORY_SHARD_COUNT,
-        "format": "sharded_v1",
-        "ticker_count": total,
-    }
-    (HISTORY_DIR / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(f"💾 保存: {HISTORY_DIR}/shard_00..shard_{HISTORY_SHARD_COUNT - 1:02d}.json （計 {total} 銘柄）")
+
+
+class HistoryShardWriter:
+    """
+    history/shard_XX.json をシャード単位で逐次書き出すストリーミングライター。
+    - plan() で各シャードの担当銘柄数を登録し、担当銘柄の処理が全て終わったシャードから即フラッシュ
+    - 処理順はシャードと無関係（優先度順）でよい。手元の履歴が pending_limit 件を超えたら、
+      最も大きいシャードを途中書き出し（.part_XX_N.json）し、フラッシュ時にまとめる
+    - ピークメモリは「全銘柄」ではなく pending_limit 件分で済む
+    - 既存シャードは source_dir（省略時は公開中の世代）から読み、history_dir（作成中の世代）に書く
+    - merge_existing=True（再取得フェーズ）のときは既存シャードを1つずつ読み、上書きマージして書き出す
+    - legacy_path を渡すと stock_history.json を JSON ストリームとして追記出力する
+    """
+
+    def __init__(
+        self,
+        updated_at: str,
+        history_dir: Path = HISTORY_DIR,
+        merge_existing: bool = False,
+        legacy_path: Path | None = None,
+        source_dir: Path | None = None,
+        generation: str | None = None,
+        pending_limit: int = HISTORY_PENDING_LIMIT,
+    ):
+        self.updated_at = updated_at
+        self.history_dir = Path(history_dir)
+        self.source_dir = Path(source_dir) if source_dir else ss.path("history")
+        self.generation = generation
+        self.merge_existing = merge_existing
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        self._pending: dict[int, dict] = {}
+        self._pending_count = 0
+        self.pending_limit = pending_limit
+        self._parts: dict[int, list[Path]] = {}
+        self._remaining: dict[int, int] = {}
+        self._flushed: set[int] = set()
+        self._keep: dict[int, set[str]] = {}
+        self._total = 0
+        self._tickers: set[str] = set()
+        self._legacy_fp = None
+        self._legacy_tmp: Path | None = None
+        self._legacy_count = 0
+        self.history_dir.mkdir(parents=True, exist_ok=True)
+
+    def _shard_path(self, shard_id: int) -> Path:
+        return self.history_dir / f"shard_{shard_id:02d}.json"
+
+    def _read_shard(self, shard_id: int) -> dict:
+        fp = self.source_dir / f"shard_{shard_id:02d}.json"
+        if not fp.exists():
+            return {}
+        try:
+            return jsonio.read_shard(fp)
+        except Exception as e:
+            print(f"⚠️ 既存 shard 読み込み失敗 {fp.name}: {e}")
+            return {}
+
+    def _open_legacy(self) -> None:
+        self.legacy_path.parent.mkdir(parents=True, exist_ok=True)
+        self._legacy_tmp = self.legacy_path.with_name(self.legacy_path.name + ".tmp")
+        self._legacy_fp = open(self._legacy_tmp, "w", encoding="utf-8")
+        self._legacy_fp.write('{"updated_at":' + jsonio.dumps_str(self.updated_at))
+
+    def _stream_legacy(self, bucket: dict) -> None:
+        if not self.legacy_path or not bucket:
+            return
+        if self._legacy_fp is None:
+            self._open_legacy()
+        for ticker, payload in bucket.items():
+            self._legacy_fp.write("," + jsonio.dumps_str(ticker) + ":")
+            self._legacy_fp.write(jsonio.dumps_str(payload))
+            self._legacy_count += 1
+
+    def plan(self, tickers: list[str]) -> None:
+        """これから処理する銘柄をシャード毎に数えておく（フラッシュ判定用）"""
+        for ticker in tickers:
+            sid = hash_ticker_shard_id(ticker)
+            self._remaining[sid] = self._remaining.get(sid, 0) + 1
+
+    def add(self, ticker: str, payload: dict) -> None:
+        bucket = self._pending.setdefault(hash_ticker_shard_id(ticker), {})
+        if ticker not in bucket:
+            self._pending_count += 1
+        bucket[ticker] = payload
+        if self._pending_count > self.pending_limit:
+            self._spill(max(self._pending, key=lambda sid: len(self._pending[sid])))
+
+    def _spill(self, shard_id: int) -> None:
+        """まだ担当の残っているシャードの手元分を途中書き出しし、メモリから外す"""
+        bucket = self._pending.pop(shard_id, {})
+        parts = self._parts.setdefault(shard_id, [])
+        part = self.history_dir / f".part_{shard_id:02d}_{len(parts)}.json"
+        jsonio.write_json(part, bucket)
+        parts.append(part)
+        self._pending_count -= len(bucket)
+
+    def _take_pending(self, shard_id: int) -> dict:
+        """途中書き出し分と手元分をまとめて取り出す（後に追加したものが優先）"""
+        bucket: dict = {}
+        for part in self._parts.pop(shard_id, []):
+            bucket.update(jsonio.read_shard(part))
+            part.unlink()
+        pending = self._pending.pop(shard_id, {})
+        self._pending_count -= len(pending)
+        bucket.update(pending)
+        return bucket
+
+    def keep_existing(self, ticker: str) -> None:
+        """今回処理しなかった銘柄。書き出し時に既存シャードの内容を引き継ぐ"""
+        self._keep.setdefault(hash_ticker_shard_id(ticker), set()).add(ticker)
+
+    def done(self, ticker: str) -> None:
+        """銘柄1件の処理完了（成功・失敗問わず）。担当が尽きたシャードを書き出す。"""
+        sid = hash_ticker_shard_id(ticker)
+        left = self._remaining.get(sid, 0) - 1
+        self._remaining[sid] = left
+        if left <= 0 and sid not in self._flushed:
+            self._flush(sid)
+
+    def _flush(self, shard_id: int) -> None:
+        bucket = self._take_pending(shard_id)
+        keep = self._keep.pop(shard_id, set())
+        if self.merge_existing:
+            existing = self._read_shard(shard_id)
+            existing.update(bucket)
+            bucket = existing
+        elif keep:
+            existing = self._read_shard(shard_id)
+            for ticker in keep:
+                if ticker in existing and ticker not in bucket:
+                    bucket[ticker] = existing[ticker]
+        jsonio.write_json(self._shard_path(shard_id), bucket)
+        self._flushed.add(shard_id)
+        self._total += len(bucket)
+        self._tickers.update(bucket)
+        self._stream_legacy(bucket)
+
+    def close(self) -> int:
+        """未フラッシュのシャードと meta.json を書き出し、合計銘柄数を返す"""
+        for sid in sorted(set(self._pending) | set(self._parts)):
+            self._flush(sid)
+        for sid in range(HISTORY_SHARD_COUNT):
+            if sid in self._flushed:
+                continue
+            if self.merge_existing:
+                # 今回触っていないシャードは中身をそのまま引き継ぎ、件数とレガシー出力だけ反映
+                src = self.source_dir / f"shard_{sid:02d}.json"
+                if src.exists() and src.resolve() != self._shard_path(sid).resolve():
+                    shutil.copyfile(src, self._shard_path(sid))
+                bucket = self._read_shard(sid)
+                self._total += len(bucket)
+                self._tickers.update(bucket)
+                self._stream_legacy(bucket)
+                self._flushed.add(sid)
+            else:
+                self._flush(sid)
+
+        meta = {
+            "updated_at": self.updated_at,
+            "generation": self.generation,
+            "shard_count": HISTORY_SHARD_COUNT,
+            "format": "sharded_v1",
+            "ticker_count": self._total,
+            # 再取得フェーズがシャードを読まずに「履歴のある銘柄」を知るため
+            "tickers": sorted(self._tickers),
+        }
+        jsonio.write_json(self.history_dir / "meta.json", meta, indent=True)
+        print(f"💾 保存: {self.history_dir}/shard_00..shard_{HISTORY_SHARD_COUNT - 1:02d}.json （計 {self._total} 銘柄）")
+
+        if self.legacy_path:
+            if self._legacy_fp is None:
+                self._open_legacy()
+            self._legacy_fp.write("}")
+            self._legacy_fp.close()
+            os.replace(self._legacy_tmp, self.legacy_path)
+            self._legacy_fp = None
+            print(f"💾 レガシー保存: {self.legacy_path} ({self._legacy_count} 銘柄)")
+        return self._total
 
 
 def get_jpx_data():
     try:
         html_url = "https://www.jpx.co.jp/markets/statistics-equities/misc/01.html"
         headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
-        response = requests.get(html_url, headers=headers, timeout=10)
+        response = rb.http_get(html_url, headers=headers, timeout=10)
         response.raise_for_status()
         match = re.search(r'href="([^"]+data_j\.xls)"', response.text)
         if not match:
             return {}
 
         file_url = "https://www.jpx.co.jp" + match.group(1)
-        xls_response = requests.get(file_url, headers=headers, timeout=10)
+        xls_response = rb.http_get(file_url, headers=headers, timeout=10)
         xls_response.raise_for_status()
 
         def _jpx_code_cell(v):
@@ -1409,7 +659,8 @@ def get_jpx_data():
     except Exception:
         return {}
 
-JPX_NAME_MAP = get_jpx_data()
+# main() の先頭で取得する（import 時にネットワークへ出ない）
+JPX_NAME_MAP: dict = {}
 
 
 def fetch_yahoo_japan_name(ticker: str) -> str | None:
@@ -1419,7 +670,7 @@ def fetch_yahoo_japan_name(ticker: str) -> str | None:
 
     try:
         url_yfjp = f"https://finance.yahoo.co.jp/quote/{code_only}.T"
-        res = requests.get(url_yfjp, headers={"User-Agent": "Mozilla/5.0"}, timeout=5)
+        res = rb.http_get(url_yfjp, headers={"User-Agent": "Mozilla/5.0"}, timeout=5)
         res.raise_for_status()
         match = re.search(r"<title>(.+?)(?:\(株\))?【", res.text)
         if match:
@@ -1430,31 +681,16 @@ def fetch_yahoo_japan_name(ticker: str) -> str | None:
     return None
 
 
-def get_japanese_name(ticker: str, api_name: str | None = None) -> str:
+def get_japanese_name(ticker: str, api_name: str | None = None, allow_yahoo: bool = True) -> str:
     code_only = str(ticker or "").replace(".T", "").strip()
 
-    candidates = [
-        JPX_NAME_MAP.get(code_only),
-        TICKER_NAMES.get(ticker),
-        fetch_yahoo_japan_name(ticker),
-        api_name,
-    ]
-
-    for cand in candidates:
-        cand = (cand or "").strip()
-        if not cand:
-            continue
-        if re.search(r"[ぁ-んァ-ヶ一-龠々ー]", cand):
-            return cand
-        if cand in {"SHIFT", "TOWA", "ZOZO", "HENNGE", "GENDA", "MonotaRO", "Appier", "BASE", "JTOWER", "Sansan", "Macbee Planet", "KLab", "LTS", "PR TIMES", "JIG-SAW"}:
-            return cand
-
-    for cand in candidates:
-        cand = (cand or "").strip()
-        if cand:
-            return cand
-
-    return code_only
+    # Yahoo!ファイナンス日本は手元の辞書で決まらないときだけ引く
+    local = [JPX_NAME_MAP.get(code_only), TICKER_NAMES.get(ticker)]
+    name = nr.first_ready(local)
+    if name:
+        return name
+    candidates = local + [fetch_yahoo_japan_name(ticker) if allow_yahoo else None, api_name]
+    return nr.first_ready(candidates) or nr.first_nonempty(candidates) or code_only
 
 
 def calculate_flow_score(df: pd.DataFrame) -> dict:
@@ -1535,17 +771,38 @@ def calculate_flow_score(df: pd.DataFrame) -> dict:
         }
 
 
-def load_previous_streaks() -> dict:
-    """前回のratios.jsonから、FlowScore70+の連続日数を復元。"""
-    try:
-        p = Path("data/ratios.json")
-        if not p.exists():
-            return {}
-        prev = json.loads(p.read_text(encoding="utf-8"))
-        prev_data = prev.get("data", {}) or {}
-        return {t: int(d.get("flow_streak_high", 0)) for t, d in prev_data.items()}
-    except Exception:
-        return {}
+def load_previous_records(before: str | None = None) -> dict:
+    """
+    前回結果（銘柄→レコード）を読む。
+    公開中の ratios.json と日付別アーカイブ（archive_store.ratios_dates）のうち、before（YYYY-MM-DD・取引日）より前で
+    中身のある最新の日付を使う（1回の取得失敗で前回の状態が消えないように）。
+    """
+    sources: list[tuple[str, Path]] = []
+    current = rs.ratios_path()
+    if current.exists():
+        try:
+            prev_date = str(rs.read_ratios_summary(current).get("date") or "")
+            sources.append((prev_date, current))
+        except Exception:
+            pass
+    sources.extend(ast.ratios_dates().items())
+
+    for prev_date, path in sorted(sources, key=lambda x: x[0], reverse=True):
+        if before and prev_date >= before:
+            continue
+        try:
+            prev = rs.load_ratios(path)
+        except Exception:
+            continue
+        prev_data = {**(prev.get("all_data", {}) or {}), **(prev.get("data", {}) or {})}
+        if prev_data:
+            return prev_data
+    return {}
+
+
+def load_previous_streaks(before: str | None = None) -> dict:
+    """前回結果から、FlowScore70+の連続日数を復元。"""
+    return {t: int(d.get("flow_streak_high", 0)) for t, d in load_previous_records(before).items()}
 
 
 def is_watch_state(flow_details: dict) -> bool:
@@ -1622,46 +879,254 @@ def determine_level(ma_score: float) -> int:
     return 0
 
 
+def get_explanation(
+    market_cap_oku: float,
+    flow_score: float,
+    pbr: float | None,
+    vol_ratio: float,
+    price_change_5d: float,
+    shares_outstanding: int | None,
+    event_score: float,
+) -> str:
+    """観測された数値を並べた中立的な説明文（推奨・助言の表現は使わない）。"""
+    parts: list[str] = []
+    if market_cap_oku:
+        parts.append(f"時価総額 約{int(market_cap_oku):,}億円")
+    parts.append(f"需給スコア {round(float(flow_score), 1)}")
+    if vol_ratio:
+        parts.append(f"出来高は平常時の{vol_ratio}倍")
+    parts.append(f"5日間の値動き {price_change_5d:+.1f}%")
+    if pbr is not None and pd.notna(pbr) and pbr > 0:
+        parts.append(f"PBR {float(pbr):.2f}倍")
+    if event_score > 0:
+        parts.append("イベント近接")
+    return " / ".join(parts)
+
+
+def build_result_record(
+    ticker: str,
+    *,
+    name: str,
+    latest_price: float,
+    vol_ratio: float,
+    price_change_5d: float,
+    flow_details: dict,
+    flow_streak_high: int,
+    market_cap_oku: float,
+    pbr: float | None,
+    shares_outstanding: int | None,
+    shares_outstanding_is_estimated: bool,
+    updated_at: str,
+) -> dict:
+    """1銘柄・1日分の結果レコード（ratios.json の data / all_data の要素）を組み立てる。"""
+    flow_score = float(flow_details["flow_score"])
+    in_range = (MARKET_CAP_MIN <= market_cap_oku <= MARKET_CAP_MAX)
+    watch_flag = is_watch_state(flow_details)
+    display_state = '要監視' if watch_flag else '観測中'
+
+    reorg_score = calculate_reorg_score(market_cap_oku, pbr)
+    event_score = 0.0
+    event_tags = []
+    explanation = get_explanation(
+        market_cap_oku, flow_score, pbr, vol_ratio, price_change_5d, shares_outstanding, event_score
+    )
+    combined_score = round(flow_score * 0.55 + reorg_score * 0.35 + event_score * 0.10, 1)
+
+    tags = []
+    if vol_ratio >= 3.0:
+        tags.append('出来高急増')
+    if price_change_5d <= 5.0 and flow_score >= FLOW_SCORE_HIGH:
+        tags.append('低ボラ蓄積')
+    if shares_outstanding_is_estimated:
+        tags.append('株数推定')
+    tags.extend(event_tags)
+
+    ratio_value = round(vol_ratio, 2)
+
+    level = 3 if (flow_score >= FLOW_SCORE_HIGH or ratio_value >= 3.0) else (2 if flow_score >= FLOW_SCORE_MEDIUM else 1)
+
+    return {
+        'ticker': ticker,
+        'name': name,
+        # app.py が毎回解決し直さなくて済むよう、最終的な表示名をここで決めておく
+        'display_name': nr.display_name(ticker, jpx_names=JPX_NAME_MAP, master=TICKER_NAMES, fallback_name=name),
+        'price': round(latest_price, 1),
+        'volume_ratio': ratio_value,
+        'flow_score': round(flow_score, 1),
+        'flow_streak_high': int(flow_streak_high),
+        'market_cap_oku': round(market_cap_oku, 0),
+        'pbr': round(float(pbr), 2) if pbr and pd.notna(pbr) else None,
+        'reorg_score': round(reorg_score, 1),
+        'event_score': round(event_score, 1),
+        'combined_score': combined_score,
+        'ma_score': combined_score,
+        'level': level,
+        'in_cap_range': bool(in_range),
+        'shares_outstanding': int(shares_outstanding) if shares_outstanding else None,
+        'shares_outstanding_is_estimated': bool(shares_outstanding_is_estimated),
+        'display_state': display_state,
+        'tags': tags,
+        'explanation': explanation,
+        'updated_at': updated_at,
+    }
+
+
+def build_ratios_output(
+    results: dict,
+    qualified: dict,
+    *,
+    updated_at: str,
+    date: str,
+    target_universe_size: int,
+    missing_universe: list[str],
+    run_mode: str,
+) -> dict:
+    """results / qualified から ratios.json の出力オブジェクトを組み立てる（並び替え・LEVEL集計・通知候補）。"""
+    filtered = {k: v for k, v in results.items() if v.get("in_cap_range")}
+    sorted_qualified = dict(sorted(qualified.items(), key=lambda x: (int(x[1].get("level",0)), float(x[1].get("ma_score",0)), float(x[1].get("flow_score",0))), reverse=True))
+    sorted_filtered = dict(sorted(filtered.items(), key=lambda x: (int(x[1].get("level",0)), float(x[1].get("ma_score",0)), float(x[1].get("flow_score",0))), reverse=True))
+
+    level_counts = {}
+    notification_candidates = {}
+    for t, r in sorted_qualified.items():
+        lv = int(r.get("level", 0))
+        level_counts[lv] = level_counts.get(lv, 0) + 1
+        if lv >= 3 or float(r.get("flow_score", 0)) >= FLOW_SCORE_HIGH:
+            notification_candidates[t] = r
+
+    return {
+        "updated_at": updated_at,
+        "date": date,
+        "market_cap_range": f"{MARKET_CAP_MIN}億〜{MARKET_CAP_MAX}億円",
+        "target_universe_size": target_universe_size,
+        "notification_candidate_count": len(notification_candidates),
+        "total_count": len(sorted_qualified),
+        "all_count": len(results),
+        "filtered_count": len(filtered),
+        "level_counts": level_counts,
+        "data": sorted_qualified,
+        "all_data": sorted_filtered,
+        "notification_candidates": notification_candidates,
+        "missing_universe": missing_universe,
+        "run_mode": run_mode,
+        "disclaimer": "本ツールは市場データの可視化を目的とした補助ツールです。銘柄推奨・売買助言ではありません。",
+    }
+
+
+def schedule_tickers(
+    tickers: list[str],
+    kabuplus_info: dict,
+    kabuplus_history: dict,
+    prev_records: dict,
+) -> list[str]:
+    """
+    時間予算つき実行の処理順。打ち切られても価値の高い銘柄から結果が残るように並べる。
+    1) KABU+ 履歴あり（ネットワーク不要で安い）→ 履歴なし（yfinance フォールバックで高い）は最後
+    2) 同じ区分の中では前回 LEVEL 3 以上 → 時価総額の大きい順
+    シャードとは無関係に優先度だけで並べる（手元に溜まる履歴は HistoryShardWriter が途中書き出しで抑える）。
+    """
+    def priority(ticker: str):
+        expensive = 0 if ticker in kabuplus_history else 1
+        prev_level = int((prev_records.get(ticker) or {}).get("level", 0) or 0)
+        market_cap = float((kabuplus_info.get(ticker) or {}).get("marketCap") or 0)
+        return (expensive, 0 if prev_level >= 3 else 1, -market_cap, ticker)
+
+    return sorted(tickers, key=priority)
+
+
+def apply_support_zones(results: dict, zones: dict) -> None:
+    """sz.SupportBatch.compute() の結果を結果レコードに書き込む（位置は support_position だけに持ち、tags には加えない）"""
+    for ticker, z in zones.items():
+        rec = results.get(ticker)
+        if rec is not None:
+            rec.update(z)
+
+
 def fetch_volume_data(
     tickers: list[str],
     chunk_size: int = 50,
     kabuplus_info: dict | None = None,
     kabuplus_history: dict | None = None,
-) -> tuple[dict, dict, dict, list]:
+    history_writer: HistoryShardWriter | None = None,
+    deadline: float | None = None,
+    failures: dict | None = None,
+    session_date: str | None = None,
+) -> tuple[dict, dict]:
+    """
+    銘柄ごとにスコアを計算し (results, qualified) を返す。
+    OHLCV は history_writer にシャード単位で流し込み、手元には保持しない。
+    kabuplus_history の各エントリは使い終わった時点で pop して解放する。
+    deadline（time.perf_counter() 基準）を過ぎたら打ち切り、残りの銘柄は結果に含めない（＝未取得扱い）。
+    failures を渡すと、結果に入らなかった銘柄の理由（retry_queue.REASON_*）を書き込む。
+    session_date は今回の取引日（YYYY-MM-DD）。連続日数はそれより前の取引日の結果から引き継ぐ（省略時は実行日）。
+    """
     results: dict = {}
     qualified: dict = {}
-    stock_history: dict = {}
-    shards: list[dict] = [{} for _ in range(HISTORY_SHARD_COUNT)]
-    prev_streaks = load_previous_streaks()
-    total = len(tickers)
-    now_jst = datetime.now(JST)
+    now_jst = rb.now(JST)
     if kabuplus_info is None:
         kabuplus_info = {}
     if kabuplus_history is None:
         kabuplus_history = {}
+    if failures is None:
+        failures = {}
+    prev_records = load_previous_records(before=session_date or now_jst.strftime('%Y-%m-%d'))
+    prev_streaks = {t: int(d.get("flow_streak_high", 0)) for t, d in prev_records.items()}
+    tickers = schedule_tickers(tickers, kabuplus_info, kabuplus_history, prev_records)
+    total = len(tickers)
+    if history_writer is not None:
+        history_writer.plan(tickers)
+
+    # 下値ライン・高出来高ゾーンはループ後に全銘柄まとめて計算する（直近の足だけ控える）
+    support_batch = sz.SupportBatch()
+
+    # yfinance フォールバック1銘柄あたりの所要時間（移動平均）。締切までに終わらない見込みなら着手しない
+    expensive_cost = 0.0
+    stopped_at = None
+    budget_skipped: list[str] = []
+
+    def skip_for_budget(ticker: str) -> None:
+        failures[ticker] = rq.REASON_BUDGET
+        if history_writer is not None:
+            # 保存済みの履歴はそのまま残し、シャードを欠けのない状態で書き出す
+            history_writer.keep_existing(ticker)
+            history_writer.done(ticker)
 
     for i in range(0, total, chunk_size):
         chunk = tickers[i:i + chunk_size]
         print(f"📥 データ取得中: {i+1}〜{min(i+chunk_size, total)} / {total}")
 
-        for ticker in chunk:
+        for j, ticker in enumerate(chunk):
+            expensive = ticker not in kabuplus_history
+            if deadline is not None:
+                t_now = time.perf_counter()
+                if t_now >= deadline:
+                    stopped_at = i + j
+                    break
+                if expensive and t_now + expensive_cost >= deadline:
+                    # 締切までに終わらない見込みの高い銘柄だけ飛ばし、安い（KABU+ 履歴のある）銘柄は締切まで続ける
+                    budget_skipped.append(ticker)
+                    skip_for_budget(ticker)
+                    continue
+            t_start = time.perf_counter()
             try:
-                cached_hist = kabuplus_history.get(ticker)
+                cached_hist = kabuplus_history.pop(ticker, None)
                 if cached_hist and cached_hist.get('dates'):
                     df = pd.DataFrame({
                         'Open': pd.to_numeric(cached_hist.get('O', []), errors='coerce'),
                         'High': pd.to_numeric(cached_hist.get('H', []), errors='coerce'),
                         'Low': pd.to_numeric(cached_hist.get('L', []), errors='coerce'),
                         'Close': pd.to_numeric(cached_hist.get('C', []), errors='coerce'),
-                        'Volume': pd.to_numeric(cached_hist.get('V', []), errors='coerce').fillna(0),
+                        'Volume': pd.to_numeric(cached_hist.get('V', []), errors='coerce'),
                     }, index=pd.to_datetime(cached_hist.get('dates', []), errors='coerce'))
+                    df['Volume'] = df['Volume'].fillna(0)
                     df.index.name = 'Date'
                     df = df[~df.index.isna()].dropna(subset=['Open', 'High', 'Low', 'Close'])
                     df = df.sort_index()
+                    del cached_hist
                 else:
                     # KABU+ 履歴にない場合のみ yfinance にフォールバック
-                    data = yf.download(
-                        tickers=[ticker],
+                    data = rb.yf_download(
+                        ticker,
                         period='1y',
                         interval='1d',
                         auto_adjust=True,
@@ -1669,12 +1134,13 @@ def fetch_volume_data(
                         threads=False,
                     )
                     if data is None or data.empty:
+                        listed = (not kabuplus_info) or ticker in kabuplus_info
+                        failures[ticker] = rq.REASON_NO_DATA if listed else rq.REASON_NOT_LISTED
                         continue
-                    if isinstance(data.columns, pd.MultiIndex):
-                        data.columns = data.columns.get_level_values(0)
                     df = data[["Open", "High", "Low", "Close", "Volume"]].copy().dropna()
 
                 if len(df) < 60:
+                    failures[ticker] = rq.REASON_INSUFFICIENT_BARS
                     continue
 
                 flow_details = calculate_flow_score(df)
@@ -1714,8 +1180,7 @@ def fetch_volume_data(
                                 shares_outstanding = None
                 else:
                     try:
-                        stock = yf.Ticker(ticker)
-                        info = stock.info or {}
+                        info = rb.yf_info(ticker)
                         mc = info.get('marketCap', 0) or 0
                         if mc:
                             market_cap_oku = round(float(mc) / 1e8, 0)
@@ -1736,98 +1201,86 @@ def fetch_volume_data(
                     except Exception:
                         pass
 
-                hist_payload = {
-                    'dates': [d.strftime('%Y-%m-%d') for d in df.index],
-                    'O': [round(float(v), 1) for v in df['Open']],
-                    'H': [round(float(v), 1) for v in df['High']],
-                    'L': [round(float(v), 1) for v in df['Low']],
-                    'C': [round(float(v), 1) for v in df['Close']],
-                    'V': [int(float(v)) for v in df['Volume']],
-                    'info': {
-                        'marketCap': info.get('marketCap'),
-                        'sharesOutstanding': info.get('sharesOutstanding'),
-                        'dividendRate': info.get('dividendRate'),
-                        'trailingAnnualDividendRate': info.get('trailingAnnualDividendRate'),
-                        'payoutRatio': info.get('payoutRatio'),
-                        'dividendYield': info.get('dividendYield'),
-                        'trailingAnnualDividendYield': info.get('trailingAnnualDividendYield'),
-                        'shortName': info.get('shortName'),
-                        'longName': info.get('longName'),
-                    },
+                hist_payload = hp.payload_from_frame(df)
+                hist_payload['info'] = {
+                    'marketCap': info.get('marketCap'),
+                    'sharesOutstanding': info.get('sharesOutstanding'),
+                    'dividendRate': info.get('dividendRate'),
+                    'trailingAnnualDividendRate': info.get('trailingAnnualDividendRate'),
+                    'payoutRatio': info.get('payoutRatio'),
+                    'dividendYield': info.get('dividendYield'),
+                    'trailingAnnualDividendYield': info.get('trailingAnnualDividendYield'),
+                    'shortName': info.get('shortName'),
+                    'longName': info.get('longName'),
                 }
-                stock_history[ticker] = hist_payload
-                shards[hash_ticker_shard_id(ticker)][ticker] = hist_payload
+                if history_writer is not None:
+                    history_writer.add(ticker, hist_payload)
+                del hist_payload
 
                 name = get_japanese_name(ticker, api_name)
-                in_range = (MARKET_CAP_MIN <= market_cap_oku <= MARKET_CAP_MAX)
-                watch_flag = is_watch_state(flow_details)
-                display_state = '要監視' if watch_flag else '観測中'
-
                 prev_high = int(prev_streaks.get(ticker, 0))
                 flow_streak_high = prev_high + 1 if flow_score >= FLOW_SCORE_HIGH else 0
 
-                reorg_score = calculate_reorg_score(market_cap_oku, pbr)
-                event_score = 0.0
-                event_tags = []
-                explanation = get_explanation(
-                    market_cap_oku, flow_score, pbr, vol_ratio, price_change_5d, shares_outstanding, event_score
+                result = build_result_record(
+                    ticker,
+                    name=name,
+                    latest_price=latest_price,
+                    vol_ratio=vol_ratio,
+                    price_change_5d=price_change_5d,
+                    flow_details=flow_details,
+                    flow_streak_high=flow_streak_high,
+                    market_cap_oku=market_cap_oku,
+                    pbr=pbr,
+                    shares_outstanding=shares_outstanding,
+                    shares_outstanding_is_estimated=shares_outstanding_is_estimated,
+                    updated_at=now_jst.strftime('%Y-%m-%d %H:%M:%S'),
                 )
-                combined_score = round(flow_score * 0.55 + reorg_score * 0.35 + event_score * 0.10, 1)
-
-                tags = []
-                if vol_ratio >= 3.0:
-                    tags.append('出来高急増')
-                if price_change_5d <= 5.0 and flow_score >= FLOW_SCORE_HIGH:
-                    tags.append('低ボラ蓄積')
-                if shares_outstanding_is_estimated:
-                    tags.append('株数推定')
-                tags.extend(event_tags)
-
-                ratio_value = round(vol_ratio, 2)
-
-                level = 3 if (flow_score >= FLOW_SCORE_HIGH or ratio_value >= 3.0) else (2 if flow_score >= FLOW_SCORE_MEDIUM else 1)
-                ma_score = combined_score
-
-                result = {
-                    'ticker': ticker,
-                    'name': name,
-                    'price': round(latest_price, 1),
-                    'volume_ratio': ratio_value,
-                    'flow_score': round(flow_score, 1),
-                    'flow_streak_high': int(flow_streak_high),
-                    'market_cap_oku': round(market_cap_oku, 0),
-                    'pbr': round(float(pbr), 2) if pbr and pd.notna(pbr) else None,
-                    'reorg_score': round(reorg_score, 1),
-                    'event_score': round(event_score, 1),
-                    'combined_score': combined_score,
-                    'ma_score': combined_score,
-                    'level': level,
-                    'in_cap_range': bool(in_range),
-                    'shares_outstanding': int(shares_outstanding) if shares_outstanding else None,
-                    'shares_outstanding_is_estimated': bool(shares_outstanding_is_estimated),
-                    'display_state': display_state,
-                    'tags': tags,
-                    'explanation': explanation,
-                    'updated_at': now_jst.strftime('%Y-%m-%d %H:%M:%S'),
-                }
+                in_range = result['in_cap_range']
                 results[ticker] = result
+                support_batch.add(ticker, df)
                 if in_range and flow_score >= FLOW_SCORE_MEDIUM:
                     qualified[ticker] = result
 
             except Exception as e:
                 print(f'❌ {ticker} 取得エラー: {e}')
+                failures[ticker] = rq.REASON_ERROR
                 continue
+            finally:
+                if history_writer is not None:
+                    history_writer.done(ticker)
+                if expensive:
+                    elapsed = time.perf_counter() - t_start
+                    expensive_cost = elapsed if expensive_cost == 0 else expensive_cost * 0.8 + elapsed * 0.2
+
+        if stopped_at is not None:
+            break
 
-    return results, qualified, stock_history, shards
+    t_support = time.perf_counter()
+    apply_support_zones(results, support_batch.compute())
+    print(f"📐 下値ライン・高出来高ゾーン: {len(support_batch)} 銘柄（{(time.perf_counter() - t_support) * 1000:.0f} ms）")
+
+    if budget_skipped:
+        print(f"⏳ 締切までに終わらない見込みの yfinance 銘柄 {len(budget_skipped)} 件を未取得扱い（次の再取得フェーズで処理）")
+    if stopped_at is not None:
+        skipped = tickers[stopped_at:]
+        print(f"⏳ 時間予算に達したため打ち切り: 残り {len(skipped)} 銘柄は未取得扱い（次の再取得フェーズで処理）")
+        for ticker in skipped:
+            skip_for_budget(ticker)
+
+    return results, qualified
 
 
 def main():
     global JPX_NAME_MAP
 
-    now_jst = datetime.now(JST)
+    started = time.perf_counter()
+    now_jst = rb.now(JST)
     updated_at = now_jst.strftime("%Y-%m-%d %H:%M:%S")
 
-    JPX_NAME_MAP = get_jpx_data()
+    if rb.replay_dir():
+        print(f"🎞️ 再生モード: {rb.replay_dir()}（ネットワークには接続しません）")
+    elif rb.record_dir():
+        print(f"⏺️ 録画モード: {rb.record_dir()}")
 
     print("=" * 60)
     print("🦅 HAGETAKA SCOPE - 日次候補抽出")
@@ -1835,9 +1288,32 @@ def main():
     print(f"⏰ 実行時刻: {updated_at} JST")
     print(f"🎯 対象: 時価総額 {MARKET_CAP_MIN}億〜{MARKET_CAP_MAX}億円（候補フィルタ / 監視対象は約{TARGET_UNIVERSE_SIZE}銘柄目標）")
 
+    # 再取得フェーズは当日の再取得キューだけを見る（再試行できる銘柄がなければ KABU+ の取得ごと省略）
+    retry_missing_only = os.environ.get("RETRY_MISSING_ONLY", "0").strip() in ("1", "true", "True")
+    queue = rq.RetryQueue.load(now_jst.strftime("%Y-%m-%d"))
+    retry_universe: list[str] = []
+    if retry_missing_only:
+        if not queue.loaded:
+            print("♻️ 再取得フェーズ: 当日の再取得キューがないため通常ユニバースで実行")
+            retry_missing_only = False
+        else:
+            retry_universe = queue.eligible(now_jst)
+            print(f"♻️ 再取得キュー: {len(queue.entries)} 件 {queue.summary()} / 今回の再試行対象 {len(retry_universe)} 件")
+            if not retry_universe:
+                print("♻️ 今再試行できる銘柄がないため終了（見込みなし・バックオフ待ちのみ）")
+                print(f"⏱️ 所要時間: {time.perf_counter() - started:.1f} 秒")
+                return
+
+    JPX_NAME_MAP = get_jpx_data()
+
     kabuplus_info = {}
     kabuplus_history = {}
     merged = pd.DataFrame()
+    staleness: dict = {}
+    # 再取得フェーズで当日CSVがまだ前日値のままの銘柄（処理せずキューに戻す）
+    still_stale: list[str] = []
+    # fetch_volume_data が kabuplus_history を消費するので、銘柄集合だけ先に控えておく
+    history_tickers: set = set()
 
     try:
         kp_id, kp_pw = kp.get_credentials()
@@ -1847,22 +1323,51 @@ def main():
             if not merged.empty:
                 kabuplus_info = kp.build_info_lookup(merged)
                 print(f"  → KABU+ 指標データ {len(kabuplus_info)} 銘柄")
-
-            print("📚 KABU+ からOHLCV履歴を一括取得中...")
-            price_history_df = kp.fetch_stock_prices_range(kp_id, kp_pw, days_back=400, min_rows=30)
-            if not price_history_df.empty:
-                kabuplus_history = kp.build_history_lookup(price_history_df, min_bars=30)
-                print(f"  → KABU+ 履歴データ {len(kabuplus_history)} 銘柄")
+                slice_path = ist.write_slice(merged, updated_at)
+                if slice_path:
+                    print(f"  → 指標スナップショット保存: {slice_path}")
+                staleness = kp.classify_staleness(merged)
+                counts = {s: 0 for s in (kp.STALENESS_CURRENT, kp.STALENESS_STALE, kp.STALENESS_SUSPENDED)}
+                for s in staleness.values():
+                    counts[s] = counts.get(s, 0) + 1
+                print(f"  → 当日値の鮮度: current {counts[kp.STALENESS_CURRENT]} / stale {counts[kp.STALENESS_STALE]} / suspended {counts[kp.STALENESS_SUSPENDED]}")
+
+            if retry_missing_only:
+                # 再取得フェーズ: 保存済みの履歴に当日足だけ継ぎ足す（400日分は取り直さない）
+                # 読むのは再試行する銘柄のシャードだけ。履歴のある銘柄の一覧は history/meta.json から
+                stored = load_stored_history_rows(retry_universe)
+                history_tickers = load_stored_history_tickers() | set(stored)
+                still_stale = [t for t in retry_universe if staleness.get(t) == kp.STALENESS_STALE]
+                targets = {t: stored[t] for t in retry_universe if t in stored and t not in still_stale}
+                # 保存済みの行がない銘柄は継ぎ足せないので、最初から取り直し対象にする
+                no_rows = [t for t in retry_universe if t not in stored and t not in still_stale]
+                del stored
+                kabuplus_history, need_full = kp.splice_latest_bars(targets, merged)
+                need_full += no_rows
+                print(f"  → 当日足の継ぎ足し {len(kabuplus_history)} 銘柄 / まだ前日値 {len(still_stale)} 銘柄 / 履歴の取り直し {len(need_full)} 銘柄")
+                if need_full:
+                    print("📚 KABU+ からOHLCV履歴を一括取得中（取り直し対象のみ使用）...")
+                    full_history = fetch_kabuplus_history_range(kp_id, kp_pw, updated_at)
+                    for t in need_full:
+                        if t in full_history:
+                            kabuplus_history[t] = full_history[t]
+                    history_tickers |= set(full_history)
+                    del full_history
             else:
-                print("  ⚠️ KABU+ 履歴データ取得失敗")
+                print("📚 KABU+ からOHLCV履歴を一括取得中...")
+                kabuplus_history = fetch_kabuplus_history_range(kp_id, kp_pw, updated_at)
+                history_tickers = set(kabuplus_history)
+                print(f"  → KABU+ 履歴データ {len(kabuplus_history)} 銘柄")
         else:
             print("  ⚠️ KABU+ 認証情報なし")
-    except Exception as e:
+    except (OSError, ValueError, KeyError) as e:
+        # 通信（requests の例外は OSError）・CSV/JSON の中身の不備だけを握りつぶす。
+        # NameError・TypeError などのバグまで「KABU+ エラー」にすると、取り直しが黙って止まり全銘柄が当日打ち切りになる
         print(f"  ⚠️ KABU+ エラー: {e}")
 
-    retry_missing_only = os.environ.get("RETRY_MISSING_ONLY", "0").strip() in ("1", "true", "True")
     existing_results, existing_qualified = ({}, {})
-    existing_history, existing_shards = ({}, [{} for _ in range(HISTORY_SHARD_COUNT)])
+    # 結果・アーカイブの日付は実行日ではなく取引日（採用した KABU+ 日次ファイルの営業日。休日の実行でも直近の営業日）
+    session_date = kp.price_session_date(merged) or now_jst.strftime("%Y-%m-%d")
 
     universe = build_target_universe_from_merged(merged, TARGET_UNIVERSE_SIZE)
     if not universe:
@@ -1874,92 +1379,104 @@ def main():
         universe = [t for t in universe if t in kabuplus_history]
 
     if retry_missing_only:
-        miss_path = Path("data/missing_universe.json")
-        if miss_path.exists():
-            try:
-                miss_obj = json.loads(miss_path.read_text(encoding="utf-8"))
-                retry_universe = miss_obj.get("tickers", []) or []
-                retry_universe = [t for t in retry_universe if (not kabuplus_history) or t in kabuplus_history]
-                if retry_universe:
-                    print(f"♻️ 再取得フェーズ: 未取得 {len(retry_universe)} 銘柄のみ再実行")
-                    universe = retry_universe
-                    existing_results, existing_qualified = load_existing_ratios_results()
-                    existing_history, existing_shards = load_existing_history_shards()
-                else:
-                    print("♻️ 再取得フェーズ: 未取得銘柄がないため通常ユニバースを使用")
-            except Exception as e:
-                print(f"⚠️ missing_universe 読み込み失敗: {e}")
+        # 当日値がまだ前日のままの銘柄は、次のフェーズで改めて当日足を継ぎ足す
+        for t in still_stale:
+            queue.record_failure(t, rq.REASON_STALE, now_jst)
+        pending = [t for t in retry_universe if t not in still_stale]
+        # KABU+ 履歴にない銘柄は当日中に取れる見込みがない
+        for t in pending:
+            if kabuplus_history and t not in kabuplus_history:
+                queue.record_failure(t, rq.REASON_NO_DATA, now_jst)
+        universe = [t for t in pending if (not kabuplus_history) or t in kabuplus_history]
+        print(f"♻️ 再取得フェーズ: 未取得 {len(universe)} 銘柄のみ再実行")
+        existing_results, existing_qualified = load_existing_ratios_results()
+    else:
+        # 初回フェーズでキューを作り直す
+        queue = rq.RetryQueue(now_jst.strftime("%Y-%m-%d"))
 
     print(f"📋 スキャン銘柄数: {len(universe)}")
 
-    results, qualified, stock_history, shards = fetch_volume_data(
+    # 今回の出力は新しい世代として作業用ディレクトリに書き、最後にまとめて公開する
+    snapshot = ss.SnapshotBuilder(updated_at)
+    write_legacy = os.environ.get("WRITE_LEGACY_STOCK_HISTORY", "0").strip() in ("1", "true", "True")
+    history_writer = HistoryShardWriter(
+        updated_at,
+        history_dir=snapshot.dir / "history",
+        merge_existing=retry_missing_only,
+        legacy_path=Path("data/stock_history.json") if write_legacy else None,
+        generation=snapshot.generation,
+    )
+    deadline = None
+    if FETCH_TIME_BUDGET_SEC > 0:
+        deadline = started + FETCH_TIME_BUDGET_SEC - FETCH_TIME_RESERVE_SEC
+        print(f"⏳ 時間予算: {FETCH_TIME_BUDGET_SEC:.0f} 秒（書き出し用に {FETCH_TIME_RESERVE_SEC:.0f} 秒を確保）/ 残り {deadline - time.perf_counter():.0f} 秒")
+    failures: dict = {}
+    results, qualified = fetch_volume_data(
         universe,
         kabuplus_info=kabuplus_info,
         kabuplus_history=kabuplus_history,
+        history_writer=history_writer,
+        deadline=deadline,
+        failures=failures,
+        session_date=session_date,
     )
+    history_writer.close()
+
+    finished_jst = rb.now(JST)
+    for t in results:
+        queue.record_success(t)
+    for t, reason in failures.items():
+        queue.record_failure(t, reason, finished_jst)
+    if not retry_missing_only:
+        # 当日CSVの「日時」が前営業日のままだった銘柄は、前日までの足で計算済み。
+        # 後のフェーズで当日足だけ継ぎ足して計算し直す
+        for t in results:
+            if staleness.get(t) == kp.STALENESS_STALE:
+                queue.record_failure(t, rq.REASON_STALE, finished_jst)
 
     if retry_missing_only and existing_results:
         results = merge_results_preserving_new(existing_results, results)
         qualified = merge_results_preserving_new(existing_qualified, qualified)
-        stock_history = merge_results_preserving_new(existing_history, stock_history)
-        merged_shards = existing_shards
-        for i, bucket in enumerate(shards):
-            if bucket:
-                merged_shards[i].update(bucket)
-        shards = merged_shards
-
-    filtered = {k: v for k, v in results.items() if v.get("in_cap_range")}
-    sorted_qualified = dict(sorted(qualified.items(), key=lambda x: (int(x[1].get("level",0)), float(x[1].get("ma_score",0)), float(x[1].get("flow_score",0))), reverse=True))
-    sorted_filtered = dict(sorted(filtered.items(), key=lambda x: (int(x[1].get("level",0)), float(x[1].get("ma_score",0)), float(x[1].get("flow_score",0))), reverse=True))
-
-    level_counts = {}
-    notification_candidates = {}
-    for t, r in sorted_qualified.items():
-        lv = int(r.get("level", 0))
-        level_counts[lv] = level_counts.get(lv, 0) + 1
-        if lv >= 3 or float(r.get("flow_score", 0)) >= FLOW_SCORE_HIGH:
-            notification_candidates[t] = r
 
     if retry_missing_only:
         base_universe = build_target_universe_from_merged(merged, TARGET_UNIVERSE_SIZE)
-        if kabuplus_history:
-            base_universe = [t for t in base_universe if t in kabuplus_history]
+        if history_tickers:
+            base_universe = [t for t in base_universe if t in history_tickers]
         if not base_universe:
             base_universe = build_universe_tickers()
         missing_universe = sorted(set(base_universe) - set(results.keys()))
     else:
         missing_universe = sorted(set(universe) - set(results.keys()))
 
-    output = {
-        "updated_at": updated_at,
-        "date": now_jst.strftime("%Y-%m-%d"),
-        "market_cap_range": f"{MARKET_CAP_MIN}億〜{MARKET_CAP_MAX}億円",
-        "target_universe_size": len(universe),
-        "notification_candidate_count": len(notification_candidates),
-        "total_count": len(sorted_qualified),
-        "all_count": len(results),
-        "filtered_count": len(filtered),
-        "level_counts": level_counts,
-        "data": sorted_qualified,
-        "all_data": sorted_filtered,
-        "notification_candidates": notification_candidates,
-        "missing_universe": missing_universe,
-        "run_mode": "retry_missing_only" if retry_missing_only else "full_scan",
-        "disclaimer": "本ツールは市場データの可視化を目的とした補助ツールです。銘柄推奨・売買助言ではありません。",
-    }
-
-    os.makedirs("data", exist_ok=True)
-    Path("data/ratios.json").write_text(json.dumps(output, ensure_ascii=False, indent=2), encoding="utf-8")
-    Path("data/missing_universe.json").write_text(json.dumps({"updated_at": updated_at, "tickers": missing_universe}, ensure_ascii=False, indent=2), encoding="utf-8")
-    print("💾 保存完了: data/ratios.json")
-    print(f"🎯 候補: {len(sorted_qualified)} 件 / 通知候補: {len(notification_candidates)} 件 / 未取得: {len(missing_universe)} 件")
-
-    write_history_shards(shards, updated_at)
+    output = build_ratios_output(
+        results,
+        qualified,
+        updated_at=updated_at,
+        date=session_date,
+        target_universe_size=len(universe),
+        missing_universe=missing_universe,
+        run_mode="retry_missing_only" if retry_missing_only else "full_scan",
+    )
 
-    if os.environ.get("WRITE_LEGACY_STOCK_HISTORY", "0").strip() in ("1", "true", "True"):
-        history_output = {"updated_at": updated_at, **stock_history}
-        Path("data/stock_history.json").write_text(json.dumps(history_output, ensure_ascii=False), encoding="utf-8")
-        print(f"💾 レガシー保存: data/stock_history.json ({len(stock_history)} 銘柄)")
+    rs.write_ratios(output, snapshot.dir / "ratios.json")
+    jsonio.write_json(snapshot.dir / "missing_universe.json", {"updated_at": updated_at, "tickers": missing_universe}, indent=True)
+    # M&A候補タブ用の静的バンドル（app.py は正規化・カード組み立てをせずにこれを表示する）
+    cv.write_bundle(snapshot.dir, output, generation=snapshot.generation)
+    # 診断用の銘柄 info（app.py は KABU+ を取り直さずに mmap で引く）。今回 KABU+ が取れなければ前の世代のものを引き継ぐ
+    info_count = isn.write_snapshot(snapshot.dir / isn.INFO_DIR, merged)
+    if info_count:
+        print(f"  → 銘柄 info スナップショット {info_count} 銘柄")
+    elif snapshot.base_generation and ss.path(isn.INFO_DIR, snapshot.base_generation).exists():
+        shutil.copytree(ss.path(isn.INFO_DIR, snapshot.base_generation), snapshot.dir / isn.INFO_DIR)
+        print(f"  → 銘柄 info スナップショットは前の世代（{snapshot.base_generation}）を引き継ぎ")
+    published = snapshot.publish()
+    archived = ast.archive_snapshot(published, output["date"], generation=snapshot.generation, updated_at=updated_at)
+    print(f"🗄️ アーカイブ: data/archive/dates/{output['date']}.json（{archived['files']} 件中 新規 {archived['new_objects']} 件 / {archived['new_bytes'] / 1024:.0f} KB・不要になった {archived['pruned']} 件を削除）")
+    queue.save(updated_at)
+    print(f"💾 保存完了: {published}（data/CURRENT = {snapshot.generation}）")
+    print(f"♻️ 再取得キュー: {len(queue.entries)} 件 {queue.summary()} / 次回再試行可能 {len(queue.eligible(finished_jst))} 件")
+    print(f"🎯 候補: {output['total_count']} 件 / 通知候補: {output['notification_candidate_count']} 件 / 未取得: {len(missing_universe)} 件")
+    print(f"⏱️ 所要時間: {time.perf_counter() - started:.1f} 秒")
 
 
 if __name__ == "__main__":
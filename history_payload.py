@@ -0,0 +1,97 @@
+"""
+履歴シャード（data/history/shard_XX.json）の OHLCV ペイロードを NumPy 配列から一括で作る
+─────────────────────────────────────
+従来の [round(float(v), 1) for v in ...] / [int(float(v)) for v in ...] / strftime と同じ値を返す。
+・価格: np.round で一括丸め → 10倍して .5 付近になる値だけ Python の round で丸め直す
+  （np.round は 10倍→rint なので、2進小数で .5 をわずかに下回る値（0.15 など）が round と食い違うため）
+・出来高: np.trunc（int(float(v)) と同じ 0 方向への切り捨て）
+・日付: 日単位の文字列表を1つ持ち回し、同じ日付は全銘柄を通して一度しか整形しない
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+# 日付ラベル表（_axis_base 日目から連続する "YYYY-MM-DD" の配列）
+_axis_base: int | None = None
+_axis_labels: np.ndarray = np.array([], dtype=object)
+
+
+def round1(values) -> np.ndarray:
+    """[round(float(v), 1) for v in values] と同じ値の float 配列"""
+    x = np.asarray(values, dtype=float)
+    out = np.round(x, 1)
+    scaled = x * 10.0
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        out[near_tie] = [round(float(v), 1) for v in x[near_tie]]
+    return out
+
+
+def trunc_int(values) -> np.ndarray:
+    """[int(float(v)) for v in values] と同じ値の int64 配列（NaN は事前に埋めておく）"""
+    return np.trunc(np.asarray(values, dtype=float)).astype(np.int64)
+
+
+def format_dates(values) -> np.ndarray:
+    """日付（DatetimeIndex / datetime64 配列）を "YYYY-MM-DD" の object 配列に（整形済みの日付は表から引く）"""
+    global _axis_base, _axis_labels
+    days = np.asarray(pd.DatetimeIndex(values).values, dtype="datetime64[D]").astype(np.int64)
+    if days.size == 0:
+        return np.array([], dtype=object)
+    lo, hi = int(days.min()), int(days.max())
+    if _axis_base is None or lo < _axis_base or hi >= _axis_base + len(_axis_labels):
+        base = lo if _axis_base is None else min(lo, _axis_base)
+        end = hi + 1 if _axis_base is None else max(hi + 1, _axis_base + len(_axis_labels))
+        _axis_labels = np.datetime_as_string(np.arange(base, end).astype("datetime64[D]"), unit="D").astype(object)
+        _axis_base = base
+    return _axis_labels[days - _axis_base]
+
+
+def ohlcv_payload(dates, o, h, l, c, v) -> dict:
+    """1銘柄分の {dates, O, H, L, C, V}（値は Python の str / float / int のリスト）"""
+    return {
+        "dates": format_dates(dates).tolist(),
+        "O": round1(o).tolist(),
+        "H": round1(h).tolist(),
+        "L": round1(l).tolist(),
+        "C": round1(c).tolist(),
+        "V": trunc_int(v).tolist(),
+    }
+
+
+def payload_from_frame(df: pd.DataFrame) -> dict:
+    """Open/High/Low/Close/Volume 列と日付インデックスを持つ DataFrame から1銘柄分のペイロード"""
+    return ohlcv_payload(
+        df.index,
+        df["Open"].to_numpy(),
+        df["High"].to_numpy(),
+        df["Low"].to_numpy(),
+        df["Close"].to_numpy(),
+        df["Volume"].to_numpy(),
+    )
+
+
+def payloads_from_panel(codes: np.ndarray, dates, o, h, l, c, v, min_bars: int = 1) -> dict:
+    """
+    銘柄→日付順に並んだ縦持ちの配列から {ticker: ペイロード} を一括で作る。
+    丸め・日付整形はパネル全体に1回だけかけ、銘柄ごとにはスライスして tolist するだけ。
+    codes は銘柄ごとに連続している必要がある（並び順は出現順のまま保つ）。
+    """
+    codes = np.asarray(codes)
+    if codes.size == 0:
+        return {}
+    labels = format_dates(dates)
+    cols = {"O": round1(o), "H": round1(h), "L": round1(l), "C": round1(c), "V": trunc_int(v)}
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], codes.size]
+    out: dict = {}
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        if e - s < min_bars:
+            continue
+        payload = {"dates": labels[s:e].tolist()}
+        for key, arr in cols.items():
+            payload[key] = arr[s:e].tolist()
+        out[f"{codes[s]}.T"] = payload
+    return out
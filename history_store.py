@@ -0,0 +1,121 @@
+"""
+診断用 OHLCV キャッシュ（history/shard_XX.json）の読み出し
+─────────────────────────────────────
+app.py・api_server.py・archive_store.py で共用する。シャードの割り当て（md5 % 64）は fetch_data.py の書き出し側と同じ。
+
+・read_shard(shard_id, generation) … 1シャードを読む（キャッシュしない。呼び出し側で st.cache_data / ShardCache を被せる）
+・lookup_row(ticker, load_shard, load_legacy) … 銘柄1件分の {dates, O, H, L, C, V, info}（シャード優先、無ければレガシー）
+・frame_from_row(row) … 上の行を Open/High/Low/Close/Volume の DataFrame に戻す
+・ShardCache … Streamlit の外（API サーバーなど）で使う、世代ごとのシャードのスレッドセーフな LRU
+"""
+
+from __future__ import annotations
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+import jsonio
+import snapshot_store as ss
+
+HISTORY_SHARD_COUNT = 64
+LEGACY_FLAT_PATH = Path("data/stock_history.json")
+
+
+def shard_id(ticker: str) -> int:
+    return int(hashlib.md5(ticker.encode("utf-8")).hexdigest(), 16) % HISTORY_SHARD_COUNT
+
+
+def read_shard(sid: int, generation: str | None = None) -> dict:
+    """世代の history/shard_XX.json（なければ・壊れていれば空 dict）"""
+    p = ss.path("history", generation) / f"shard_{sid:02d}.json"
+    if not p.exists():
+        return {}
+    try:
+        return jsonio.read_shard(p)
+    except Exception:
+        return {}
+
+
+def read_legacy_flat() -> dict:
+    """後方互換: 単一の stock_history.json（updated_at 等を除く）"""
+    if not LEGACY_FLAT_PATH.exists():
+        return {}
+    try:
+        data = jsonio.read_json(LEGACY_FLAT_PATH)
+        if not isinstance(data, dict):
+            return {}
+        for k in ("updated_at", "format"):
+            data.pop(k, None)
+        return data
+    except Exception:
+        return {}
+
+
+def lookup_row(
+    ticker: str,
+    load_shard: Callable[[int], dict],
+    load_legacy: Callable[[], dict] | None = None,
+) -> dict | None:
+    """銘柄1件分のキャッシュ（シャード優先、無ければレガシー）。load_* は呼び出し側のキャッシュ付き読み込み"""
+    row = load_shard(shard_id(ticker)).get(ticker)
+    if row and row.get("dates"):
+        return row
+    if load_legacy is not None:
+        legacy = load_legacy().get(ticker)
+        if legacy and legacy.get("dates"):
+            return legacy
+    return None
+
+
+def frame_from_row(row: dict | None) -> pd.DataFrame | None:
+    """{dates, O, H, L, C, V} から pandas DataFrame を復元"""
+    if not row or not row.get("dates"):
+        return None
+    try:
+        hist = pd.DataFrame({
+            "Open":   row["O"],
+            "High":   row["H"],
+            "Low":    row["L"],
+            "Close":  row["C"],
+            "Volume": row["V"],
+        }, index=pd.to_datetime(row["dates"]))
+        hist.index.name = "Date"
+        return hist
+    except Exception:
+        return None
+
+
+class ShardCache:
+    """(世代, シャード) 単位の LRU。新しい世代が公開されると古い世代のシャードは押し出されていく"""
+
+    def __init__(self, max_shards: int = 128):
+        self.max_shards = max_shards
+        self._shards: OrderedDict[tuple, dict] = OrderedDict()
+        self._legacy: dict | None = None
+        self._lock = threading.Lock()
+
+    def shard(self, sid: int, generation: str | None) -> dict:
+        key = (generation, sid)
+        with self._lock:
+            if key in self._shards:
+                self._shards.move_to_end(key)
+                return self._shards[key]
+        data = read_shard(sid, generation)
+        with self._lock:
+            self._shards[key] = data
+            self._shards.move_to_end(key)
+            while len(self._shards) > self.max_shards:
+                self._shards.popitem(last=False)
+        return data
+
+    def legacy(self) -> dict:
+        if self._legacy is None:
+            self._legacy = read_legacy_flat()
+        return self._legacy
+
+    def row(self, ticker: str, generation: str | None) -> dict | None:
+        return lookup_row(ticker, lambda sid: self.shard(sid, generation), self.legacy)
@@ -0,0 +1,152 @@
+"""
+KABU+ 指標データの日次スナップショット（data/indicators/indicators_YYYY-MM-DD.json）
+─────────────────────────────────────
+・当日の japan-all-stock-data（と株価CSVの一部）を、銘柄×項目の列形式で1日1ファイルに保存する
+・PBR・発行済株式数・配当などの推移を、取り直さずに全銘柄×期間で扱える（load_panel）
+・app.py は世代の info スナップショット（info_snapshot.py）がないとき、最新の日をローカルで読んでダウンロードを省く（read_slice → kp.build_info_lookup）
+
+形式:
+  {"date": "YYYY-MM-DD", "updated_at": "...",
+   "codes": ["1301", ...], "names": ["極洋", ...],
+   "columns": {"per": [...], "pbr": [...], ...}}   ※ 欠損は null
+"""
+
+from __future__ import annotations
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import jsonio
+
+INDICATORS_DIR = Path("data/indicators")
+
+# 保存する数値列（build_info_lookup が使う列を含む）
+SLICE_COLUMNS = (
+    "price",
+    "market_cap_m",
+    "per",
+    "pbr",
+    "eps",
+    "bps",
+    "dividend_yield",
+    "dividend_per_share",
+    "shares_outstanding",
+    "turnover_rate",
+)
+
+
+def slice_path(date: str) -> Path:
+    return INDICATORS_DIR / f"indicators_{date}.json"
+
+
+def list_slice_dates() -> list[str]:
+    """保存済みスナップショットの日付（昇順）"""
+    if not INDICATORS_DIR.exists():
+        return []
+    return sorted(p.stem.replace("indicators_", "") for p in INDICATORS_DIR.glob("indicators_*.json"))
+
+
+# ==========================================
+# 書き込み
+# ==========================================
+def _column_values(series: pd.Series) -> list:
+    values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float)
+    # 整数で表せる値は int に（発行済株式数など）、それ以外は小数4桁
+    out = []
+    for v in values:
+        if not np.isfinite(v):
+            out.append(None)
+        elif v == int(v):
+            out.append(int(v))
+        else:
+            out.append(round(float(v), 4))
+    return out
+
+
+def write_slice(merged_df: pd.DataFrame, updated_at: str, date: str | None = None) -> Path | None:
+    """
+    kp.fetch_merged_data の結果を1日分のスナップショットとして保存する。
+    date を省略すると株価CSVの日付（csv_date 列）、それもなければ updated_at の日付。
+    """
+    if merged_df is None or merged_df.empty or "code" not in merged_df.columns:
+        return None
+    if date is None:
+        if "csv_date" in merged_df.columns and merged_df["csv_date"].notna().any():
+            date = str(merged_df["csv_date"].dropna().iloc[0])
+        else:
+            date = updated_at[:10]
+
+    df = merged_df.drop_duplicates(subset=["code"], keep="last")
+    df = df.assign(code=df["code"].astype(str).str.strip()).sort_values("code", kind="mergesort")
+    obj = {
+        "date": date,
+        "updated_at": updated_at,
+        "codes": df["code"].tolist(),
+        "names": df["name"].fillna("").astype(str).tolist() if "name" in df.columns else [],
+        "columns": {col: _column_values(df[col]) for col in SLICE_COLUMNS if col in df.columns},
+    }
+    INDICATORS_DIR.mkdir(parents=True, exist_ok=True)
+    return jsonio.write_json(slice_path(date), obj, atomic=True)
+
+
+# ==========================================
+# 読み込み
+# ==========================================
+def read_slice(date: str | None = None) -> pd.DataFrame:
+    """
+    1日分を DataFrame（code, name, 各指標列）で読む。date を省略すると最新。
+    kp.build_info_lookup にそのまま渡せる。なければ空の DataFrame。
+    """
+    if date is None:
+        dates = list_slice_dates()
+        if not dates:
+            return pd.DataFrame()
+        date = dates[-1]
+    path = slice_path(date)
+    if not path.exists():
+        return pd.DataFrame()
+    obj = jsonio.read_json(path)
+    codes = obj.get("codes") or []
+    df = pd.DataFrame({"code": codes})
+    names = obj.get("names") or []
+    if len(names) == len(codes):
+        df["name"] = names
+    for col, values in (obj.get("columns") or {}).items():
+        df[col] = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=float)
+    df["csv_date"] = obj.get("date")
+    return df
+
+
+def load_panels(columns=SLICE_COLUMNS, since: str | None = None, until: str | None = None) -> dict:
+    """複数指標のパネルを {column: DataFrame} で返す（ファイルは1回ずつしか読まない）"""
+    columns = tuple(columns)
+    frames: dict = {col: {} for col in columns}
+    for date in list_slice_dates():
+        if (since and date < since) or (until and date > until):
+            continue
+        obj = jsonio.read_json(slice_path(date))
+        codes = obj.get("codes") or []
+        for col in columns:
+            values = (obj.get("columns") or {}).get(col)
+            if values is not None:
+                frames[col][date] = pd.Series(
+                    pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=float), index=codes
+                )
+    panels = {}
+    for col, by_date in frames.items():
+        if not by_date:
+            panels[col] = pd.DataFrame()
+            continue
+        panel = pd.DataFrame(by_date).T
+        panel.index = pd.to_datetime(panel.index)
+        panels[col] = panel.sort_index()
+    return panels
+
+
+def load_panel(column: str, since: str | None = None, until: str | None = None) -> pd.DataFrame:
+    """
+    指定した指標の 日付×銘柄コード のパネルを返す（行 = 日付の DatetimeIndex、列 = code）。
+    since / until（YYYY-MM-DD、両端含む）で期間を絞れる。
+    """
+    return load_panels((column,), since=since, until=until)[column]
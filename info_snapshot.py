@@ -0,0 +1,98 @@
+"""
+診断用の銘柄 info スナップショット（世代ごと・NumPy の .npy で mmap して引く）
+─────────────────────────────────────
+app.py は診断のたびに KABU+ の株価・指標CSVを丸ごと取り直して info 辞書を組み立てていた。
+日次ジョブ（fetch_data.py）が取得済みの同じデータを世代ディレクトリに書き、アプリはそれを読むだけにする。
+
+  data/snapshots/<世代>/info/
+    meta.json     … {"version", "fields", "count"}（最後に書く = 完成の目印）
+    codes.npy     … 銘柄コード（"7203" など、昇順・固定長文字列）
+    values.npy    … (銘柄, INFO_NUMERIC_FIELDS) の float64。欠損は NaN
+    names.npy     … 銘柄名（固定長文字列）
+
+・読み手は np.load(mmap_mode="r") で開くだけ（全体を読み込まない）。1銘柄は codes の二分探索で引く
+・辞書の形は kabuplus_client.build_info_lookup と同じ（kp.info_record）
+
+  snap = load_snapshot(ss.path(INFO_DIR, generation))
+  info = snap.get("7203.T") if snap else {}
+"""
+
+from __future__ import annotations
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import jsonio
+import kabuplus_client as kp
+
+INFO_DIR = "info"
+INFO_VERSION = 1
+_META = "meta.json"
+
+
+def write_snapshot(directory: Path, merged_df: pd.DataFrame) -> int:
+    """kp.fetch_merged_data の結果から directory に書く。書いた銘柄数（データがなければ 0 で何も書かない）"""
+    frame = kp.build_info_frame(merged_df)
+    if frame.empty:
+        return 0
+    codes = np.array([t[:-2] if t.endswith(".T") else t for t in frame.index], dtype=str)
+    order = np.argsort(codes, kind="stable")
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    np.save(directory / "codes.npy", codes[order])
+    np.save(directory / "values.npy", np.ascontiguousarray(frame[list(kp.INFO_NUMERIC_FIELDS)].to_numpy(dtype=np.float64)[order]))
+    np.save(directory / "names.npy", np.array(frame["name"].tolist(), dtype=str)[order])
+    jsonio.write_json(
+        directory / _META,
+        {"version": INFO_VERSION, "fields": list(kp.INFO_NUMERIC_FIELDS), "count": int(len(codes))},
+        indent=True,
+    )
+    return int(len(codes))
+
+
+class InfoSnapshot:
+    def __init__(self, codes: np.ndarray, values: np.ndarray, names: np.ndarray):
+        self.codes = codes
+        self.values = values
+        self.names = names
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def _index(self, ticker: str) -> int | None:
+        code = str(ticker or "").replace(".T", "").strip().upper()
+        if not code or len(self.codes) == 0:
+            return None
+        i = int(np.searchsorted(self.codes, code))
+        return i if i < len(self.codes) and self.codes[i] == code else None
+
+    def __contains__(self, ticker: str) -> bool:
+        return self._index(ticker) is not None
+
+    def get(self, ticker: str) -> dict:
+        """info 辞書（kp.build_info_lookup と同じ形）。ない銘柄は {}"""
+        i = self._index(ticker)
+        if i is None:
+            return {}
+        return kp.info_record(str(self.names[i]), self.values[i])
+
+
+def load_snapshot(directory: Path) -> InfoSnapshot | None:
+    """mmap で開く。ない・版が違う・壊れている場合は None（呼び出し側は別の取得経路に回す）"""
+    directory = Path(directory)
+    try:
+        meta = jsonio.read_json(directory / _META)
+        if meta.get("version") != INFO_VERSION or meta.get("fields") != list(kp.INFO_NUMERIC_FIELDS):
+            return None
+        snap = InfoSnapshot(
+            np.load(directory / "codes.npy", mmap_mode="r"),
+            np.load(directory / "values.npy", mmap_mode="r"),
+            np.load(directory / "names.npy", mmap_mode="r"),
+        )
+    except Exception:
+        return None
+    if len(snap.codes) != meta.get("count") or snap.values.shape != (len(snap.codes), len(kp.INFO_NUMERIC_FIELDS)):
+        return None
+    return snap
@@ -0,0 +1,211 @@
+"""
+データファイル用の JSON 入出力（高速バックエンドの差し替え層）
+─────────────────────────────────────
+・orjson → msgspec → 標準 json の順に、入っているものを使う（JSONIO_BACKEND=json などで固定も可）
+・どのバックエンドでも同じバイト列になるように出力形式を揃える
+  - 区切りはコンパクト（","/":"）、indent=True のときだけ 2スペース字下げ（": " 区切り）
+  - 日本語はエスケープせず UTF-8 のまま
+  - NaN / Infinity は null（標準 json の NaN は JSON として不正なので揃えて null にする）
+  - dict の int キーは文字列キー、numpy のスカラー・配列はそのまま書ける
+  ※ 浮動小数の指数表記だけはバックエンドで綴りが異なる（1e-05 / 1e-5）。値としては同じ
+・シャード（data/history/shard_XX.json）と ratios.json v2 は型つきで検証しながら読める
+  （msgspec があればデコードと同時に検証、なければ読み込み後に同じ項目を手で検証）
+"""
+
+from __future__ import annotations
+import json
+import math
+import os
+from pathlib import Path
+from typing import Any, TypedDict
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 環境依存
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - 環境依存
+    msgspec = None
+
+
+def _pick_backend() -> str:
+    forced = os.environ.get("JSONIO_BACKEND", "").strip().lower()
+    available = {"orjson": orjson is not None, "msgspec": msgspec is not None, "json": True}
+    if forced:
+        if not available.get(forced):
+            raise ImportError(f"JSONIO_BACKEND={forced} は利用できません")
+        return forced
+    for name in ("orjson", "msgspec", "json"):
+        if available[name]:
+            return name
+    return "json"
+
+
+BACKEND = _pick_backend()
+
+
+class SchemaError(ValueError):
+    """シャード / ratios.json の構造が想定と違う"""
+
+
+# ==========================================
+# 型（検証つきデコード用）
+# ==========================================
+class HistoryRow(TypedDict, total=False):
+    dates: list[str]
+    O: list[float]
+    H: list[float]
+    L: list[float]
+    C: list[float]
+    V: list[int]
+    info: dict[str, Any]
+
+
+class RatiosV2(TypedDict):
+    format: str
+    summary: dict[str, Any]
+    columns: list[str]
+    records: dict[str, list[Any]]
+    views: dict[str, list[str]]
+    missing_universe: list[str]
+
+
+ShardDict = dict[str, HistoryRow]
+
+_OHLCV = ("O", "H", "L", "C", "V")
+
+
+# ==========================================
+# エンコード
+# ==========================================
+def _default(obj):
+    """直接扱えない値: numpy 系（tolist を持つもの）は Python 型に、それ以外（日付など）は文字列に"""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    return str(obj)
+
+
+def _sanitize(obj):
+    """標準 json 用: NaN/Inf → None、numpy → Python 型、int キー → 文字列キー"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {(k if isinstance(k, str) else str(_sanitize(k))): _sanitize(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_sanitize(v) for v in obj]
+    if isinstance(obj, (str, int, bool)) or obj is None:
+        return obj
+    if hasattr(obj, "tolist"):  # numpy のスカラー・配列
+        return _sanitize(obj.tolist())
+    return obj
+
+
+def dumps(obj, indent: bool = False) -> bytes:
+    """UTF-8 の bytes を返す"""
+    if BACKEND == "orjson":
+        opt = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            opt |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=opt)
+    if BACKEND == "msgspec":
+        # msgspec は int キーを文字列にしてくれるが、NaN 等はそのまま null になる
+        buf = msgspec.json.encode(obj, enc_hook=_default)
+        return msgspec.json.format(buf, indent=2) if indent else buf
+    if indent:
+        text = json.dumps(_sanitize(obj), ensure_ascii=False, indent=2, default=str, allow_nan=False)
+    else:
+        text = json.dumps(_sanitize(obj), ensure_ascii=False, separators=(",", ":"), default=str, allow_nan=False)
+    return text.encode("utf-8")
+
+
+def dumps_str(obj, indent: bool = False) -> str:
+    return dumps(obj, indent=indent).decode("utf-8")
+
+
+def write_json(path: Path, obj, indent: bool = False, atomic: bool = False) -> Path:
+    """ファイルに書く。atomic=True なら一時ファイル→置き換え"""
+    path = Path(path)
+    data = dumps(obj, indent=indent)
+    if atomic:
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    else:
+        path.write_bytes(data)
+    return path
+
+
+# ==========================================
+# デコード
+# ==========================================
+def loads(data: bytes | str):
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    if BACKEND == "msgspec":
+        return msgspec.json.decode(data)
+    return json.loads(data)
+
+
+def read_json(path: Path):
+    return loads(Path(path).read_bytes())
+
+
+def _check_shard(obj) -> ShardDict:
+    if not isinstance(obj, dict):
+        raise SchemaError("shard はオブジェクトである必要があります")
+    for ticker, row in obj.items():
+        if not isinstance(row, dict):
+            raise SchemaError(f"{ticker}: 行がオブジェクトではありません")
+        dates = row.get("dates")
+        if not isinstance(dates, list):
+            raise SchemaError(f"{ticker}: dates がありません")
+        for key in _OHLCV:
+            values = row.get(key)
+            if not isinstance(values, list) or len(values) != len(dates):
+                raise SchemaError(f"{ticker}: {key} の本数が dates と一致しません")
+        if "info" in row and not isinstance(row["info"], (dict, type(None))):
+            raise SchemaError(f"{ticker}: info がオブジェクトではありません")
+    return obj
+
+
+def _check_ratios_v2(obj) -> RatiosV2:
+    if not isinstance(obj, dict) or obj.get("format") != "ratios_v2":
+        raise SchemaError("ratios_v2 形式ではありません")
+    for key, typ in (("summary", dict), ("columns", list), ("records", dict), ("views", dict), ("missing_universe", list)):
+        if not isinstance(obj.get(key), typ):
+            raise SchemaError(f"ratios_v2: {key} がありません")
+    n = len(obj["records"].get("ticker") or [])
+    for col, values in obj["records"].items():
+        if not isinstance(values, list) or len(values) != n:
+            raise SchemaError(f"ratios_v2: 列 {col} の長さが ticker と一致しません")
+    return obj
+
+
+def decode_shard(data: bytes | str) -> ShardDict:
+    """シャード1ファイル分を検証しながら読む（銘柄→{dates, O, H, L, C, V, info}）"""
+    if BACKEND == "msgspec":
+        try:
+            obj = msgspec.json.decode(data, type=ShardDict)
+        except msgspec.ValidationError as e:
+            raise SchemaError(str(e)) from e
+    else:
+        obj = loads(data)
+    return _check_shard(obj)
+
+
+def decode_ratios_v2(data: bytes | str) -> RatiosV2:
+    """ratios.json（v2）を検証しながら読む"""
+    if BACKEND == "msgspec":
+        try:
+            obj = msgspec.json.decode(data, type=RatiosV2)
+        except msgspec.ValidationError as e:
+            raise SchemaError(str(e)) from e
+    else:
+        obj = loads(data)
+    return _check_ratios_v2(obj)
+
+
+def read_shard(path: Path) -> ShardDict:
+    return decode_shard(Path(path).read_bytes())
@@ -10,13 +10,17 @@ from __future__ import annotations
 import io
 import os
 from typing import Optional, Tuple
-from datetime import datetime, timedelta
+from datetime import timedelta
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
-import requests
 from requests.auth import HTTPBasicAuth
 
+import history_payload as hp
+import replay_bundle as rb
+
 # ==========================================
 # URL テンプレート
 # ==========================================
@@ -53,6 +57,17 @@ INDICATOR_COLUMNS = {
     "発行済株式数": "shares_outstanding",
 }
 
+# 株式分割・併合で使われる比率（1株→N株）。前日終値の乖離をこの格子に丸めて判定する
+_SPLIT_RATIOS = (1.1, 1.2, 1.25, 1.5, 2.0, 2.5, 3.0, 4.0, 5.0, 8.0, 10.0, 20.0, 25.0, 50.0, 100.0)
+_SPLIT_RATIO_GRID = np.array(sorted(set(_SPLIT_RATIOS) | {1.0 / r for r in _SPLIT_RATIOS}))
+
+# 最新値の鮮度区分（classify_staleness）
+STALENESS_CURRENT = "current"
+STALENESS_STALE = "stale"
+STALENESS_SUSPENDED = "suspended"
+# 「日時」がこの日数以上前なら、未更新ではなく売買停止などとみなす
+SUSPENDED_AFTER_DAYS = 7
+
 
 # ==========================================
 # 認証情報の取得
@@ -84,11 +99,11 @@ def _fetch_csv(
 ) -> pd.DataFrame:
     auth = HTTPBasicAuth(user_id, password)
     for days_back in range(max_days_back):
-        target = datetime.now() - timedelta(days=days_back)
+        target = rb.now() - timedelta(days=days_back)
         date_str = target.strftime("%Y%m%d")
         url = url_template.format(date=date_str)
         try:
-            resp = requests.get(url, auth=auth, timeout=60)
+            resp = rb.http_get(url, auth=auth, timeout=60)
             if resp.status_code != 200:
                 continue
             text = resp.content.decode("shift-jis", errors="replace")
@@ -100,6 +115,8 @@ def _fetch_csv(
             if "code" in df.columns:
                 df["code"] = df["code"].astype(str).str.strip()
             df = _clean_numeric(df)
+            # どの日付のファイルを採用したか（銘柄ごとの「日時」と比べて鮮度を判定する）
+            df["csv_date"] = target.strftime("%Y-%m-%d")
             return df
         except Exception:
             continue
@@ -133,18 +150,21 @@ def fetch_stock_prices(user_id: str, password: str) -> pd.DataFrame:
     return _fetch_csv(PRICES_URL, user_id, password, PRICE_COLUMNS)
 
 
-def fetch_stock_prices_for_date(date_str: str, user_id: str, password: str) -> pd.DataFrame:
-    """指定日の株価CSVを取得。date_str は YYYYMMDD。"""
+def _fetch_prices_day(date_str: str, user_id: str, password: str) -> Tuple[pd.DataFrame, str]:
+    """
+    指定日の株価CSVを取得し、(DataFrame, 状態) を返す。date_str は YYYYMMDD。
+    状態: "ok" / "closed"（ファイルがない・行数不足 = 休場日）/ "error"（通信エラー・サーバーエラー）
+    """
     auth = HTTPBasicAuth(user_id, password)
     url = PRICES_URL.format(date=date_str)
     try:
-        resp = requests.get(url, auth=auth, timeout=60)
+        resp = rb.http_get(url, auth=auth, timeout=60)
         if resp.status_code != 200:
-            return pd.DataFrame()
+            return pd.DataFrame(), ("closed" if resp.status_code == 404 else "error")
         text = resp.content.decode("shift-jis", errors="replace")
         df = pd.read_csv(io.StringIO(text))
         if df is None or df.empty or len(df) < 100:
-            return pd.DataFrame()
+            return pd.DataFrame(), "closed"
         rename = {k: v for k, v in PRICE_COLUMNS.items() if k in df.columns}
         df = df.rename(columns=rename)
         if "code" in df.columns:
@@ -152,26 +172,44 @@ def fetch_stock_prices_for_date(date_str: str, user_id: str, password: str) -> p
         df = _clean_numeric(df)
         if "timestamp" not in df.columns:
             df["timestamp"] = date_str
-        return df
+        df["csv_date"] = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}"
+        return df, "ok"
     except Exception:
-        return pd.DataFrame()
+        return pd.DataFrame(), "error"
+
+
+def fetch_stock_prices_for_date(date_str: str, user_id: str, password: str) -> pd.DataFrame:
+    """指定日の株価CSVを取得。date_str は YYYYMMDD。"""
+    return _fetch_prices_day(date_str, user_id, password)[0]
 
 
-def fetch_stock_prices_range(user_id: str, password: str, days_back: int = 400, min_rows: int = 30) -> pd.DataFrame:
+def fetch_stock_prices_range(
+    user_id: str,
+    password: str,
+    days_back: int = 400,
+    min_rows: int = 30,
+    closed_dates: Optional[set] = None,
+) -> pd.DataFrame:
     """
     過去複数日分のKABU+日次株価CSVを横断取得して結合する。
     営業日判定はHTTP 200かつ十分な行数があるかで行う。
+    closed_dates（set）を渡すと、休場日と判定できた日（YYYY-MM-DD）を追加する（fill_price_gaps 用）。
+    行は「日次ファイル（csv_date）× 銘柄」で1行。売買停止などで「日時」が前日のままの行も残すので、
+    同じ「日時」の行が複数ありうる（find_price_gaps がファイル単位で欠けを数えるため）。
+    足として使う前に fill_price_gaps か drop_duplicate_bars を通す。
     """
     frames = []
     seen_dates = set()
-    now = datetime.now()
+    now = rb.now()
     for offset in range(days_back):
         target = now - timedelta(days=offset)
         date_str = target.strftime('%Y%m%d')
         if date_str in seen_dates:
             continue
         seen_dates.add(date_str)
-        df = fetch_stock_prices_for_date(date_str, user_id, password)
+        df, status = _fetch_prices_day(date_str, user_id, password)
+        if status == "closed" and closed_dates is not None:
+            closed_dates.add(target.strftime('%Y-%m-%d'))
         if df.empty or len(df) < min_rows:
             continue
         if 'timestamp' not in df.columns:
@@ -182,10 +220,239 @@ def fetch_stock_prices_range(user_id: str, password: str, days_back: int = 400,
     merged = pd.concat(frames, ignore_index=True)
     if 'timestamp' in merged.columns:
         merged['timestamp'] = merged['timestamp'].astype(str).str.replace('/', '-', regex=False)
-    merged = merged.drop_duplicates(subset=['code', 'timestamp'], keep='last')
+    merged = merged.drop_duplicates(subset=['code', 'csv_date'], keep='last')
     return merged
 
 
+def drop_duplicate_bars(price_history_df: pd.DataFrame) -> pd.DataFrame:
+    """同じ銘柄・同じ「日時」の行を1本の足にまとめる（売買停止中の日次ファイルの行は前日の足と重なる）"""
+    if price_history_df is None or price_history_df.empty:
+        return price_history_df
+    return price_history_df.drop_duplicates(subset=['code', 'timestamp'], keep='last')
+
+
+def find_price_gaps(
+    price_history_df: pd.DataFrame,
+    closed_dates=(),
+    calendar: Optional[list] = None,
+) -> dict:
+    """
+    縦持ちの株価パネル（code, timestamp, ...）で、各銘柄の日付が営業日カレンダーに対して欠けている箇所を探す。
+    日付は取得元の日次ファイルの日付（csv_date 列）で数える。無ければ「日時」列。
+    （売買停止などで「日時」が古いままの行はファイルが取れている以上、取り直しても埋まらないため）
+    営業日カレンダーは「パネルに現れる日付」∪「期間内の平日 − closed_dates」（calendar で直接渡すことも可）。
+    欠けは銘柄ごとに最初の足〜最後の足の間だけで数える（上場前・上場廃止後は欠けにしない）。
+    戻り値: {日付(YYYY-MM-DD): [欠けている ticker, ...]}（日付順）
+    """
+    if price_history_df is None or price_history_df.empty:
+        return {}
+    if "code" not in price_history_df.columns or "timestamp" not in price_history_df.columns:
+        return {}
+
+    date_col = "csv_date" if "csv_date" in price_history_df.columns else "timestamp"
+    present = pd.DataFrame({
+        "code": price_history_df["code"].astype(str).str.strip().to_numpy(),
+        "date": _bar_dates(price_history_df[date_col]).to_numpy(),
+    }).dropna().drop_duplicates()
+    if present.empty:
+        return {}
+
+    if calendar is None:
+        observed = pd.DatetimeIndex(present["date"].unique())
+        weekdays = pd.bdate_range(observed.min(), observed.max())
+        closed = pd.DatetimeIndex(pd.to_datetime(list(closed_dates), errors="coerce")).dropna()
+        cal = observed.union(weekdays.difference(closed))
+    else:
+        cal = pd.DatetimeIndex(pd.to_datetime(list(calendar), errors="coerce")).dropna().unique()
+    cal = cal.sort_values()
+
+    # 銘柄ごとの [最初の足, 最後の足] をカレンダー上の位置に直し、期待される (code, date) を一括で作る
+    span = present.groupby("code", sort=True)["date"].agg(["min", "max"])
+    lo = cal.searchsorted(span["min"].to_numpy())
+    hi = cal.searchsorted(span["max"].to_numpy(), side="right")
+    counts = np.maximum(hi - lo, 0)
+    if counts.sum() == 0:
+        return {}
+    starts = np.repeat(lo - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    positions = starts + np.arange(counts.sum())
+    expected = pd.MultiIndex.from_arrays([np.repeat(span.index.to_numpy(), counts), cal[positions]])
+    actual = pd.MultiIndex.from_frame(present[["code", "date"]])
+    missing = expected.difference(actual)
+    if len(missing) == 0:
+        return {}
+
+    gaps: dict = defaultdict(list)
+    for code, date in missing:
+        gaps[date.strftime("%Y-%m-%d")].append(f"{code}.T")
+    return dict(sorted(gaps.items()))
+
+
+def fetch_stock_prices_for_dates(
+    dates,
+    user_id: str,
+    password: str,
+    max_workers: int = 8,
+) -> Tuple[dict, list, list]:
+    """
+    指定した日（YYYY-MM-DD）の株価CSVだけを並行取得する。
+    戻り値: ({日付: DataFrame}, 休場日だった日, 取得に失敗した日)
+    """
+    dates = sorted(set(dates))
+    if not dates:
+        return {}, [], []
+
+    def _one(date: str):
+        return date, _fetch_prices_day(date.replace("-", ""), user_id, password)
+
+    frames: dict = {}
+    closed: list = []
+    failed: list = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(dates)))) as ex:
+        for date, (df, status) in ex.map(_one, dates):
+            if status == "ok":
+                frames[date] = df
+            elif status == "closed":
+                closed.append(date)
+            else:
+                failed.append(date)
+    return frames, sorted(closed), sorted(failed)
+
+
+def fill_price_gaps(
+    price_history_df: pd.DataFrame,
+    user_id: str,
+    password: str,
+    closed_dates=(),
+    max_workers: int = 8,
+) -> Tuple[pd.DataFrame, dict]:
+    """
+    find_price_gaps で見つけた欠け日の日次CSVだけを並行取得し、欠けていた (銘柄, 日) の行を差し込む。
+    400日分を取り直さずに、欠けた日数に比例したコストで履歴を埋める。分割調整（adjust_for_splits）の前に呼ぶ。
+    欠けは日次ファイル単位（csv_date）で数え、戻り値は drop_duplicate_bars 済み（1銘柄1日1本）。
+    戻り値: (埋めた DataFrame, {"gap_dates", "filled_rows", "closed", "failed"})
+    """
+    report = {"gap_dates": [], "filled_rows": 0, "closed": [], "failed": []}
+    gaps = find_price_gaps(price_history_df, closed_dates=closed_dates)
+    if not gaps:
+        return drop_duplicate_bars(price_history_df), report
+    report["gap_dates"] = list(gaps)
+
+    frames, report["closed"], report["failed"] = fetch_stock_prices_for_dates(
+        gaps, user_id, password, max_workers=max_workers
+    )
+    patches = []
+    for date, day_df in frames.items():
+        if "code" not in day_df.columns:
+            continue
+        wanted = {t[:-2] for t in gaps[date]}
+        day_df = day_df[day_df["code"].astype(str).str.strip().isin(wanted)]
+        if not day_df.empty:
+            patches.append(day_df)
+    if not patches:
+        return drop_duplicate_bars(price_history_df), report
+
+    patch = pd.concat(patches, ignore_index=True)
+    patch["timestamp"] = patch["timestamp"].astype(str).str.replace("/", "-", regex=False)
+    report["filled_rows"] = len(patch)
+    filled = pd.concat([price_history_df, patch], ignore_index=True)
+    filled = filled.drop_duplicates(subset=["code", "csv_date"], keep="first")
+    return drop_duplicate_bars(filled), report
+
+
+def adjust_for_splits(
+    price_history_df: pd.DataFrame,
+    known_events: Optional[dict] = None,
+    checked_through: Optional[str] = None,
+    tolerance: float = 0.02,
+) -> Tuple[pd.DataFrame, dict]:
+    """
+    KABU+ の生株価（未調整）に株式分割・併合の調整をかける。
+    - 前日終値（prev_close）と、同銘柄の前営業日の実終値（price）の比から分割比を検出
+    - 検出はパネル全体に対する1回のベクトル演算（銘柄ごとのループなし）
+    - 分割日より前の O/H/L/C（と prev_close）を比で割り、出来高は掛ける（yfinance auto_adjust と同じ向き）
+    known_events / checked_through を渡すと、検出は checked_through より新しい日だけに絞り、既知イベントと合成する。
+    戻り値: (調整済み DataFrame, {ticker: [{"date": "YYYY-MM-DD", "ratio": 2.0}, ...]})
+    """
+    events: dict = {t: list(v) for t, v in (known_events or {}).items()}
+    if price_history_df is None or price_history_df.empty:
+        return price_history_df, events
+    required = ['code', 'timestamp', 'price', 'prev_close']
+    if any(c not in price_history_df.columns for c in required):
+        return price_history_df, events
+
+    df = price_history_df.copy()
+    df['code'] = df['code'].astype(str).str.strip()
+    df['_date'] = pd.to_datetime(df['timestamp'], errors='coerce').dt.normalize()
+    df = df.dropna(subset=['_date']).sort_values(['code', '_date'], kind='mergesort').reset_index(drop=True)
+
+    # 1) 検出: q = 前営業日の実終値 / 当日CSVの前日終値（分割 1:2 なら q=2、併合 10:1 なら q=0.1）
+    calendar = pd.Index(np.sort(df['_date'].unique()))
+    day_no = pd.Series(calendar.get_indexer(df['_date']), index=df.index)
+    grp = df.groupby('code', sort=False)
+    prev_price = grp['price'].shift(1)
+    prev_day_no = day_no.groupby(df['code'], sort=False).shift(1)
+    q = pd.to_numeric(prev_price, errors='coerce') / pd.to_numeric(df['prev_close'], errors='coerce')
+    cand = (
+        q.notna() & np.isfinite(q) & (q > 0)
+        & ((q - 1.0).abs() > 0.005)
+        & (day_no - prev_day_no == 1)  # 欠損日をまたぐ比較は誤検出になるので連続営業日のみ
+    )
+    if checked_through:
+        cand &= df['_date'] > pd.Timestamp(checked_through)
+
+    if cand.any():
+        log_q = np.log(q[cand].to_numpy(dtype=float))
+        log_r = np.log(_SPLIT_RATIO_GRID)
+        diff = np.abs(log_q[:, None] - log_r[None, :])
+        best = diff.argmin(axis=1)
+        ok = diff[np.arange(len(best)), best] <= np.log1p(tolerance)
+        hits = df.loc[cand].loc[ok, ['code', '_date']]
+        for code, d, r in zip(hits['code'], hits['_date'], _SPLIT_RATIO_GRID[best[ok]]):
+            ev_list = events.setdefault(f"{code}.T", [])
+            d_str = d.strftime('%Y-%m-%d')
+            if not any(e.get('date') == d_str for e in ev_list):
+                ev_list.append({'date': d_str, 'ratio': round(float(r), 6)})
+
+    if not events:
+        return price_history_df, events
+
+    # 2) 適用: 各行について「その日より後に起きたイベント比の積」を merge_asof で一括算出
+    ev_rows = [
+        (t[:-2] if t.endswith('.T') else t, pd.Timestamp(e['date']), float(e['ratio']))
+        for t, ev_list in events.items() for e in ev_list
+        if e.get('date') and float(e.get('ratio') or 0) > 0
+    ]
+    ev = pd.DataFrame(ev_rows, columns=['code', '_date', 'ratio'])
+    ev = ev[ev['code'].isin(set(df['code']))]
+    if ev.empty:
+        return price_history_df, events
+    ev['log_r'] = np.log(ev['ratio'])
+    ev = ev.sort_values(['code', '_date'])
+    ev['cum_log'] = ev.groupby('code')['log_r'].cumsum()
+    total_log = ev.groupby('code')['log_r'].sum()
+
+    df['_row'] = np.arange(len(df))
+    upto = pd.merge_asof(
+        df[['_row', 'code', '_date']].sort_values('_date'),
+        ev[['code', '_date', 'cum_log']].sort_values('_date'),
+        on='_date', by='code', direction='backward',
+    ).set_index('_row').sort_index()
+    after_log = df['code'].map(total_log).fillna(0.0).to_numpy() - upto['cum_log'].fillna(0.0).to_numpy()
+    factor = np.exp(after_log)
+    adjusted = factor != 1.0
+
+    if adjusted.any():
+        for col in ['open', 'high', 'low', 'price', 'prev_close', 'vwap']:
+            if col in df.columns:
+                vals = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+                df[col] = np.where(adjusted, vals / factor, vals)
+        if 'volume' in df.columns:
+            vol = pd.to_numeric(df['volume'], errors='coerce').to_numpy(dtype=float)
+            df['volume'] = np.where(adjusted, np.rint(vol * factor), vol)
+
+    return df.drop(columns=['_date', '_row']), events
+
+
 def build_history_lookup(price_history_df: pd.DataFrame, min_bars: int = 5) -> dict:
     """
     KABU+の複数日株価CSVから {ticker: OHLCV履歴} 辞書を構築する。
@@ -210,20 +477,125 @@ def build_history_lookup(price_history_df: pd.DataFrame, min_bars: int = 5) -> d
     df = df.dropna(subset=['open', 'high', 'low', 'price'])
     df['volume'] = df['volume'].fillna(0)
 
-    for code, g in df.groupby('code', sort=False):
-        g = g.sort_values('Date').drop_duplicates(subset=['Date'], keep='last')
-        if len(g) < min_bars:
+    # 銘柄は出現順のまま、銘柄内は日付順に並べ、丸め・日付整形はパネル全体に1回だけかける
+    df['_order'] = pd.factorize(df['code'])[0]
+    df = df.sort_values(['_order', 'Date'], kind='mergesort')
+    df = df.drop_duplicates(subset=['code', 'Date'], keep='last')
+    return hp.payloads_from_panel(
+        df['code'].to_numpy(),
+        df['Date'].to_numpy(),
+        df['open'].to_numpy(),
+        df['high'].to_numpy(),
+        df['low'].to_numpy(),
+        df['price'].to_numpy(),
+        df['volume'].to_numpy(),
+        min_bars=min_bars,
+    )
+
+
+def _bar_dates(timestamps: pd.Series) -> pd.Series:
+    """「日時」列（2026/10/16 15:00 / 2026/10/16 など表記ゆれあり）を日付だけに揃える"""
+    text = timestamps.astype(str).str.strip().str.slice(0, 10).str.replace("/", "-", regex=False)
+    return pd.to_datetime(text, format="%Y-%m-%d", errors="coerce")
+
+
+def price_session_date(prices_df: pd.DataFrame) -> Optional[str]:
+    """
+    株価CSVの営業日（YYYY-MM-DD）。採用した日次ファイルの日付（csv_date 列）、無ければ「日時」の最大値。
+    休日に実行しても直近の営業日になる（_fetch_csv は当日ファイルがなければ前日以前に遡る）。
+    """
+    if prices_df is None or prices_df.empty:
+        return None
+    if "csv_date" in prices_df.columns and prices_df["csv_date"].notna().any():
+        return str(prices_df["csv_date"].dropna().iloc[0])[:10]
+    if "timestamp" in prices_df.columns:
+        latest = _bar_dates(prices_df["timestamp"]).max()
+        if pd.notna(latest):
+            return latest.strftime("%Y-%m-%d")
+    return None
+
+
+def classify_staleness(prices_df: pd.DataFrame, session_date: Optional[str] = None) -> dict:
+    """
+    当日の株価CSV（japan-all-stock-prices-2）の「日時」列から、各銘柄の最新値を分類して
+    {ticker: "current" | "stale" | "suspended"} を返す。
+      current   … 日時が当日（CSV の営業日）
+      stale     … 日時が当日より前（CSV 作成時点でまだ当日分に更新されていない）
+      suspended … 株価がない、または日時が SUSPENDED_AFTER_DAYS 日以上前（売買停止など）
+    session_date（YYYY-MM-DD）を省略すると CSV の日付（csv_date 列、無ければ日時の最大値）を使う。
+    """
+    if prices_df is None or prices_df.empty or "timestamp" not in prices_df.columns or "code" not in prices_df.columns:
+        return {}
+
+    ts = _bar_dates(prices_df["timestamp"])
+    session_date = session_date or price_session_date(prices_df)
+    if not session_date:
+        return {}
+    session = pd.Timestamp(session_date)
+
+    price = pd.to_numeric(prices_df.get("price"), errors="coerce")
+    age_days = (session - ts).dt.days
+    status = np.where(
+        price.isna() | ts.isna() | (age_days >= SUSPENDED_AFTER_DAYS),
+        STALENESS_SUSPENDED,
+        np.where(age_days <= 0, STALENESS_CURRENT, STALENESS_STALE),
+    )
+    tickers = prices_df["code"].astype(str).str.strip() + ".T"
+    return dict(zip(tickers, status.tolist()))
+
+
+def splice_latest_bars(rows: dict, prices_df: pd.DataFrame, tolerance: float = 0.005) -> tuple[dict, list]:
+    """
+    保存済みの履歴行（{ticker: {dates, O, H, L, C, V, ...}}）に当日CSVの足を1本だけ継ぎ足す。
+    400日分を取り直さずに、再取得フェーズで当日分だけ更新するための軽量パス。
+    戻り値: (継ぎ足し後の行, 取り直しが必要な銘柄)
+      ・当日足が「日時」ベースで当日でない銘柄は、行をそのまま返す（呼び出し側で stale を除いておく）
+      ・前日終値が保存済みの最終終値と tolerance 以上ずれる銘柄（分割・併合や欠落日）は取り直しに回す
+    """
+    if not rows:
+        return {}, []
+    if prices_df is None or prices_df.empty:
+        return dict(rows), []
+
+    today = prices_df.copy()
+    today["ticker"] = today["code"].astype(str).str.strip() + ".T"
+    today["date"] = _bar_dates(today["timestamp"]).dt.strftime("%Y-%m-%d")
+    bars = today.drop_duplicates(subset=["ticker"], keep="last").set_index("ticker")
+
+    spliced: dict = {}
+    need_full: list = []
+    for ticker, row in rows.items():
+        if ticker not in bars.index or not row.get("dates"):
+            spliced[ticker] = row
+            continue
+        bar = bars.loc[ticker]
+        values = [bar.get(c) for c in ("open", "high", "low", "price")]
+        if bar.get("date") is None or pd.isna(bar.get("date")) or any(pd.isna(v) for v in values):
+            spliced[ticker] = row
+            continue
+        date = bar["date"]
+        dates = list(row["dates"])
+        if date < dates[-1]:
+            spliced[ticker] = row
+            continue
+        keep = len(dates) - 1 if date == dates[-1] else len(dates)
+        prev_close = bar.get("prev_close")
+        last_close = row["C"][keep - 1] if keep > 0 else None
+        if last_close and prev_close and not pd.isna(prev_close) and abs(float(prev_close) / float(last_close) - 1.0) > tolerance:
+            need_full.append(ticker)
             continue
-        ticker = f"{code}.T"
-        lookup[ticker] = {
-            'dates': [d.strftime('%Y-%m-%d') for d in g['Date']],
-            'O': [round(float(v), 1) for v in g['open']],
-            'H': [round(float(v), 1) for v in g['high']],
-            'L': [round(float(v), 1) for v in g['low']],
-            'C': [round(float(v), 1) for v in g['price']],
-            'V': [int(float(v)) for v in g['volume']],
-        }
-    return lookup
+        o, h, l, c = (round(float(v), 1) for v in values)
+        vol = bar.get("volume")
+        v = int(float(vol)) if vol is not None and not pd.isna(vol) else 0
+        new_row = dict(row)
+        new_row["dates"] = dates[:keep] + [date]
+        new_row["O"] = list(row["O"][:keep]) + [o]
+        new_row["H"] = list(row["H"][:keep]) + [h]
+        new_row["L"] = list(row["L"][:keep]) + [l]
+        new_row["C"] = list(row["C"][:keep]) + [c]
+        new_row["V"] = list(row["V"][:keep]) + [v]
+        spliced[ticker] = new_row
+    return spliced, need_full
 
 
 def fetch_stock_indicators(user_id: str, password: str) -> pd.DataFrame:
@@ -244,42 +616,87 @@ def fetch_merged_data(user_id: str, password: str) -> pd.DataFrame:
     )
 
 
+# build_info_frame の数値列（info 辞書のキーと同じ名前）
+INFO_NUMERIC_FIELDS = (
+    "marketCap",
+    "sharesOutstanding",
+    "priceToBook",
+    "currentPrice",
+    "dividendRate",
+    "dividendYield",
+)
+
+
+def _numeric(df: pd.DataFrame, col: str) -> pd.Series:
+    if col not in df.columns:
+        return pd.Series(np.nan, index=df.index, dtype=float)
+    return pd.to_numeric(df[col], errors="coerce").astype(float)
+
+
+def build_info_frame(merged_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    KABU+ データから info の数値列（INFO_NUMERIC_FIELDS）と name を、銘柄ごとに列演算でまとめて作る。
+    index は "1234.T" 形式。値がない項目は NaN（marketCap・dividendRate は 0）。
+    """
+    if merged_df is None or merged_df.empty or "code" not in merged_df.columns:
+        return pd.DataFrame(columns=["name", *INFO_NUMERIC_FIELDS], dtype=float)
+
+    df = merged_df[merged_df["code"].notna()]
+    codes = df["code"].astype(str).str.strip()
+    df = df[codes != ""]
+    codes = codes[codes != ""]
+
+    mcap_m = _numeric(df, "market_cap_m").fillna(0.0)
+    price = _numeric(df, "price").fillna(0.0)
+    shares = _numeric(df, "shares_outstanding").fillna(0.0)
+    pbr = _numeric(df, "pbr")
+    dividend_yield = _numeric(df, "dividend_yield")
+
+    # sharesOutstanding が KABU+ にない場合、時価総額/株価から推定
+    estimate = (shares <= 0) & (mcap_m > 0) & (price > 0)
+    shares = shares.where(~estimate, np.floor(mcap_m * 1_000_000 / price.where(price > 0, 1.0)))
+
+    out = pd.DataFrame({
+        "name": df["name"].fillna("").astype(str) if "name" in df.columns else "",
+        "marketCap": np.floor(mcap_m * 1_000_000),
+        "sharesOutstanding": np.floor(shares).where(shares != 0),
+        "priceToBook": pbr.where(pbr > 0),
+        "currentPrice": price.where(price != 0),
+        "dividendRate": _numeric(df, "dividend_per_share").fillna(0.0),
+        "dividendYield": (dividend_yield / 100.0).where(dividend_yield.fillna(0) != 0),
+    })
+    out.index = (codes + ".T").to_numpy()
+    # 同じコードが重複していれば後の行を使う（iterrows で辞書に入れていたときと同じ）
+    return out[~out.index.duplicated(keep="last")]
+
+
+def info_record(name: str, values) -> dict:
+    """build_info_frame の1行（name と INFO_NUMERIC_FIELDS の順の数値）を yf.Ticker().info 形式の辞書に"""
+    market_cap, shares, pbr, price, dividend_rate, dividend_yield = (float(v) for v in values)
+    return {
+        "marketCap": int(market_cap) if np.isfinite(market_cap) else 0,
+        "sharesOutstanding": int(shares) if np.isfinite(shares) else None,
+        "priceToBook": pbr if np.isfinite(pbr) else None,
+        "shortName": name,
+        "longName": name,
+        "currentPrice": price if np.isfinite(price) else None,
+        "dividendRate": dividend_rate if np.isfinite(dividend_rate) else 0.0,
+        "dividendYield": dividend_yield if np.isfinite(dividend_yield) else None,
+        "trailingAnnualDividendRate": None,
+        "trailingAnnualDividendYield": None,
+        "payoutRatio": None,
+    }
+
+
 def build_info_lookup(merged_df: pd.DataFrame) -> dict:
     """
     KABU+ データから {ticker: info_dict} の辞書を構築。
     fetch_data.py で yf.Ticker().info の代替として使う。
-    キーは "1234.T" 形式。
+    キーは "1234.T" 形式。欠損（NaN）の項目は 0 / None にする。
     """
-    lookup = {}
-    if merged_df.empty:
-        return lookup
-
-    for _, row in merged_df.iterrows():
-        code = str(row.get("code", ""))
-        if not code:
-            continue
-        ticker = f"{code}.T"
-        mcap_m = row.get("market_cap_m", 0) or 0
-        shares = row.get("shares_outstanding", 0) or 0
-        pbr_val = row.get("pbr", None)
-        price = row.get("price", 0) or 0
-        name = str(row.get("name", ""))
-
-        # sharesOutstanding が KABU+ にない場合、時価総額/株価から推定
-        if (not shares or shares <= 0) and mcap_m > 0 and price > 0:
-            shares = int(mcap_m * 1_000_000 / price)
-
-        lookup[ticker] = {
-            "marketCap": int(mcap_m * 1_000_000) if mcap_m else 0,
-            "sharesOutstanding": int(shares) if shares else None,
-            "priceToBook": float(pbr_val) if pbr_val and pbr_val > 0 else None,
-            "shortName": name,
-            "longName": name,
-            "currentPrice": float(price) if price else None,
-            "dividendRate": float(row.get("dividend_per_share", 0) or 0),
-            "dividendYield": float(row.get("dividend_yield", 0) or 0) / 100.0 if row.get("dividend_yield") else None,
-            "trailingAnnualDividendRate": None,
-            "trailingAnnualDividendYield": None,
-            "payoutRatio": None,
-        }
-    return lookup
+    frame = build_info_frame(merged_df)
+    if frame.empty:
+        return {}
+    values = frame[list(INFO_NUMERIC_FIELDS)].to_numpy(dtype=float)
+    names = frame["name"].tolist()
+    return {ticker: info_record(name, row) for ticker, name, row in zip(frame.index, names, values)}
@@ -0,0 +1,89 @@
+"""
+重い依存の遅延 import と、アプリ起動時間の計測
+─────────────────────────────────────
+Streamlit は再実行のたびに app.py を先頭から実行するが、import 済みのモジュールは sys.modules に残る。
+コールドスタート（プロセスで最初の実行）だけ pandas・plotly・yfinance・gspread・cryptography などの import を待つことになり、
+ログイン画面はそのどれも使わないのに表示が遅れていた。これらを「最初に属性を引いたとき」に import する。
+
+  yf = LazyModule("yfinance")
+  yf.download(...)            # ここで初めて import（所要時間を記録）
+
+起動時間:
+  mark("先頭の import", run_started)    … 実行開始からの経過を区切りとして記録（最初の実行のみ）
+  report(run_started)                  … 最初の実行の内訳をプロセスで1回だけ表示
+  その後に遅延 import したモジュールは、import した時点で1行ずつ表示する
+"""
+
+from __future__ import annotations
+import importlib
+import threading
+import time
+from types import ModuleType
+
+_lock = threading.Lock()
+_marks: list[tuple[str, float]] = []
+_loads: list[tuple[str, float]] = []
+_reported = False
+
+
+class LazyModule:
+    """属性を最初に引いたときに import するモジュールの代理（import は1回だけ・スレッドセーフ）"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: ModuleType | None = None
+        self._load_lock = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        with self._load_lock:
+            if self._module is None:
+                t0 = time.perf_counter()
+                module = importlib.import_module(self._name)
+                _record_load(self._name, time.perf_counter() - t0)
+                self._module = module
+        return self._module
+
+    def __getattr__(self, attr: str):
+        module = self._module if self._module is not None else self._load()
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule {self._name} ({state})>"
+
+
+def _record_load(name: str, elapsed: float) -> None:
+    with _lock:
+        _loads.append((name, elapsed))
+        reported = _reported
+    if reported:
+        print(f"⏱️ 遅延 import: {name} {elapsed:.2f}s")
+
+
+def mark(label: str, run_started: float) -> None:
+    """最初の実行の区切り（実行開始からの経過秒）。report 後は記録しない"""
+    with _lock:
+        if not _reported:
+            _marks.append((label, time.perf_counter() - run_started))
+
+
+def report(run_started: float) -> dict | None:
+    """最初の実行の内訳をプロセスで1回だけ表示する（2回目以降は None）"""
+    global _reported
+    with _lock:
+        if _reported:
+            return None
+        _reported = True
+        total = time.perf_counter() - run_started
+        marks = list(_marks)
+        loads = list(_loads)
+
+    parts = []
+    prev = 0.0
+    for label, at in marks:
+        parts.append(f"{label} {at - prev:.2f}s")
+        prev = at
+    print(f"⏱️ 起動時間（初回の実行）: 合計 {total:.2f}s ／ " + " ／ ".join(parts))
+    if loads:
+        print("⏱️ 初回の実行中に遅延 import: " + ", ".join(f"{name} {sec:.2f}s" for name, sec in loads))
+    return {"total_sec": total, "marks": marks, "lazy_imports": loads}
@@ -0,0 +1,119 @@
+"""
+銘柄の表示名（日本語名）の解決（fetch_data.py・app.py で共用）
+─────────────────────────────────────
+候補を優先順に並べ、日本語を含む名前（または英字表記が正式な社名）を最初に採用する。
+どれも当てはまらなければ最初の空でない候補、それもなければコード。
+
+・名前の辞書は data/ticker_name_master.json（版つき JSON）。fetch_data.py・app.py とも load_name_master() で読む
+・日次ジョブは結果レコードに display_name（最終的な表示名）を書き込む
+・app.py は display_name をそのまま使い、持っていない銘柄（古い世代・手入力の診断）だけここで解決する
+"""
+
+from __future__ import annotations
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable
+
+import jsonio
+
+_JP_CHARS = re.compile(r"[ぁ-んァ-ヶ一-龠々ー]")
+
+# 英字のままが正式な表示名の銘柄（英字だけでも採用する）
+BRAND_NAMES = frozenset({
+    "SHIFT", "TOWA", "ZOZO", "HENNGE", "GENDA", "MonotaRO", "Appier",
+    "BASE", "JTOWER", "Sansan", "Macbee Planet", "KLab", "LTS", "PR TIMES",
+    "THECOO", "WACUL", "CRI・ミドルウェア", "eBASE", "NOK", "NTN", "THK",
+    "TPR", "IHI", "SUBARU", "KYB", "JIG-SAW",
+})
+
+# 銘柄名マスター（手入れする辞書。{"version", "names": {グループ: {ticker: 名前}}, "supplemental": {ticker: 名前}}）
+NAME_MASTER_PATH = Path(__file__).resolve().parent / "data" / "ticker_name_master.json"
+NAME_MASTER_VERSION = 1
+
+
+@lru_cache(maxsize=4)
+def load_name_master(path: Path = NAME_MASTER_PATH) -> dict:
+    """
+    名前マスターを読み、{"version", "names": {ticker: 名前}（グループを平らにしてファイルの並び順）, "supplemental"} を返す。
+    ファイルがなければ空の辞書。対応していない版なら ValueError。
+    """
+    path = Path(path)
+    if not path.exists():
+        return {"version": NAME_MASTER_VERSION, "names": {}, "supplemental": {}}
+    raw = jsonio.read_json(path)
+    version = int(raw.get("version") or 0)
+    if version != NAME_MASTER_VERSION:
+        raise ValueError(f"{path}: 未対応の版です（version={version}）")
+    names: dict[str, str] = {}
+    for group in (raw.get("names") or {}).values():
+        for ticker, name in group.items():
+            names[str(ticker).strip()] = str(name).strip()
+    supplemental = {str(k).strip(): str(v).strip() for k, v in (raw.get("supplemental") or {}).items()}
+    return {"version": version, "names": names, "supplemental": supplemental}
+
+
+def master_names() -> dict[str, str]:
+    """名前マスター本体 {ticker: 名前}（fetch_data の固定ユニバースはこの並び順）"""
+    return load_name_master()["names"]
+
+
+def supplemental_names() -> dict[str, str]:
+    """名前マスターにない銘柄の補助辞書（マスター・JPX より優先度は低い）"""
+    return load_name_master()["supplemental"]
+
+
+
+def code_of(ticker: str) -> str:
+    """銘柄コード（"7203.T" → "7203"、"151a" → "151A"）"""
+    return str(ticker or "").replace(".T", "").strip().upper()
+
+
+def is_display_ready(name: str | None) -> bool:
+    """そのまま表示名として採用できるか（日本語を含む、または英字表記が正式な社名）"""
+    name = (name or "").strip()
+    return bool(name) and (bool(_JP_CHARS.search(name)) or name in BRAND_NAMES)
+
+
+def first_ready(candidates: Iterable[str | None]) -> str | None:
+    for cand in candidates:
+        cand = (cand or "").strip()
+        if cand and is_display_ready(cand):
+            return cand
+    return None
+
+
+def first_nonempty(candidates: Iterable[str | None]) -> str | None:
+    for cand in candidates:
+        cand = (cand or "").strip()
+        if cand:
+            return cand
+    return None
+
+
+def display_candidates(
+    ticker: str,
+    *,
+    jpx_names: dict | None = None,
+    master: dict | None = None,
+    fallback_name: str | None = None,
+    info: dict | None = None,
+) -> list[str | None]:
+    """表示名の候補（優先順）: JPX 上場一覧 → 名前マスター → 補助辞書 → 取得済みの名前 → info の社名"""
+    code = code_of(ticker)
+    key = f"{code}.T" if code else str(ticker or "").strip().upper()
+    info = info or {}
+    return [
+        (jpx_names or {}).get(code),
+        (master or {}).get(key),
+        supplemental_names().get(key),
+        fallback_name,
+        info.get("shortName"),
+        info.get("longName"),
+    ]
+
+
+def display_name(ticker: str, **sources) -> str:
+    """ネットワークに出ずに決まる表示名（引数は display_candidates と同じ）"""
+    candidates = display_candidates(ticker, **sources)
+    return first_ready(candidates) or first_nonempty(candidates) or code_of(ticker) or str(ticker or "")
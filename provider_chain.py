@@ -0,0 +1,273 @@
+"""
+複数のデータ提供元を健全性の順に試す取得チェーン（ヘッジ付きリクエスト・サーキットブレーカー）
+─────────────────────────────────────
+提供元ごとに成功率と応答時間を指数移動平均（EWMA）で持ち、期待コストの小さい順に試す。
+
+・ヘッジ: 先頭の提供元が呼ばれてから hedge_after 秒たっても応答しなければ、待ち続けたまま次の提供元も並行して呼び、先に返った方を使う
+  （ワーカーの空き待ちで始まっていない呼び出しは、始まるまでヘッジの時計を進めない）
+・見切った呼び出しのうち、まだ始まっていないものは取り消す（古い呼び出しがワーカーを塞いで後の取得を待たせないように）
+・ワーカー数は「同時に fetch する呼び出し元の数 × 提供元の数」以上にする（max_workers。既定は提供元の数 × 2）
+・失敗したら（None / 検証 NG / 例外）すぐ次の提供元へ。全体で total_timeout 秒を過ぎたら ProviderChainError
+・サーキットブレーカー: 連続 failure_threshold 回失敗した提供元は cooldown 秒呼ばない（開くたびに倍、max_cooldown まで）。
+  明けたら1回だけ試し（半開）、成功で閉じる・失敗で再び開く
+・どの提供元からも取れなかったキー（存在しない銘柄など）は提供元の不調とはみなさない。
+  None / 検証 NG は「他の提供元が取れたのに取れなかった」ときだけ失敗として数える（例外は常に失敗）
+・提供元の関数は「データがない」と答えられたときだけ None を返し、通信エラー・429 などは例外にすること
+  （None を返すと「データなし」と数えられ、ProviderChainError.exhausted の判定に使われる）
+
+  chain = ProviderChain("ohlcv", [("yfinance", fetch_a), ("stooq", fetch_b)], validate=lambda df: df is not None)
+  df = chain.fetch("7203.T")
+"""
+
+from __future__ import annotations
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Sequence
+
+# 成功率・応答時間の EWMA の重み（新しい観測の比重）
+EWMA_ALPHA = 0.3
+# 期待コスト = 応答時間 + (1 - 成功率) × この秒数
+FAILURE_PENALTY_SEC = 10.0
+
+
+class ProviderChainError(Exception):
+    """
+    取得できなかった。exhausted は「登録したすべての提供元に問い合わせ、すべてが（例外ではなく）データなしと答えた」とき True。
+    そのキー自体が無い（上場廃止・コード違い）可能性が高い。時間切れ・通信エラー・ブレーカーで呼ばなかった提供元があれば False
+    """
+
+    def __init__(self, message: str, exhausted: bool = False):
+        super().__init__(message)
+        self.exhausted = exhausted
+
+
+class ProviderHealth:
+    """提供元1つ分の健全性（ProviderChain のロック下で更新する）"""
+
+    def __init__(self, name: str, order: int):
+        self.name = name
+        self.order = order
+        self.success_rate = 1.0
+        self.latency: float | None = None
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.cooldown = 0.0
+        self.half_open = False
+
+    def expected_cost(self) -> float:
+        return (self.latency or 0.0) + (1.0 - self.success_rate) * FAILURE_PENALTY_SEC
+
+    def observe_latency(self, elapsed: float) -> None:
+        self.latency = elapsed if self.latency is None else self.latency * (1 - EWMA_ALPHA) + elapsed * EWMA_ALPHA
+
+    def to_dict(self, now: float) -> dict:
+        return {
+            "name": self.name,
+            "success_rate": round(self.success_rate, 3),
+            "latency_sec": None if self.latency is None else round(self.latency, 3),
+            "calls": self.calls,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "circuit": "open" if now < self.open_until else ("half_open" if self.half_open else "closed"),
+            "open_for_sec": max(0.0, round(self.open_until - now, 1)),
+        }
+
+
+class ProviderChain:
+    def __init__(
+        self,
+        name: str,
+        providers: Sequence[tuple[str, Callable[[str], Any]]],
+        *,
+        validate: Callable[[Any], bool] | None = None,
+        hedge_after: float = 3.0,
+        total_timeout: float = 30.0,
+        failure_threshold: int = 3,
+        cooldown: float = 60.0,
+        max_cooldown: float = 600.0,
+        max_workers: int | None = None,
+    ):
+        self.name = name
+        self._providers = {pname: fn for pname, fn in providers}
+        self._health = {pname: ProviderHealth(pname, i) for i, (pname, _) in enumerate(providers)}
+        self.validate = validate or (lambda v: v is not None)
+        self.hedge_after = hedge_after
+        self.total_timeout = total_timeout
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        # 打ち切った呼び出しは裏で走り終えるまでワーカーを使うので、同時に動かす提供元の数より多めに持つ
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers or 2 * len(self._providers),
+            thread_name_prefix=f"provider-{name}",
+        )
+
+    # ------------------------------------------
+    # 健全性
+    # ------------------------------------------
+    def ranked(self) -> list[str]:
+        """呼べる提供元を期待コストの小さい順に（ブレーカーが開いている・試し中の提供元は除く）"""
+        now = time.monotonic()
+        with self._lock:
+            usable = [h for h in self._health.values() if now >= h.open_until and not h.half_open]
+            usable.sort(key=lambda h: (h.expected_cost(), h.order))
+            return [h.name for h in usable]
+
+    def _claim(self, pname: str) -> bool:
+        """呼ぶ直前の確認。冷却明けの提供元は試しの1回として確保する（他で試し中・再び開いていれば False）"""
+        with self._lock:
+            h = self._health[pname]
+            if time.monotonic() < h.open_until or h.half_open:
+                return False
+            if h.open_until:
+                h.half_open = True
+            return True
+
+    def _record(self, pname: str, ok: bool, elapsed: float) -> None:
+        with self._lock:
+            h = self._health[pname]
+            h.calls += 1
+            h.observe_latency(elapsed)
+            h.success_rate = h.success_rate * (1 - EWMA_ALPHA) + (1.0 if ok else 0.0) * EWMA_ALPHA
+            if ok:
+                h.consecutive_failures = 0
+                h.open_until = 0.0
+                h.cooldown = 0.0
+                h.half_open = False
+                return
+            h.failures += 1
+            h.consecutive_failures += 1
+            if h.half_open or h.consecutive_failures >= self.failure_threshold:
+                h.cooldown = min(self.max_cooldown, h.cooldown * 2 if h.cooldown else self.base_cooldown)
+                h.open_until = time.monotonic() + h.cooldown
+                h.half_open = False
+
+    def _record_latency_only(self, pname: str, elapsed: float) -> None:
+        with self._lock:
+            h = self._health[pname]
+            h.calls += 1
+            h.observe_latency(elapsed)
+            if h.half_open:
+                # 試しの1回が「どこにも無いキー」だった: 判定できないので次の呼び出しでもう一度試す
+                h.half_open = False
+
+    def health(self) -> list[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [h.to_dict(now) for h in sorted(self._health.values(), key=lambda h: h.order)]
+
+    # ------------------------------------------
+    # 取得
+    # ------------------------------------------
+    def _release(self, pname: str) -> None:
+        """取り消した（呼ばなかった）試しの1回を手放す"""
+        with self._lock:
+            self._health[pname].half_open = False
+
+    def _call(self, pname: str, key: str, started: dict[str, float]) -> tuple[str, Any, bool, float]:
+        """ワーカースレッドで提供元を1回呼ぶ（戻り値: 提供元, 値, 例外だったか, 所要秒）。started に開始時刻を書く"""
+        t0 = time.monotonic()
+        started[pname] = t0
+        try:
+            value = self._providers[pname](key)
+            raised = False
+        except Exception as e:
+            value, raised = e, True
+        return pname, value, raised, time.monotonic() - t0
+
+    def fetch(self, key: str) -> Any:
+        """健全性の順に試し、最初に検証を通った値を返す。どれも取れなければ ProviderChainError"""
+        order = self.ranked()
+        if not order:
+            raise ProviderChainError(f"{self.name}: すべての提供元のブレーカーが開いています")
+
+        deadline = time.monotonic() + self.total_timeout
+        pending = list(order)
+        running: set[Future] = set()
+        names: dict[Future, str] = {}
+        started: dict[str, float] = {}
+        launched: list[str] = []
+        misses: list[tuple[str, float]] = []  # None / 検証 NG（他が取れたときだけ失敗に数える）
+        errors: list[str] = []
+
+        def launch() -> None:
+            while pending:
+                pname = pending.pop(0)
+                if self._claim(pname):
+                    fut = self._pool.submit(self._call, pname, key, started)
+                    running.add(fut)
+                    names[fut] = pname
+                    launched.append(pname)
+                    return
+
+        try:
+            launch()
+            while running:
+                now = time.monotonic()
+                remaining = deadline - now
+                if remaining <= 0:
+                    break
+                # 次の提供元が残っていれば、直前に呼んだ提供元が始まってから hedge_after 秒で見切りをつけて並走させる
+                hedge_at = started.get(launched[-1]) if pending else None
+                if not pending:
+                    timeout = remaining
+                elif hedge_at is None:
+                    timeout = min(self.hedge_after, remaining)
+                else:
+                    timeout = min(max(0.0, hedge_at + self.hedge_after - now), remaining)
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    hedge_at = started.get(launched[-1])
+                    if pending and hedge_at is not None and time.monotonic() >= hedge_at + self.hedge_after:
+                        launch()
+                    continue
+                for fut in done:
+                    running.discard(fut)
+                    pname, value, raised, elapsed = fut.result()
+                    if not raised and self.validate(value):
+                        self._record(pname, True, elapsed)
+                        for miss_name, miss_elapsed in misses:
+                            self._record(miss_name, False, miss_elapsed)
+                        return value
+                    if raised:
+                        self._record(pname, False, elapsed)
+                        errors.append(f"{pname}: {type(value).__name__}: {value}")
+                    else:
+                        misses.append((pname, elapsed))
+                        errors.append(f"{pname}: データなし")
+                    # 失敗したらヘッジの待ち時間を待たずに次へ
+                    if pending:
+                        launch()
+        finally:
+            # まだ始まっていない呼び出しは取り消す。走り出しているものは待たない（終わった時点で健全性だけ記録する）
+            for fut in running:
+                if fut.cancel():
+                    self._release(names[fut])
+                else:
+                    fut.add_done_callback(self._late_result)
+
+        for miss_name, miss_elapsed in misses:
+            self._record_latency_only(miss_name, miss_elapsed)
+        if running:
+            raise ProviderChainError(f"{self.name}: {self.total_timeout:.0f}秒以内に取得できませんでした（{key}）")
+        raise ProviderChainError(
+            f"{self.name}: {key} を取得できませんでした（{'; '.join(errors)}）",
+            exhausted=len(misses) == len(self._providers) and len(errors) == len(misses),
+        )
+
+    def _late_result(self, fut: Future) -> None:
+        """見切った後に返ってきた結果。成否と応答時間だけ健全性に反映する"""
+        try:
+            pname, value, raised, elapsed = fut.result()
+        except Exception:
+            return
+        if raised:
+            self._record(pname, False, elapsed)
+        elif self.validate(value):
+            self._record(pname, True, elapsed)
+        else:
+            self._record_latency_only(pname, elapsed)
@@ -0,0 +1,159 @@
+"""
+ratios.json の保存形式（v2）と読み込み
+─────────────────────────────────────
+v1 は同じ結果レコードを data / all_data / notification_candidates に最大3回重複して持ち、indent=2 で保存していた。
+v2 では:
+・1行目に小さなサマリー（更新時刻・件数・LEVEL集計など）だけを置く → 本体をパースせずに読める
+・結果は列ごとの配列（カラムナ形式）で1回だけ保存し、各ビューは ticker の並びだけを持つ
+・区切りはコンパクト、列ごとに改行（差分が読める程度に）
+
+{"format":"ratios_v2","summary":{...},
+"columns":["ticker","name",...],
+"records":{"ticker":[...],"name":[...],...},
+"views":{"data":[...],"all_data":[...],"notification_candidates":[...]},
+"missing_universe":[...]}
+
+旧形式の読み手は load_ratios() を使えば v1 と同じ形（ticker→dict の各ビュー）で受け取れる。
+ビュー間で同じ dict を共有するので、v1 を読むよりメモリも小さい。
+path を省略した読み込みは、公開中のスナップショット世代（snapshot_store）の ratios.json を読む。
+"""
+
+from __future__ import annotations
+import os
+from pathlib import Path
+
+import jsonio
+import snapshot_store as ss
+
+# スナップショット世代がない古い配置での置き場所（通常は ratios_path() を使う）
+RATIOS_PATH = Path("data/ratios.json")
+FORMAT_V2 = "ratios_v2"
+_V2_PREFIX = b'{"format":"' + FORMAT_V2.encode() + b'"'
+
+VIEW_KEYS = ("data", "all_data", "notification_candidates")
+SUMMARY_KEYS = (
+    "updated_at",
+    "date",
+    "market_cap_range",
+    "target_universe_size",
+    "notification_candidate_count",
+    "total_count",
+    "all_count",
+    "filtered_count",
+    "level_counts",
+    "run_mode",
+    "disclaimer",
+)
+
+
+def ratios_path(generation: str | None = None) -> Path:
+    """公開中（または指定した）世代の ratios.json"""
+    return ss.path("ratios.json", generation)
+
+
+def _dumps(obj) -> str:
+    return jsonio.dumps_str(obj)
+
+
+# ==========================================
+# 書き込み
+# ==========================================
+def to_v2(output: dict) -> dict:
+    """v1 形式の出力（fetch_data.build_ratios_output の戻り値）を v2 に変換"""
+    records: dict[str, dict] = {}
+    for view in ("all_data", "data", "notification_candidates"):
+        for ticker, rec in (output.get(view) or {}).items():
+            records.setdefault(ticker, rec)
+
+    columns: list[str] = []
+    for rec in records.values():
+        for k in rec:
+            if k not in columns:
+                columns.append(k)
+    table = {col: [rec.get(col) for rec in records.values()] for col in columns}
+
+    summary = {k: output.get(k) for k in SUMMARY_KEYS if k in output}
+    summary["missing_count"] = len(output.get("missing_universe") or [])
+    return {
+        "format": FORMAT_V2,
+        "summary": summary,
+        "columns": columns,
+        "records": table,
+        "views": {view: list((output.get(view) or {}).keys()) for view in VIEW_KEYS},
+        "missing_universe": list(output.get("missing_universe") or []),
+    }
+
+
+def dumps_v2(obj: dict) -> str:
+    """サマリーを1行目に置いた v2 テキスト（1行目だけで read_ratios_summary が読める）"""
+    lines = ['{"format":' + _dumps(obj["format"]) + ',"summary":' + _dumps(obj["summary"]) + ","]
+    lines.append('"columns":' + _dumps(obj["columns"]) + ",")
+    cols = [_dumps(col) + ":" + _dumps(values) for col, values in obj["records"].items()]
+    lines.append('"records":{' + ",\n".join(cols) + "},")
+    lines.append('"views":' + _dumps(obj["views"]) + ",")
+    lines.append('"missing_universe":' + _dumps(obj["missing_universe"]) + "}")
+    return "\n".join(lines) + "\n"
+
+
+def write_ratios(output: dict, path: Path) -> Path:
+    """v1 形式の出力を v2 で保存（一時ファイル→置き換えで、読み手が書きかけを見ないように）"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(dumps_v2(to_v2(output)), encoding="utf-8")
+    os.replace(tmp, path)
+    return path
+
+
+# ==========================================
+# 読み込み
+# ==========================================
+def read_ratios_summary(path: Path | None = None) -> dict:
+    """
+    サマリーだけを読む（v2 は1行目だけ、v1 は全体をパースして同じ項目を返す）。
+    ファイルがなければ空 dict。
+    """
+    path = Path(path) if path else ratios_path()
+    if not path.exists():
+        return {}
+    with open(path, "rb") as f:
+        first = f.readline()
+    if first.startswith(_V2_PREFIX):
+        head = jsonio.loads(first.rstrip().rstrip(b",") + b"}")
+        return head.get("summary") or {}
+    obj = jsonio.read_json(path)
+    summary = {k: obj.get(k) for k in SUMMARY_KEYS if k in obj}
+    summary["missing_count"] = len(obj.get("missing_universe") or [])
+    return summary
+
+
+def from_v2(obj: dict) -> dict:
+    """v2 を v1 と同じ形に戻す（レコード dict はビュー間で共有）"""
+    table = obj.get("records") or {}
+    columns = obj.get("columns") or list(table)
+    tickers = table.get("ticker") or []
+    records: dict[str, dict] = {}
+    for i, ticker in enumerate(tickers):
+        records[ticker] = {col: table[col][i] for col in columns if col in table}
+
+    out = dict(obj.get("summary") or {})
+    out.pop("missing_count", None)
+    views = obj.get("views") or {}
+    for view in VIEW_KEYS:
+        out[view] = {t: records[t] for t in views.get(view, []) if t in records}
+    out["missing_universe"] = list(obj.get("missing_universe") or [])
+    return out
+
+
+def load_ratios(path: Path | None = None) -> dict:
+    """
+    ratios.json を v1 と同じ形（data / all_data / notification_candidates は ticker→dict）で読む互換用。
+    v1 のファイルはそのまま返す。ファイルがなければ空 dict。
+    """
+    path = Path(path) if path else ratios_path()
+    if not path.exists():
+        return {}
+    data = path.read_bytes()
+    if data.startswith(_V2_PREFIX):
+        return from_v2(jsonio.decode_ratios_v2(data))
+    return jsonio.loads(data)
@@ -0,0 +1,222 @@
+"""
+実行入力の録画・再生（オフラインリプレイ）
+─────────────────────────────────────
+・RECORD_BUNDLE_DIR=<dir> で fetch_data.py を実行すると、外部入力
+  （KABU+ CSV / JPX上場一覧 / 銘柄名ページ / Yahoo フォールバック）を1つのバンドルに保存
+・REPLAY_BUNDLE_DIR=<dir> で実行すると同じバンドルから再生し、ネットワークには一切出ない
+  （録画時刻も再生するので、日付計算を含めて結果とタイミングが再現できる）
+・send_notifications.py も再生モードではメール本文を作るだけで、Sheets / SMTP には繋がない
+
+バンドル構成:
+  manifest.json             … 録画時刻など
+  http/<key>.json / .bin    … HTTP GET のステータス・エンコーディングと本文
+  yf/<ticker>.download.csv  … yf.download（MultiIndex を平坦化済み）
+  yf/<ticker>.info.json     … yf.Ticker().info
+"""
+
+from __future__ import annotations
+import hashlib
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlencode
+
+import requests
+
+import jsonio
+
+MANIFEST_NAME = "manifest.json"
+
+
+class ReplayMissError(requests.RequestException):
+    """再生モードでバンドルに該当データがない（＝録画時にも取得していない）"""
+
+
+# ==========================================
+# モード判定
+# ==========================================
+def record_dir() -> Optional[Path]:
+    d = os.environ.get("RECORD_BUNDLE_DIR", "").strip()
+    return Path(d) if d else None
+
+
+def replay_dir() -> Optional[Path]:
+    d = os.environ.get("REPLAY_BUNDLE_DIR", "").strip()
+    return Path(d) if d else None
+
+
+def is_replaying() -> bool:
+    return replay_dir() is not None
+
+
+def _manifest(bundle: Path) -> dict:
+    p = bundle / MANIFEST_NAME
+    if not p.exists():
+        return {}
+    try:
+        return jsonio.read_json(p)
+    except Exception:
+        return {}
+
+
+def _ensure_recording(bundle: Path) -> None:
+    """録画開始時に manifest.json（録画時刻）を1回だけ書く"""
+    p = bundle / MANIFEST_NAME
+    if p.exists():
+        return
+    bundle.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        "format": "replay_bundle_v1",
+        # 録画マシンのローカル時刻（オフセット付き）。naive で使う側はこの壁時計時刻をそのまま再現する
+        "recorded_at": datetime.now().astimezone().isoformat(),
+    }
+    jsonio.write_json(p, manifest, indent=True)
+
+
+def now(tz=None) -> datetime:
+    """
+    現在時刻。録画・再生中はバンドルの録画時刻を返す（KABU+ の日付遡りや updated_at を録画時と一致させる）。
+    tz を省略すると naive datetime（datetime.now() と同じ扱い。再生時は録画マシンの壁時計時刻）。
+    """
+    bundle = replay_dir()
+    if bundle is None:
+        bundle = record_dir()
+        if bundle is not None:
+            _ensure_recording(bundle)
+    recorded = _manifest(bundle).get("recorded_at") if bundle is not None else None
+    if not recorded:
+        return datetime.now(tz) if tz is not None else datetime.now()
+    dt = datetime.fromisoformat(recorded)
+    return dt.astimezone(tz) if tz is not None else dt.replace(tzinfo=None)
+
+
+# ==========================================
+# HTTP
+# ==========================================
+def _http_key(url: str, params: Optional[dict]) -> str:
+    full = url + ("?" + urlencode(sorted(params.items())) if params else "")
+    return hashlib.sha1(full.encode("utf-8")).hexdigest()
+
+
+class _ReplayResponse:
+    """requests.Response の代わりに返す最小限の応答（status_code / content / text / json / raise_for_status）"""
+
+    def __init__(self, url: str, status_code: int, content: bytes, encoding: Optional[str]):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return jsonio.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} (replay) for url: {self.url}")
+
+
+def http_get(url: str, params: Optional[dict] = None, **kwargs):
+    """requests.get の差し替え。録画モードでは応答を保存し、再生モードではバンドルから返す。"""
+    key = _http_key(url, params)
+
+    bundle = replay_dir()
+    if bundle is not None:
+        meta_path = bundle / "http" / f"{key}.json"
+        if not meta_path.exists():
+            raise ReplayMissError(f"not in replay bundle: {url}")
+        meta = jsonio.read_json(meta_path)
+        if meta.get("error"):
+            raise requests.ConnectionError(f"{meta['error']} (replay)")
+        body_path = bundle / "http" / f"{key}.bin"
+        content = body_path.read_bytes() if body_path.exists() else b""
+        return _ReplayResponse(url, int(meta.get("status_code", 200)), content, meta.get("encoding"))
+
+    rec = record_dir()
+    if rec is None:
+        return requests.get(url, params=params, **kwargs)
+
+    _ensure_recording(rec)
+    http_dir = rec / "http"
+    http_dir.mkdir(parents=True, exist_ok=True)
+    meta = {"url": url, "params": params or {}}
+    try:
+        resp = requests.get(url, params=params, **kwargs)
+    except Exception as e:
+        # 通信失敗も「その回の入力」として残し、再生時に同じ失敗を再現する
+        meta["error"] = type(e).__name__
+        jsonio.write_json(http_dir / f"{key}.json", meta, indent=True)
+        raise
+    meta["status_code"] = resp.status_code
+    meta["encoding"] = resp.encoding
+    (http_dir / f"{key}.bin").write_bytes(resp.content)
+    jsonio.write_json(http_dir / f"{key}.json", meta, indent=True)
+    return resp
+
+
+# ==========================================
+# yfinance
+# ==========================================
+def _yf_path(bundle: Path, ticker: str, kind: str, ext: str) -> Path:
+    return bundle / "yf" / f"{ticker}.{kind}.{ext}"
+
+
+def yf_download(ticker: str, **kwargs):
+    """
+    yf.download(tickers=[ticker], ...) の差し替え。列の MultiIndex は平坦化して返す。
+    取得できなかった場合は空の DataFrame（再生時も同じ）。
+    """
+    import pandas as pd
+
+    bundle = replay_dir()
+    if bundle is not None:
+        p = _yf_path(bundle, ticker, "download", "csv")
+        if not p.exists():
+            return pd.DataFrame()
+        df = pd.read_csv(p, index_col=0, parse_dates=True)
+        df.index.name = "Date"
+        return df
+
+    import yfinance as yf
+
+    data = yf.download(tickers=[ticker], **kwargs)
+    if data is not None and isinstance(data.columns, pd.MultiIndex):
+        data.columns = data.columns.get_level_values(0)
+
+    rec = record_dir()
+    if rec is not None:
+        _ensure_recording(rec)
+        p = _yf_path(rec, ticker, "download", "csv")
+        p.parent.mkdir(parents=True, exist_ok=True)
+        (data if data is not None else pd.DataFrame()).to_csv(p)
+    return data
+
+
+def yf_info(ticker: str) -> dict:
+    """yf.Ticker(ticker).info の差し替え"""
+    bundle = replay_dir()
+    if bundle is not None:
+        p = _yf_path(bundle, ticker, "info", "json")
+        if not p.exists():
+            return {}
+        return jsonio.read_json(p)
+
+    import yfinance as yf
+
+    info = yf.Ticker(ticker).info or {}
+
+    rec = record_dir()
+    if rec is not None:
+        _ensure_recording(rec)
+        p = _yf_path(rec, ticker, "info", "json")
+        p.parent.mkdir(parents=True, exist_ok=True)
+        jsonio.write_json(p, info)
+    return info
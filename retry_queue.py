@@ -0,0 +1,116 @@
+"""
+未取得銘柄の再取得キュー（data/retry_queue.json）
+─────────────────────────────────────
+・銘柄ごとに「失敗理由 / 試行回数 / 次に再試行してよい時刻」を保存し、再取得フェーズはこのキューだけを見る
+・その日のうちに取れる見込みがない理由（上場していない・どこにもデータがない・本数不足）は当日中は再試行しない
+・一時的な失敗（通信エラーなど）は指数バックオフ（30分→1時間→2時間…）で再試行し、上限回数で打ち切る
+・時間予算切れで手を付けられなかった銘柄は失敗ではないので、待たずに次のフェーズで処理する
+・当日CSVの「日時」が前営業日のままだった銘柄（stale）は、後のフェーズで当日足だけを継ぎ足して計算し直す
+・キューは日付単位。初回フェーズ（全件スキャン）で作り直し、日付が変わった古いキューは使わない
+
+形式:
+  {"date": "YYYY-MM-DD", "updated_at": "...",
+   "entries": {"1234.T": {"reason": "error", "attempts": 2,
+                          "last_failed_at": "...", "next_eligible_at": "..."}}}
+"""
+
+from __future__ import annotations
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import jsonio
+
+RETRY_QUEUE_PATH = Path("data/retry_queue.json")
+
+# 当日中は再試行しない理由
+REASON_NOT_LISTED = "not_listed"            # KABU+ の当日銘柄一覧になく、yfinance にもない
+REASON_NO_DATA = "no_data"                  # KABU+ 履歴にも yfinance にもデータがない
+REASON_INSUFFICIENT_BARS = "insufficient_bars"  # 本数が足りずスコアを計算できない（当日中は増えない）
+HOPELESS_REASONS = frozenset({REASON_NOT_LISTED, REASON_NO_DATA, REASON_INSUFFICIENT_BARS})
+
+# 再試行する理由
+REASON_ERROR = "error"      # 例外（通信エラー・一時的な欠損など）
+REASON_BUDGET = "budget"    # 時間予算切れで未処理（失敗ではないので待たない・回数に数えない）
+REASON_STALE = "stale"      # 当日CSVの「日時」が前営業日のまま（後のフェーズで当日足だけ継ぎ足す）
+
+BACKOFF_BASE_MIN = 30
+BACKOFF_MAX_MIN = 240
+MAX_ATTEMPTS = 5
+
+
+class RetryQueue:
+    """銘柄→再試行状態。load() で読み、record_* で更新し、save() で書き戻す"""
+
+    def __init__(self, date: str, entries: dict | None = None, path: Path = RETRY_QUEUE_PATH, loaded: bool = False):
+        self.date = date
+        self.entries: dict[str, dict] = dict(entries or {})
+        self.path = Path(path)
+        # 当日分のキューをファイルから読めたか（False なら当日の初回フェーズがまだ走っていない）
+        self.loaded = loaded
+
+    @classmethod
+    def load(cls, date: str, path: Path = RETRY_QUEUE_PATH) -> "RetryQueue":
+        """当日分のキューを読む。ファイルがない・日付が違う場合は空のキュー"""
+        path = Path(path)
+        if path.exists():
+            try:
+                obj = jsonio.read_json(path)
+                if obj.get("date") == date:
+                    return cls(date, obj.get("entries") or {}, path, loaded=True)
+            except Exception as e:
+                print(f"⚠️ retry_queue 読み込み失敗: {e}")
+        return cls(date, {}, path)
+
+    def record_failure(self, ticker: str, reason: str, now: datetime) -> None:
+        prev = self.entries.get(ticker, {})
+        attempts = int(prev.get("attempts", 0))
+        if reason == REASON_BUDGET:
+            next_eligible = now
+        else:
+            attempts += 1
+            wait_min = min(BACKOFF_MAX_MIN, BACKOFF_BASE_MIN * 2 ** (attempts - 1))
+            next_eligible = now + timedelta(minutes=wait_min)
+        self.entries[ticker] = {
+            "reason": reason,
+            "attempts": attempts,
+            "last_failed_at": now.isoformat(timespec="seconds"),
+            "next_eligible_at": next_eligible.isoformat(timespec="seconds"),
+        }
+
+    def record_success(self, ticker: str) -> None:
+        self.entries.pop(ticker, None)
+
+    def is_hopeless(self, ticker: str) -> bool:
+        entry = self.entries.get(ticker) or {}
+        return entry.get("reason") in HOPELESS_REASONS or int(entry.get("attempts", 0)) >= MAX_ATTEMPTS
+
+    def eligible(self, now: datetime) -> list[str]:
+        """今の時点で再試行してよい銘柄（見込みなし・上限到達・バックオフ待ちを除く）"""
+        out = []
+        for ticker, entry in self.entries.items():
+            if self.is_hopeless(ticker):
+                continue
+            try:
+                next_eligible = datetime.fromisoformat(entry.get("next_eligible_at") or "")
+            except ValueError:
+                next_eligible = now
+            if next_eligible <= now:
+                out.append(ticker)
+        return sorted(out)
+
+    def summary(self) -> dict:
+        """理由ごとの件数"""
+        counts: dict[str, int] = {}
+        for entry in self.entries.values():
+            reason = entry.get("reason", "")
+            counts[reason] = counts.get(reason, 0) + 1
+        return dict(sorted(counts.items()))
+
+    def save(self, updated_at: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        obj = {
+            "date": self.date,
+            "updated_at": updated_at,
+            "entries": dict(sorted(self.entries.items())),
+        }
+        jsonio.write_json(self.path, obj, indent=True)
@@ -11,14 +11,15 @@ import json
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from pathlib import Path
-from datetime import datetime
 import pytz
 
 import gspread
 from google.oauth2.service_account import Credentials
 from cryptography.fernet import Fernet
 
+import ratios_store as rs
+import replay_bundle as rb
+
 JST = pytz.timezone("Asia/Tokyo")
 
 # 通知対象条件（安全側のデフォルト）
@@ -100,11 +101,7 @@ def load_all_users() -> list:
 # データ読み込み
 # ==========================================
 def load_data() -> dict:
-    p = Path("data/ratios.json")
-    if not p.exists():
-        return {}
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return rs.load_ratios()
 
 
 def select_notify_items(data: dict) -> list[dict]:
@@ -127,7 +124,7 @@ def create_email(data: dict, items: list[dict]) -> tuple[str, str] | tuple[None,
         return None, None
 
     updated_at = data.get("updated_at", "不明")
-    date_str = updated_at[:10] if isinstance(updated_at, str) else datetime.now(JST).strftime("%Y-%m-%d")
+    date_str = updated_at[:10] if isinstance(updated_at, str) else rb.now(JST).strftime("%Y-%m-%d")
 
     subject = f"🦅 ハゲタカSCOPE 候補通知: {len(items)}件 - {date_str}"
 
@@ -231,6 +228,12 @@ def main():
         print("📭 通知対象がないため、メール送信は行いません。")
         return
 
+    if rb.is_replaying():
+        # 再生モード: 本文の生成までを再現し、Sheets / SMTP には接続しない
+        print(f"🎞️ 再生モードのため送信しません（件名: {subject}）")
+        print(body)
+        return
+
     users = load_all_users()
     if not users:
         print("⚠️ ユーザーが取得できないため、送信をスキップします。")
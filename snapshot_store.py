@@ -0,0 +1,143 @@
+"""
+日次データのスナップショット（世代）管理
+─────────────────────────────────────
+ratios.json / missing_universe.json / history/shard_XX.json は1回の実行でまとめて作られる1組のデータ。
+1ファイルずつ上書きすると、読み手（app.py やコミット途中のチェックアウト）が新旧の混ざった組を見ることがあるため、
+世代ごとのディレクトリに書いてから、ポインタ（data/CURRENT）の置き換え1回で公開する。
+
+data/
+  CURRENT                         … 公開中の世代ID（1行）。os.replace で一度に切り替える
+  snapshots/
+    20261016-163000/              … 世代ID = 実行時刻（JST）
+      meta.json                   … {"generation", "updated_at", "files"}（最後に書く = 完成の目印）
+      ratios.json
+      missing_universe.json
+      history/shard_00..63.json, history/meta.json
+    .staging-20261017-163000/     … 作成中（公開時に世代ディレクトリへ rename）
+
+・読み手は path("ratios.json") のように現在の世代のパスを引く。CURRENT がない古い配置では data/ 直下を返す
+・app.py は current_generation() をキャッシュのキーに含め、新しい世代が公開された時点で読み直す
+・古い世代は KEEP_GENERATIONS 個を残して削除する（読み途中の読み手のために直前の世代は残す）
+"""
+
+from __future__ import annotations
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import jsonio
+
+DATA_DIR = Path("data")
+SNAPSHOTS_DIR = DATA_DIR / "snapshots"
+CURRENT_PATH = DATA_DIR / "CURRENT"
+KEEP_GENERATIONS = 2
+_STAGING_PREFIX = ".staging-"
+
+
+def generation_id(updated_at: str) -> str:
+    """実行時刻（YYYY-MM-DD HH:MM:SS）から世代IDを作る"""
+    return datetime.strptime(updated_at, "%Y-%m-%d %H:%M:%S").strftime("%Y%m%d-%H%M%S")
+
+
+def _is_complete(gen_dir: Path) -> bool:
+    return (gen_dir / "meta.json").exists()
+
+
+def list_generations() -> list[str]:
+    """完成済みの世代（古い順）"""
+    if not SNAPSHOTS_DIR.exists():
+        return []
+    return sorted(
+        p.name for p in SNAPSHOTS_DIR.iterdir()
+        if p.is_dir() and not p.name.startswith(".") and _is_complete(p)
+    )
+
+
+def current_generation() -> str | None:
+    """
+    公開中の世代ID。CURRENT の指す世代が（チェックアウト途中などで）未完成なら、完成済みの最新世代。
+    どちらもなければ None（data/ 直下の古い配置）。
+    """
+    try:
+        gen = CURRENT_PATH.read_text(encoding="utf-8").strip()
+    except OSError:
+        gen = ""
+    if gen and _is_complete(SNAPSHOTS_DIR / gen):
+        return gen
+    generations = list_generations()
+    return generations[-1] if generations else None
+
+
+def current_dir(generation: str | None = None) -> Path:
+    """世代のディレクトリ（generation 省略時は公開中の世代、世代がなければ data/）"""
+    gen = generation or current_generation()
+    return SNAPSHOTS_DIR / gen if gen else DATA_DIR
+
+
+def path(name: str, generation: str | None = None) -> Path:
+    """スナップショット内のファイルのパス（例: path("ratios.json"), path("history")）"""
+    return current_dir(generation) / name
+
+
+def read_meta(generation: str | None = None) -> dict:
+    p = path("meta.json", generation)
+    if not p.exists():
+        return {}
+    try:
+        return jsonio.read_json(p)
+    except Exception:
+        return {}
+
+
+class SnapshotBuilder:
+    """
+    新しい世代を作って公開する。
+      builder = SnapshotBuilder(updated_at)
+      ... builder.dir 配下に書く ...
+      builder.publish()   # meta.json → rename → CURRENT 置き換え → 古い世代の削除
+    """
+
+    def __init__(self, updated_at: str):
+        self.updated_at = updated_at
+        self.generation = generation_id(updated_at)
+        self.base_generation = current_generation()
+        SNAPSHOTS_DIR.mkdir(parents=True, exist_ok=True)
+        # 前回の実行が公開前に落ちた残骸を片付ける
+        for stale in SNAPSHOTS_DIR.glob(_STAGING_PREFIX + "*"):
+            shutil.rmtree(stale, ignore_errors=True)
+        self.dir = SNAPSHOTS_DIR / f"{_STAGING_PREFIX}{self.generation}"
+        self.dir.mkdir(parents=True)
+
+    def publish(self) -> Path:
+        files = sorted(str(p.relative_to(self.dir)) for p in self.dir.rglob("*") if p.is_file())
+        meta = {"generation": self.generation, "updated_at": self.updated_at, "files": files}
+        jsonio.write_json(self.dir / "meta.json", meta, indent=True)
+
+        final = SNAPSHOTS_DIR / self.generation
+        if final.exists():
+            shutil.rmtree(final)
+        os.replace(self.dir, final)
+
+        tmp = CURRENT_PATH.with_name(CURRENT_PATH.name + ".tmp")
+        tmp.write_text(self.generation + "\n", encoding="utf-8")
+        os.replace(tmp, CURRENT_PATH)
+        self.dir = final
+        prune()
+        return final
+
+    def abort(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def prune(keep: int = KEEP_GENERATIONS) -> list[str]:
+    """公開中の世代を含めて新しい keep 個を残し、それより古い世代を削除する"""
+    current = current_generation()
+    generations = list_generations()
+    keep_set = set(generations[-keep:]) | ({current} if current else set())
+    removed = []
+    for gen in generations:
+        if gen not in keep_set:
+            shutil.rmtree(SNAPSHOTS_DIR / gen, ignore_errors=True)
+            removed.append(gen)
+    return removed
@@ -0,0 +1,213 @@
+"""
+下値ライン・高出来高ゾーンの一括計算（全銘柄をまとめて NumPy で）
+─────────────────────────────────────
+fetch_data.py の compute_support_from_recent_growth / compute_support_zone_from_profile / support_position_tag と同じ定義を、
+銘柄ごとの iterrows ではなく (銘柄, 価格帯, 足) の3次元配列で一度に計算する。
+
+・対象は直近 SUPPORT_WINDOW 本（約6か月）の足。価格帯は安値の最小〜高値の最大を SUPPORT_BINS 等分
+・各足の出来高は、足の値幅と価格帯の重なりの割合で按分（高値＝安値の足は重なった帯にそのまま）
+・下値ライン: 直近1/3で出来高が最も伸びた「安値寄りの帯」の下限。なければ高出来高ゾーン（POC 周辺）の下限
+・ゾーン上限: 高出来高ゾーン（POC から出来高が最大の 60% 以上の帯が続く範囲）の上限
+
+  batch = SupportBatch()
+  batch.add(ticker, df)          # 銘柄ごと（直近の足だけ控える）
+  zones = batch.compute()        # {ticker: {"support_price", "support_zone_upper", "support_position", "support_gap_pct"}}
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+SUPPORT_WINDOW = 125
+SUPPORT_BINS = 24
+ZONE_THRESHOLD_RATIO = 0.60
+RECENT_RATIO = 0.33
+LOW_BAND_RATIO = 0.35
+LOWER_TAG_MAX_PCT = 5.0
+UPPER_TAG_MIN_PCT = 20.0
+TAG_LOWER = "下側ゾーン"
+TAG_UPPER = "上側ゾーン"
+
+# 3次元配列が大きくなりすぎないよう、この銘柄数ずつ計算する
+_CHUNK = 512
+
+
+def volume_profiles(low: np.ndarray, high: np.ndarray, volume: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+    (銘柄, 足) の安値・高値・出来高と (銘柄, 帯+1) の境界から、足ごとの按分出来高 (銘柄, 帯, 足) を返す。
+    埋め草の足は出来高 0・有限の価格にしておくこと（按分しても 0 になる）。
+    """
+    lo = low[:, None, :]
+    hi = high[:, None, :]
+    bl = edges[:, :-1, None]
+    bh = edges[:, 1:, None]
+    span = high - low
+    flat = span <= 0
+    # 高値＝安値の足は重なり 0 / 値幅 1 ではなく 1 / 1 にして、重なった帯にそのまま入れる
+    contrib = np.minimum(hi, bh)
+    contrib -= np.maximum(lo, bl)
+    contrib += flat[:, None, :]
+    contrib /= np.where(flat, 1.0, span)[:, None, :]
+    contrib *= volume[:, None, :]
+    contrib *= (lo <= bh) & (hi >= bl)
+    return contrib
+
+
+def _profile_edges(low: np.ndarray, high: np.ndarray, bins: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """np.linspace(min, max, bins + 1) を銘柄ごとに（戻り値: edges, pmin, pmax）"""
+    pmin = np.nanmin(low, axis=1)
+    pmax = np.nanmax(high, axis=1)
+    step = (pmax - pmin) / bins
+    edges = np.arange(bins + 1)[None, :] * step[:, None] + pmin[:, None]
+    edges[:, -1] = pmax
+    return edges, pmin, pmax
+
+
+def _zone_from_profile(vp: np.ndarray, edges: np.ndarray, threshold_ratio: float):
+    """compute_support_zone_from_profile の一括版（戻り値: support, upper。求まらない銘柄は NaN）"""
+    n, bins = vp.shape
+    max_vol = vp.max(axis=1)
+    poc = vp.argmax(axis=1)
+    idx = np.arange(bins)[None, :]
+    below = vp < (max_vol * threshold_ratio)[:, None]
+    left = np.where(below & (idx < poc[:, None]), idx, -1).max(axis=1) + 1
+    right = np.where(below & (idx > poc[:, None]), idx, bins).min(axis=1) - 1
+    rows = np.arange(n)
+    support = edges[rows, left]
+    upper = edges[rows, right + 1]
+    ok = max_vol > 0
+    return np.where(ok, support, np.nan), np.where(ok, upper, np.nan)
+
+
+def _support_from_growth(contrib: np.ndarray, edges: np.ndarray, pmin, pmax, counts: np.ndarray,
+                         recent_ratio: float, low_band_ratio: float):
+    """compute_support_from_recent_growth の一括版（戻り値: 帯の下限。求まらない銘柄は NaN）"""
+    n, bins, width = contrib.shape
+    recent_len = np.maximum(20, (counts * recent_ratio).astype(np.int64))
+    ok = (counts >= 40) & (counts >= recent_len * 2)
+
+    # 右寄せなので、直近 / その前の区間は末尾からのスライスで切り出せる（区間長の種類ごとにまとめて）
+    growth = np.zeros((n, bins))
+    for r in np.unique(recent_len[ok]).tolist():
+        rows = np.flatnonzero(ok & (recent_len == r))
+        sub = contrib[rows]
+        growth[rows] = sub[:, :, width - r:].sum(axis=2) - sub[:, :, width - 2 * r:width - r].sum(axis=2)
+
+    low_limit = pmin + (pmax - pmin) * low_band_ratio
+    cand = edges[:, 1:] <= low_limit[:, None]
+    masked = np.where(cand, growth, -np.inf)
+    best = masked.argmax(axis=1)
+    best_growth = masked[np.arange(n), best]
+    ok &= cand.any(axis=1) & (best_growth > 0)
+    return np.where(ok, edges[np.arange(n), best], np.nan)
+
+
+def position_tags(latest: np.ndarray, support: np.ndarray):
+    """support_position_tag の一括版（戻り値: タグの配列（None あり）, 乖離率％（NaN あり））"""
+    valid = np.isfinite(support) & (support > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        gap = np.where(valid, (latest / support - 1.0) * 100.0, np.nan)
+    tags = np.full(len(gap), None, dtype=object)
+    tags[valid & (gap <= LOWER_TAG_MAX_PCT)] = TAG_LOWER
+    tags[valid & (gap >= UPPER_TAG_MIN_PCT)] = TAG_UPPER
+    return tags, gap
+
+
+def compute_support_zones(
+    low: np.ndarray,
+    high: np.ndarray,
+    volume: np.ndarray,
+    latest: np.ndarray,
+    counts: np.ndarray,
+    bins: int = SUPPORT_BINS,
+) -> dict[str, np.ndarray]:
+    """
+    右寄せ・NaN 埋めの (銘柄, 足) 配列から、銘柄ごとの下値ライン・ゾーン上限・位置タグ・乖離率を返す。
+    counts は銘柄ごとの有効な足の本数。
+    """
+    n = low.shape[0]
+    out = {
+        "support_price": np.full(n, np.nan),
+        "support_zone_upper": np.full(n, np.nan),
+        "support_position": np.full(n, None, dtype=object),
+        "support_gap_pct": np.full(n, np.nan),
+    }
+    for s in range(0, n, _CHUNK):
+        e = min(s + _CHUNK, n)
+        edges, pmin, pmax = _profile_edges(low[s:e], high[s:e], bins)
+        usable = np.isfinite(pmin) & np.isfinite(pmax) & (pmax > pmin)
+        # 埋め草（NaN）の足は出来高 0・価格は最安値にして、按分結果が 0 になるようにする
+        pad = np.isnan(low[s:e]) | np.isnan(high[s:e])
+        fill = np.where(np.isfinite(pmin), pmin, 0.0)[:, None]
+        lo = np.where(pad, fill, low[s:e])
+        hi = np.where(pad, fill, high[s:e])
+        vol = np.where(pad, 0.0, np.nan_to_num(volume[s:e], nan=0.0))
+        contrib = volume_profiles(lo, hi, vol, edges)
+        zone_support, zone_upper = _zone_from_profile(contrib.sum(axis=2), edges, ZONE_THRESHOLD_RATIO)
+        growth_support = _support_from_growth(contrib, edges, pmin, pmax, counts[s:e], RECENT_RATIO, LOW_BAND_RATIO)
+        support = np.where(np.isfinite(growth_support), growth_support, zone_support)
+        support = np.where(usable, support, np.nan)
+        upper = np.where(usable, zone_upper, np.nan)
+        tags, gap = position_tags(latest[s:e], support)
+        out["support_price"][s:e] = support
+        out["support_zone_upper"][s:e] = upper
+        out["support_position"][s:e] = tags
+        out["support_gap_pct"][s:e] = gap
+    return out
+
+
+class SupportBatch:
+    """銘柄ごとのループで直近の足を控えておき、最後に全銘柄ぶんをまとめて計算する"""
+
+    def __init__(self, window: int = SUPPORT_WINDOW):
+        self.window = window
+        self.tickers: list[str] = []
+        self._low: list[np.ndarray] = []
+        self._high: list[np.ndarray] = []
+        self._volume: list[np.ndarray] = []
+        self._latest: list[float] = []
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def add(self, ticker: str, df: pd.DataFrame) -> None:
+        """Low/High/Volume/Close 列を持つ日足（古い順）。控えるのは直近 window 本のコピーだけ"""
+        if df.empty:
+            return
+        w = self.window
+        self.tickers.append(ticker)
+        self._low.append(df["Low"].to_numpy(dtype=float)[-w:].copy())
+        self._high.append(df["High"].to_numpy(dtype=float)[-w:].copy())
+        self._volume.append(df["Volume"].to_numpy(dtype=float)[-w:].copy())
+        self._latest.append(float(df["Close"].to_numpy(dtype=float)[-1]))
+
+    def _panel(self, arrays: list[np.ndarray]) -> np.ndarray:
+        out = np.full((len(arrays), self.window), np.nan)
+        for i, a in enumerate(arrays):
+            if len(a):
+                out[i, -len(a):] = a
+        return out
+
+    def compute(self) -> dict[str, dict]:
+        """{ticker: {"support_price", "support_zone_upper", "support_position", "support_gap_pct"}}（値は丸め済み・求まらなければ None）"""
+        if not self.tickers:
+            return {}
+        counts = np.array([len(a) for a in self._low], dtype=np.int64)
+        z = compute_support_zones(
+            self._panel(self._low),
+            self._panel(self._high),
+            self._panel(self._volume),
+            np.array(self._latest, dtype=float),
+            counts,
+        )
+        out: dict[str, dict] = {}
+        for i, ticker in enumerate(self.tickers):
+            sp, up, gap = z["support_price"][i], z["support_zone_upper"][i], z["support_gap_pct"][i]
+            out[ticker] = {
+                "support_price": round(float(sp), 1) if np.isfinite(sp) else None,
+                "support_zone_upper": round(float(up), 1) if np.isfinite(up) else None,
+                "support_position": z["support_position"][i],
+                "support_gap_pct": round(float(gap), 2) if np.isfinite(gap) else None,
+            }
+        return out